@@ -0,0 +1,145 @@
+"""
+Brokers de difusión para ConnectionManager.
+
+- InProcessBroker (por defecto): entrega directa a los sockets de este proceso.
+- RedisBroker: pub/sub en Redis con un canal por usuario (chat:user:{id}), para
+  que un mensaje llegue aunque el destinatario esté conectado a otro worker
+  o a otro contenedor.
+
+Se elige con WS_BROKER=memory|redis y REDIS_URL.
+
+Si se cae la conexión con Redis, RedisBroker reintenta con espera exponencial
+(hasta REDIS_RETRY_MAX_SECONDS) y al reconectar vuelve a suscribir el canal de
+control y los de todos los usuarios conectados a este proceso. Lo publicado
+mientras tanto se pierde: pub/sub no guarda mensajes.
+"""
+import asyncio
+import os
+from typing import Callable
+
+from loguru import logger
+
+WS_BROKER = os.getenv("WS_BROKER", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_RETRY_MAX_SECONDS = float(os.getenv("REDIS_RETRY_MAX_SECONDS", "30"))
+
+Deliver = Callable[[int, str], None]
+
+
+class InProcessBroker:
+    def __init__(self):
+        self.deliver: Deliver | None = None
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def publish(self, user_ids: list[int], text: str):
+        for uid in user_ids:
+            self.deliver(uid, text)
+
+    async def subscribe(self, user_id: int):
+        pass
+
+    async def unsubscribe(self, user_id: int):
+        pass
+
+
+class RedisBroker(InProcessBroker):
+    CHANNEL_PREFIX = "chat:user:"
+    # Canal de control: redis-py no permite escuchar un PubSub sin suscripciones
+    CONTROL_CHANNEL = "chat:control"
+
+    def __init__(self, url: str = REDIS_URL, client=None, retry_max: float = REDIS_RETRY_MAX_SECONDS):
+        super().__init__()
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.retry_max = retry_max
+        self.pubsub = None
+        self.reader: asyncio.Task | None = None
+        # Usuarios suscritos en este proceso, para rehacer las suscripciones al reconectar
+        self.users: set[int] = set()
+        # Métricas
+        self.reconnects = 0
+
+    @classmethod
+    def channel(cls, user_id: int) -> str:
+        return f"{cls.CHANNEL_PREFIX}{user_id}"
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        await self._subscribe_all()
+        self.reader = asyncio.create_task(self._read())
+
+    async def _subscribe_all(self):
+        """PubSub nuevo con el canal de control y los canales de self.users."""
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.CONTROL_CHANNEL, *(self.channel(uid) for uid in self.users))
+
+    async def stop(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.pubsub:
+            await self.pubsub.aclose()
+        await self.redis.aclose()
+
+    async def _read(self):
+        delay = 0.5
+        while True:
+            try:
+                async for msg in self.pubsub.listen():
+                    delay = 0.5
+                    if msg["type"] != "message" or not msg["channel"].startswith(self.CHANNEL_PREFIX):
+                        continue
+                    self.deliver(int(msg["channel"][len(self.CHANNEL_PREFIX):]), msg["data"])
+                # listen() termina si el PubSub se quedó sin suscripciones: se reconecta igual
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Se perdió la suscripción a Redis; reintentando en {:.1f}s", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
+            try:
+                await self.pubsub.aclose()
+            except Exception:
+                pass
+            try:
+                await self._subscribe_all()
+                self.reconnects += 1
+                logger.info("Suscripción a Redis restablecida ({} usuarios)", len(self.users))
+            except Exception:
+                logger.warning("Redis sigue sin responder")
+
+    async def publish(self, user_ids: list[int], text: str):
+        # Un solo round trip aunque el mensaje vaya a un grupo grande
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for uid in user_ids:
+                pipe.publish(self.channel(uid), text)
+            await pipe.execute()
+
+    async def subscribe(self, user_id: int):
+        self.users.add(user_id)
+        try:
+            await self.pubsub.subscribe(self.channel(user_id))
+        except Exception:
+            # El socket sigue abierto: _read lo suscribe cuando vuelva Redis
+            logger.warning("No se pudo suscribir a {}; se reintenta al reconectar", self.channel(user_id))
+
+    async def unsubscribe(self, user_id: int):
+        self.users.discard(user_id)
+        try:
+            await self.pubsub.unsubscribe(self.channel(user_id))
+        except Exception:
+            logger.warning("No se pudo desuscribir de {}", self.channel(user_id))
+
+
+def create_broker(kind: str = WS_BROKER) -> InProcessBroker:
+    if kind == "memory":
+        return InProcessBroker()
+    if kind == "redis":
+        return RedisBroker()
+    raise ValueError(f"WS_BROKER desconocido: {kind}")
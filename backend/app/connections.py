@@ -0,0 +1,155 @@
+"""
+Sockets abiertos de este proceso y difusión de eventos a usuarios.
+
+Cada conexión tiene su cola de salida acotada y su tarea escritora; la
+entrega entre procesos la resuelve el broker (memoria o Redis).
+"""
+import asyncio
+import json
+import os
+import time
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from app.broker import InProcessBroker, create_broker
+from app.metrics import WS_FANOUT_SECONDS
+
+# Mensajes pendientes por socket antes de considerarlo un consumidor lento
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Qué hacer con un consumidor lento: "drop" descarta el mensaje, "disconnect" cierra el socket
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop")
+
+
+class Connection:
+    """Un socket con su cola de salida acotada, drenada por su propia tarea escritora."""
+
+    def __init__(self, ws: WebSocket, user_id: int, maxsize: int):
+        self.ws = ws
+        self.user_id = user_id
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=maxsize)
+        self.writer: asyncio.Task | None = None
+
+    def start(self, on_dead):
+        self.writer = asyncio.create_task(self._drain(on_dead))
+
+    async def _drain(self, on_dead):
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket muerto: se da de baja sin afectar al resto de destinatarios
+            on_dead(self)
+
+    def stop(self):
+        if self.writer and not self.writer.done():
+            self.writer.cancel()
+
+    async def close(self, code: int):
+        self.stop()
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY,
+        broker: InProcessBroker | None = None
+    ):
+        if slow_consumer_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Política de consumidor lento inválida: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.broker = broker or InProcessBroker()
+        self.active: dict[int, list[Connection]] = {}
+        self.dropped = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.broker.start(self.deliver)
+
+    async def stop(self):
+        # Apagado: se cancelan las tareas escritoras y se cierran los sockets con 1001 (going away)
+        conns = [conn for user_conns in self.active.values() for conn in user_conns]
+        self.active.clear()
+        await asyncio.gather(*(conn.close(code=1001) for conn in conns))
+        for task in list(self._tasks):
+            task.cancel()
+        await self.broker.stop()
+
+    async def connect(self, ws: WebSocket, user_id: int):
+        await ws.accept()
+        conn = Connection(ws, user_id, self.queue_size)
+        conn.start(self._remove)
+        first = user_id not in self.active
+        self.active.setdefault(user_id, []).append(conn)
+        if first:
+            await self.broker.subscribe(user_id)
+        return conn
+
+    def disconnect(self, ws: WebSocket, user_id: int):
+        for conn in self.active.get(user_id, []):
+            if conn.ws is ws:
+                self._remove(conn)
+                break
+
+    def _remove(self, conn: Connection):
+        conns = self.active.get(conn.user_id, [])
+        if conn in conns:
+            conns.remove(conn)
+            if not conns:
+                del self.active[conn.user_id]
+                self._spawn(self._unsubscribe_if_idle(conn.user_id))
+        conn.stop()
+
+    async def _unsubscribe_if_idle(self, user_id: int):
+        # El usuario pudo reconectarse antes de que corriera esta tarea
+        if user_id not in self.active:
+            await self.broker.unsubscribe(user_id)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def send(self, user_ids: list[int], message: dict):
+        start = time.perf_counter()
+        # Se codifica una sola vez por difusión; cada socket recibe el mismo texto
+        text = json.dumps(jsonable_encoder(message))
+        await self.broker.publish(user_ids, text)
+        WS_FANOUT_SECONDS.observe(time.perf_counter() - start)
+
+    def send_to(self, conn: Connection, message: dict):
+        """Respuesta directa a un solo socket (ack, error), sin pasar por el broker."""
+        self._enqueue(conn, json.dumps(jsonable_encoder(message)))
+
+    def deliver(self, user_id: int, text: str):
+        """Encola `text` en los sockets de `user_id` conectados a este proceso."""
+        for conn in list(self.active.get(user_id, [])):
+            self._enqueue(conn, text)
+
+    def _enqueue(self, conn: Connection, text: str):
+        try:
+            conn.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.slow_consumer_policy == "disconnect":
+                self._remove(conn)
+                self._spawn(conn.close(code=1013))
+
+    def stats(self) -> dict:
+        conns = [conn for user_conns in self.active.values() for conn in user_conns]
+        return {
+            "users": len(self.active),
+            "sockets": len(conns),
+            "queued_sends": sum(conn.queue.qsize() for conn in conns),
+            "dropped": self.dropped,
+        }
+
+manager = ConnectionManager(broker=create_broker())
@@ -1,7 +1,34 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+"""
+Engines de SQLAlchemy (psycopg2 y asyncpg) con el mismo perfil de pool:
+
+- DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT: conexiones fijas, extra
+  temporales y segundos de espera por una conexión antes de fallar.
+- DB_POOL_RECYCLE: segundos tras los que una conexión se reemplaza (evita
+  las que cortan un balanceador o un firewall por inactividad).
+- DB_POOL_PRE_PING=1: SELECT 1 al sacar una conexión del pool; si el servidor
+  se reinició se descarta en lugar de fallar la petición.
+- DB_STATEMENT_TIMEOUT_MS: statement_timeout de cada sesión (0 lo desactiva).
+- DB_PGBOUNCER=1: delante hay un PgBouncer en modo transaction. asyncpg no
+  cachea sentencias preparadas (cada una tiene nombre único) y no se mandan
+  parámetros de arranque que PgBouncer rechaza: el statement_timeout se
+  configura entonces en el rol (ALTER ROLE ... SET statement_timeout).
+- SQL_ECHO=1: cada sentencia se registra con loguru (DEBUG) junto con su
+  duración en ms; apagado no hay ningún listener en el camino de las consultas.
+
+PoolMetrics lleva la espera por conexión (checkout), las conexiones en uso y
+cuántas veces hubo que abrir una conexión de overflow o se agotó la espera.
+"""
+import bisect
 import os
+import time
+import uuid
+
 from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 load_dotenv()
 
@@ -11,14 +38,168 @@ PGDATABASE = os.getenv("PGDATABASE")
 PGUSER = os.getenv("PGUSER")
 PGPASSWORD = os.getenv("PGPASSWORD")
 
-DATABASE_URL = f"postgresql://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
+DATABASE_URL = f"postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+# Límites (segundos) del histograma de espera por conexión
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.max_checkout_seconds = 0.0
+        # Conteo por bucket de CHECKOUT_BUCKETS; el último es lo que pasa del mayor límite
+        self.checkout_buckets = [0] * (len(CHECKOUT_BUCKETS) + 1)
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def observe(self, seconds: float):
+        self.checkouts += 1
+        self.checkout_seconds += seconds
+        self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+        self.checkout_buckets[bisect.bisect_left(CHECKOUT_BUCKETS, seconds)] += 1
+
+    def pool_class(self, base: type) -> type:
+        """
+        Subclase de `base` que mide cada checkout. Las métricas quedan en la
+        clase para sobrevivir a engine.dispose(), que recrea el pool.
+        """
+        metrics = self
+
+        class MeteredPool(base):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                except exc.TimeoutError:
+                    metrics.timeouts += 1
+                    raise
+                finally:
+                    metrics.observe(time.perf_counter() - start)
+
+            def _create_connection(self):
+                # overflow() > 0: la conexión nueva excede pool_size
+                if self.overflow() > 0:
+                    metrics.overflow_events += 1
+                return super()._create_connection()
+
+        MeteredPool.__name__ = f"Metered{base.__name__}"
+        return MeteredPool
+
+    def percentile(self, q: float) -> float:
+        """Cota superior (segundos) del bucket donde cae el percentil q de las esperas."""
+        if not self.checkouts:
+            return 0.0
+        target = q * self.checkouts
+        seen = 0
+        for limit, count in zip(CHECKOUT_BUCKETS, self.checkout_buckets):
+            seen += count
+            if seen >= target:
+                return min(limit, self.max_checkout_seconds)
+        return self.max_checkout_seconds
+
+    def stats(self) -> dict:
+        pool = self.engine.pool if self.engine is not None else None
+        return {
+            "pool_size": pool.size() if pool else 0,
+            "in_use": pool.checkedout() if pool else 0,
+            "idle": pool.checkedin() if pool else 0,
+            "overflow": max(pool.overflow(), 0) if pool else 0,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "checkouts": self.checkouts,
+            "avg_checkout_ms": self.checkout_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+            "p95_checkout_ms": self.percentile(0.95) * 1000,
+            "max_checkout_ms": self.max_checkout_seconds * 1000,
+        }
+
+
+def _pool_options(metrics: PoolMetrics, base: type) -> dict:
+    return dict(
+        poolclass=metrics.pool_class(base),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+def _sync_connect_args() -> dict:
+    if DB_PGBOUNCER or not DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+
+def _async_connect_args() -> dict:
+    if DB_PGBOUNCER:
+        # En modo transaction dos sentencias seguidas pueden ir a servidores distintos
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    if not DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+
+
+def _log_sql(sync_engine, name: str):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["sql_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        ms = (time.perf_counter() - conn.info["sql_start"]) * 1000
+        # Los campos van también en extra para un sink estructurado (logger.add(..., serialize=True))
+        logger.bind(engine=name, sql=statement, params=parameters, ms=round(ms, 2)).debug(
+            "SQL {} {:.2f}ms: {}", name, ms, statement
+        )
+
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
 
 # Engine sincrónico
-engine = create_engine(DATABASE_URL, echo=True, future=True)
+engine = create_engine(
+    DATABASE_URL, connect_args=_sync_connect_args(), **_pool_options(sync_pool_metrics, QueuePool)
+)
+sync_pool_metrics.engine = engine
 
 # SessionLocal para dependencias
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Engine asíncrono (asyncpg): no ocupa un hilo del threadpool mientras espera a Postgres
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, connect_args=_async_connect_args(),
+    **_pool_options(async_pool_metrics, AsyncAdaptedQueuePool)
+)
+async_pool_metrics.engine = async_engine.sync_engine
+
+if SQL_ECHO:
+    _log_sql(engine, "sync")
+    _log_sql(async_engine.sync_engine, "async")
+
+# expire_on_commit=False: tras el commit los atributos siguen cargados y
+# se pueden serializar sin disparar lazy loads fuera del event loop
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 # Dependencia sincrónica
@@ -27,4 +208,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependencia asíncrona
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
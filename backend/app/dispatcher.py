@@ -0,0 +1,63 @@
+"""
+Despachador de difusión fuera de la petición.
+
+create_message solo encola el mensaje ya guardado; una tarea del event loop
+resuelve los destinatarios (miembros del grupo, vía membership_cache) y publica por WebSocket, de
+modo que la respuesta HTTP no espera ni a esa consulta ni al fan-out.
+"""
+import asyncio
+
+from loguru import logger
+
+from app.database import AsyncSessionLocal
+from app.membership import membership_cache
+from app.connections import manager
+
+
+class Dispatcher:
+    def __init__(self, maxsize: int = 10_000, workers: int = 4, drain_timeout: float = 10.0):
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=maxsize)
+        self.n_workers = workers
+        self.drain_timeout = drain_timeout
+        self.workers: list[asyncio.Task] = []
+
+    async def start(self):
+        self.workers = [asyncio.create_task(self._run()) for _ in range(self.n_workers)]
+
+    async def stop(self):
+        # Entregar lo pendiente antes de cerrar, sin que un socket colgado bloquee el apagado
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Se cierra con {} difusiones pendientes", self.queue.qsize())
+        for w in self.workers:
+            w.cancel()
+
+    def submit(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # El mensaje ya está guardado; el cliente lo verá al recargar el historial
+            logger.warning("Cola de difusión llena, se omite el push del mensaje {}", message.get("id"))
+
+    async def _run(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await manager.send(await self._targets(message), {"type": "message", **message})
+            except Exception:
+                logger.exception("Fallo al difundir el mensaje {}", message.get("id"))
+            finally:
+                self.queue.task_done()
+
+    async def _targets(self, message: dict) -> list[int]:
+        if message.get("receptor_id"):
+            return [message["receptor_id"]]
+        if message.get("grupo_id"):
+            # todos los miembros del grupo
+            async with AsyncSessionLocal() as db:
+                return await membership_cache.member_ids(db, message["grupo_id"])
+        return []
+
+
+dispatcher = Dispatcher()
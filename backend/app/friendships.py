@@ -0,0 +1,40 @@
+"""
+Consultas sobre el grafo de amistades.
+
+La amistad se guarda en un solo sentido (quien envía -> quien recibe), así que
+"mis amigos" son los amigo_id de lo que envié más los usuario_id de lo que
+recibí. Cada mitad del UNION sale de su índice (usuario_id, estado) /
+(amigo_id, estado) sin recorrer la tabla. Es UNION y no UNION ALL: si quedaron
+solicitudes aceptadas en ambos sentidos (datos anteriores a que POST /friends/
+rechazara el par inverso) el amigo aparece una sola vez.
+"""
+from typing import Iterable
+
+from sqlalchemy import select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+
+def friend_ids(user_id: int, candidates: Iterable[int] | None = None):
+    """Subconsulta (columna friend_id) con los amigos aceptados de user_id, opcionalmente limitada a `candidates`."""
+    sent = select(models.Amistad.amigo_id.label("friend_id")).filter(
+        models.Amistad.usuario_id == user_id, models.Amistad.estado == "accepted"
+    )
+    received = select(models.Amistad.usuario_id.label("friend_id")).filter(
+        models.Amistad.amigo_id == user_id, models.Amistad.estado == "accepted"
+    )
+    if candidates is not None:
+        candidates = list(candidates)
+        sent = sent.filter(models.Amistad.amigo_id.in_(candidates))
+        received = received.filter(models.Amistad.usuario_id.in_(candidates))
+    return union(sent, received).subquery()
+
+
+async def accepted_friend_ids(db: AsyncSession, user_id: int, candidates: Iterable[int]) -> set[int]:
+    """Cuáles de `candidates` son amigos aceptados de user_id, en una sola consulta."""
+    candidates = set(candidates)
+    if not candidates:
+        return set()
+    ids = friend_ids(user_id, candidates)
+    return set((await db.scalars(select(ids.c.friend_id))).all())
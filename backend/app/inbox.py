@@ -0,0 +1,131 @@
+"""
+Lectura de conversaciones.
+
+conversacion_estado lo alimenta el trigger de mensaje en cada envío; aquí solo
+se mueve el punto de lectura. mark_read marca todo hasta un mensaje en una
+sola pasada (en lugar de un UPDATE por mensaje) y recalcula no_leidos contando
+únicamente lo que queda después de ese mensaje, que sale del índice de la
+conversación sin recorrer el historial. Los tramos llevan cotas explícitas
+sobre fecha_envio (la del mensaje) para que Postgres solo toque las
+particiones de ese lado.
+
+estado_lectura (solo chats directos) no se ata al punto de lectura: responder
+lo adelanta en el trigger sin tocar las filas del otro, así que se marcan
+todas las aún no leídas hasta el mensaje, que salen del índice parcial
+idx_mensaje_directo_no_leido. Si el usuario no tiene fila en
+conversacion_estado (p. ej. entró al grupo después del último envío), se crea.
+"""
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, case, func, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.membership import membership_cache
+
+
+def _after(mensaje_id: int, fecha_envio: datetime):
+    """
+    Condición (fecha_envio, id) > la del mensaje ancla, resuelta por los índices
+    *_fecha; la cota suelta sobre fecha_envio es la que poda particiones.
+    """
+    m = models.Mensaje
+    anchor = tuple_(literal(fecha_envio, m.fecha_envio.type), literal(mensaje_id))
+    return and_(m.fecha_envio >= fecha_envio, tuple_(m.fecha_envio, m.id) > anchor)
+
+
+def _latest(*sides):
+    """Id del último mensaje de la conversación: uno por lado, cada uno sale ordenado de su índice *_fecha."""
+    m = models.Mensaje
+    return func.greatest(*(
+        select(m.id).filter(side).order_by(m.fecha_envio.desc(), m.id.desc()).limit(1).scalar_subquery()
+        for side in sides
+    ))
+
+
+async def mark_read(db: AsyncSession, user_id: int, mensaje_id: int) -> dict:
+    """
+    Marca como leída la conversación de `mensaje_id` hasta ese mensaje para user_id.
+    Devuelve {peer_id, grupo_id, ultimo_leido_id, no_leidos}; no hace commit.
+    """
+    msg = (await db.execute(
+        select(models.Mensaje.emisor_id, models.Mensaje.receptor_id, models.Mensaje.grupo_id,
+               models.Mensaje.fecha_envio)
+            .filter(models.Mensaje.id == mensaje_id)
+    )).first()
+    if msg is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
+
+    ce = models.ConversacionEstado
+    if msg.grupo_id is not None:
+        if user_id not in await membership_cache.member_ids(db, msg.grupo_id):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No perteneces a este grupo")
+        peer_id, grupo_id = None, msg.grupo_id
+        conversation = ce.grupo_id == grupo_id
+        pending = (models.Mensaje.grupo_id == grupo_id) & (models.Mensaje.emisor_id != user_id)
+        sides = (models.Mensaje.grupo_id == grupo_id,)
+    elif user_id in (msg.emisor_id, msg.receptor_id):
+        peer_id = msg.receptor_id if msg.emisor_id == user_id else msg.emisor_id
+        grupo_id = None
+        conversation = ce.peer_id == peer_id
+        pending = (models.Mensaje.emisor_id == peer_id) & (models.Mensaje.receptor_id == user_id)
+        sides = (pending, (models.Mensaje.emisor_id == user_id) & (models.Mensaje.receptor_id == peer_id))
+    else:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="El mensaje no es de tus conversaciones")
+
+    row = (await db.execute(
+        select(ce.ultimo_leido_id).filter(ce.usuario_id == user_id, conversation)
+    )).first()
+    if row is None:
+        # Sin fila todavía: se crea sin nada leído y el UPDATE de abajo la completa
+        await db.execute(
+            insert(ce)
+                .values(usuario_id=user_id, peer_id=peer_id, grupo_id=grupo_id,
+                        ultimo_mensaje_id=_latest(*sides), ultimo_leido_id=0, no_leidos=0)
+                .on_conflict_do_nothing()
+        )
+        previous = 0
+    else:
+        previous = row.ultimo_leido_id
+
+    if peer_id is not None:
+        # estado_lectura por fila solo tiene sentido en chats directos; se marca de una
+        # vez todo lo no leído hasta mensaje_id, aunque el punto de lectura ya lo pasara
+        await db.execute(
+            update(models.Mensaje).filter(
+                pending,
+                models.Mensaje.id <= mensaje_id,
+                models.Mensaje.fecha_envio <= msg.fecha_envio,
+                models.Mensaje.estado_lectura != "leído",
+            ).values(estado_lectura="leído").execution_options(synchronize_session=False)
+        )
+
+    if previous < mensaje_id:
+        remaining = (
+            select(func.count())
+                .select_from(models.Mensaje)
+                .filter(pending, _after(mensaje_id, msg.fecha_envio))
+                .scalar_subquery()
+        )
+        await db.execute(
+            update(ce)
+                .filter(ce.usuario_id == user_id, conversation)
+                .values(
+                    ultimo_leido_id=mensaje_id,
+                    # Lo habitual es leer hasta el último mensaje: no hace falta contar nada
+                    no_leidos=case((ce.ultimo_mensaje_id <= mensaje_id, 0), else_=remaining),
+                )
+                .execution_options(synchronize_session=False)
+        )
+
+    state = (await db.execute(
+        select(ce.ultimo_leido_id, ce.no_leidos).filter(ce.usuario_id == user_id, conversation)
+    )).first()
+    return {
+        "peer_id": peer_id,
+        "grupo_id": grupo_id,
+        "ultimo_leido_id": state.ultimo_leido_id,
+        "no_leidos": state.no_leidos,
+    }
@@ -1,7 +1,18 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.database import engine, Base
+from app.database import engine, async_engine, Base, sync_pool_metrics, async_pool_metrics
 from app.routers import users, friends, groups, messages, content, ws
 from app.routers import auth
+from app.connections import manager
+from app.dispatcher import dispatcher
+from app.writer import writer
+from app.security import hasher, check_keys
+from app.storage import storage
+from app.thumbnails import thumbnailer
+from app.partitions import partition_maintainer
+from app.membership import membership_cache
+from app.response_cache import response_cache
+from app import metrics
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -11,7 +22,27 @@ Ejecutar ubicado en backend/:
 uvicorn app.main:app --reload
 """
 
-app = FastAPI(title="Messaging API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool de bcrypt y tareas de fondo (particiones, broker de WebSocket, despachador,
+    # escritor por lotes, miniaturas)
+    check_keys()
+    await partition_maintainer.start()
+    hasher.start()
+    await storage.start()
+    await manager.start()
+    await dispatcher.start()
+    await writer.start()
+    await thumbnailer.start()
+    yield
+    await thumbnailer.stop()
+    await writer.stop()
+    await dispatcher.stop()
+    await manager.stop()
+    hasher.stop()
+    await partition_maintainer.stop()
+
+app = FastAPI(title="Messaging API", lifespan=lifespan)
 origins = [
     #TODO conectar con el frontend. El front no envia al back. El error esta en el frontend
     "http://localhost:3000",
@@ -23,6 +54,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Sin esto el navegador no deja leer las cabeceras de paginación de /users/search
+    expose_headers=["X-Next-Cursor", "X-Search-Truncated"],
 )
 
 
@@ -34,3 +67,18 @@ app.include_router(groups.router, prefix="/groups", tags=["groups"])
 app.include_router(messages.router, prefix="/messages", tags=["messages"])
 app.include_router(content.router, prefix="/content", tags=["content"])
 app.include_router(ws.router, prefix="/ws", tags=["websocket"])
+
+# GET /metrics: latencia por ruta, SQL por petición, sockets, pool y cachés
+metrics.instrument(
+    app,
+    engines=[engine, async_engine.sync_engine],
+    components={
+        "ws": manager,
+        "writer": writer,
+        "membership_cache": membership_cache,
+        "response_cache": response_cache,
+        "user_search_cache": users.user_search_cache,
+        "partitions": partition_maintainer,
+    },
+    pools={"sync": sync_pool_metrics, "async": async_pool_metrics},
+)
@@ -0,0 +1,164 @@
+"""
+Caché de membresía de grupos.
+
+- miembros por grupo_id (fan-out de mensajes y GET /groups/{id}/members)
+- grupos por usuario_id (GET /groups/?user_id=)
+
+Lo invalidan las rutas de escritura de groups.py. Por defecto vive en memoria
+del proceso con expulsión LRU y MEMBERSHIP_CACHE_TTL; con varios workers usar
+MEMBERSHIP_CACHE=redis para que la invalidación de un worker la vean todos (en
+memoria, los demás workers la ven recién cuando vence el TTL).
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.broker import REDIS_URL
+
+MEMBERSHIP_CACHE = os.getenv("MEMBERSHIP_CACHE", "memory")
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+MEMBERSHIP_CACHE_TTL = int(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+
+
+class LRUStore:
+    """Store en memoria: expulsión LRU por tamaño y vencimiento a los `ttl` segundos."""
+
+    def __init__(self, maxsize: int = MEMBERSHIP_CACHE_SIZE, ttl: int = MEMBERSHIP_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[str, tuple[float, list]] = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.data[key]
+            self.evictions += 1
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: list):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class RedisStore:
+    def __init__(self, url: str = REDIS_URL, ttl: int = MEMBERSHIP_CACHE_TTL, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.ttl = ttl
+        self.evictions = 0  # la expulsión la hace Redis (TTL / maxmemory-policy)
+
+    async def get(self, key: str):
+        raw = await self.redis.get(key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: list):
+        await self.redis.set(key, json.dumps(value), ex=self.ttl)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.redis.delete(*keys)
+
+
+class MembershipCache:
+    def __init__(self, store=None):
+        self.store = store or LRUStore()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _group_key(grupo_id: int) -> str:
+        return f"membership:group:{grupo_id}"
+
+    @staticmethod
+    def _user_key(usuario_id: int) -> str:
+        return f"membership:user:{usuario_id}"
+
+    async def _cached(self, key: str, load):
+        value = await self.store.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await load()
+        await self.store.set(key, value)
+        return value
+
+    async def group_members(self, db: AsyncSession, grupo_id: int) -> list[dict]:
+        """[{usuario_id, role}] de los miembros del grupo."""
+        async def load():
+            rows = await db.execute(
+                select(models.Pertenece.usuario_id, models.Pertenece.role).filter_by(grupo_id=grupo_id)
+            )
+            return [{"usuario_id": uid, "role": role} for uid, role in rows]
+        return await self._cached(self._group_key(grupo_id), load)
+
+    async def member_ids(self, db: AsyncSession, grupo_id: int) -> list[int]:
+        return [m["usuario_id"] for m in await self.group_members(db, grupo_id)]
+
+    async def user_groups(self, db: AsyncSession, usuario_id: int) -> list[dict]:
+        """Grupos (campos de GrupoOut) a los que pertenece el usuario."""
+        async def load():
+            grupos = await db.scalars(
+                select(models.Grupo)
+                    .join(models.Pertenece)
+                    .filter(models.Pertenece.usuario_id == usuario_id)
+            )
+            return [
+                jsonable_encoder({
+                    "id": g.id,
+                    "nombre": g.nombre,
+                    "creador_id": g.creador_id,
+                    "fecha_creacion": g.fecha_creacion,
+                    "imagen_url": g.imagen_url,
+                    "invite_token": g.invite_token,
+                })
+                for g in grupos
+            ]
+        return await self._cached(self._user_key(usuario_id), load)
+
+    async def invalidate(self, grupo_id: int | None = None, usuario_ids=()):
+        keys = [self._user_key(uid) for uid in usuario_ids]
+        if grupo_id is not None:
+            keys.append(self._group_key(grupo_id))
+        await self.store.delete(*keys)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.store.evictions,
+        }
+
+
+def create_membership_cache(kind: str = MEMBERSHIP_CACHE) -> MembershipCache:
+    if kind == "memory":
+        return MembershipCache(LRUStore())
+    if kind == "redis":
+        return MembershipCache(RedisStore())
+    raise ValueError(f"MEMBERSHIP_CACHE desconocido: {kind}")
+
+
+membership_cache = create_membership_cache()
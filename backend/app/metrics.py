@@ -0,0 +1,197 @@
+"""
+Métricas Prometheus del proceso, expuestas en GET /metrics.
+
+- http_request_duration_seconds{method,route,status}: latencia por ruta; la
+  etiqueta es la plantilla de la ruta (/messages/{id}), no la URL concreta.
+- http_request_db_queries / http_request_db_seconds {route}: cuántas
+  sentencias SQL corrió cada petición y cuánto tiempo pasó en ellas. Se miden
+  con listeners de cursor en los engines; la petición en curso viaja en un
+  ContextVar, así que lo que corre en tareas de fondo (writer, miniaturas) no
+  se atribuye a ninguna.
+- ws_fanout_seconds: lo que tarda ConnectionManager.send en codificar y
+  publicar un evento (con el broker en memoria incluye encolarlo en cada socket).
+- db_pool_*{engine}: conexiones en uso, libres y de overflow, esperas
+  agotadas e histograma de espera por conexión (app.database.PoolMetrics).
+- chatat_<componente>_<campo>: los stats() de los sockets (ConnectionManager),
+  el writer y las cachés, leídos en cada scrape.
+
+Con METRICS_SLOW_REQUEST_MS > 0 las peticiones más lentas que ese umbral se
+registran (WARNING) con las sentencias que ejecutaron y su duración.
+
+Con varios workers de uvicorn cada proceso tiene sus propias métricas.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily
+from sqlalchemy import event
+from starlette.responses import Response
+
+from app.database import CHECKOUT_BUCKETS
+
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))
+# Sentencias que se guardan por petición para el log de peticiones lentas
+METRICS_SLOW_MAX_STATEMENTS = int(os.getenv("METRICS_SLOW_MAX_STATEMENTS", "50"))
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ["method", "route", "status"]
+)
+HTTP_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Sentencias SQL por petición", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+HTTP_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Tiempo en SQL por petición", ["route"]
+)
+WS_FANOUT_SECONDS = Histogram(
+    "ws_fanout_seconds", "Codificación y publicación de un evento de WebSocket",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "seconds", "statements")
+
+    def __init__(self, keep_statements: bool):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: list[tuple[str, float]] | None = [] if keep_statements else None
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        if self.statements is not None and len(self.statements) < METRICS_SLOW_MAX_STATEMENTS:
+            self.statements.append((statement, seconds))
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def instrument_engine(sync_engine):
+    """Cuenta y cronometra las sentencias de `sync_engine` (para async: async_engine.sync_engine)."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if current_request.get() is not None:
+            conn.info["metrics_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("metrics_start", None)
+        stats = current_request.get()
+        if stats is not None and start is not None:
+            stats.record(statement, time.perf_counter() - start)
+
+
+def route_label(scope) -> str:
+    """
+    Plantilla de la ruta resuelta (/messages/{mensaje_id}) para usar como
+    etiqueta, tomada de scope["route"].path_format: los valores de los
+    parámetros nunca llegan a la etiqueta aunque coincidan con un tramo literal
+    o entre sí. Con routers incluidos la plantilla no lleva el prefijo del
+    router, que son los tramos de la URL anteriores a los que cubre la plantilla
+    (ningún parámetro de la app acepta "/").
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if "endpoint" not in scope or path_format is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    prefix = segments[:len(segments) - len(path_format.split("/")) + 1]
+    return "/".join(prefix) + path_format
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: no envuelve la respuesta, así que no afecta a streaming ni a FileResponse."""
+
+    def __init__(self, app, slow_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(keep_statements=self.slow_ms > 0)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            label = route_label(scope)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], label, str(status_code)).observe(elapsed)
+            HTTP_DB_QUERIES.labels(label).observe(stats.queries)
+            HTTP_DB_SECONDS.labels(label).observe(stats.seconds)
+            if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+                self._log_slow(scope, status_code, elapsed, stats)
+
+    @staticmethod
+    def _log_slow(scope, status_code: int, elapsed: float, stats: RequestStats):
+        sql = "\n".join(f"  {s * 1000:8.2f}ms  {statement}" for statement, s in stats.statements)
+        logger.bind(path=scope["path"], status=status_code, ms=round(elapsed * 1000, 2), queries=stats.queries).warning(
+            "Petición lenta {} {} -> {} en {:.1f}ms, {} sentencias SQL ({:.1f}ms):\n{}",
+            scope["method"], scope["path"], status_code, elapsed * 1000, stats.queries, stats.seconds * 1000, sql
+        )
+
+
+class StatsCollector:
+    """Exporta como gauges los stats() de los componentes en cada scrape."""
+
+    def __init__(self, components: dict[str, object], pools: dict[str, object]):
+        self.components = components
+        self.pools = pools
+
+    def collect(self):
+        for name, component in self.components.items():
+            for key, value in component.stats().items():
+                yield GaugeMetricFamily(f"chatat_{name}_{key}", f"{name}.stats()['{key}']", value=value)
+
+        in_use = GaugeMetricFamily("db_pool_connections_in_use", "Conexiones prestadas", labels=["engine"])
+        idle = GaugeMetricFamily("db_pool_connections_idle", "Conexiones libres en el pool", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Conexiones por encima de pool_size", labels=["engine"])
+        overflow_events = GaugeMetricFamily(
+            "db_pool_overflow_events", "Conexiones de overflow abiertas desde el arranque", labels=["engine"]
+        )
+        timeouts = GaugeMetricFamily("db_pool_timeouts", "Esperas por conexión agotadas", labels=["engine"])
+        checkout = HistogramMetricFamily(
+            "db_pool_checkout_seconds", "Espera por una conexión del pool", labels=["engine"]
+        )
+        for name, metrics in self.pools.items():
+            stats = metrics.stats()
+            in_use.add_metric([name], stats["in_use"])
+            idle.add_metric([name], stats["idle"])
+            overflow.add_metric([name], stats["overflow"])
+            overflow_events.add_metric([name], stats["overflow_events"])
+            timeouts.add_metric([name], stats["timeouts"])
+            cumulative, buckets = 0, []
+            for limit, count in zip(CHECKOUT_BUCKETS, metrics.checkout_buckets):
+                cumulative += count
+                buckets.append((str(limit), cumulative))
+            buckets.append(("+Inf", metrics.checkouts))
+            checkout.add_metric([name], buckets, metrics.checkout_seconds)
+        yield from (in_use, idle, overflow, overflow_events, timeouts, checkout)
+
+
+def instrument(app, engines: list, components: dict[str, object], pools: dict[str, object]):
+    """Middleware, listeners de los engines, collector y la ruta GET /metrics."""
+    for sync_engine in engines:
+        instrument_engine(sync_engine)
+    REGISTRY.register(StatsCollector(components, pools))
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1 +1 @@
-from .core import Usuario, Amistad, Grupo, Pertenece, Mensaje, Contenido, TipoContenido, TipoArchivo
\ No newline at end of file
+from .core import Usuario, Amistad, Grupo, Pertenece, Mensaje, Reaccion, ReaccionConteo, Contenido, ConversacionEstado, TipoContenido, TipoArchivo
\ No newline at end of file
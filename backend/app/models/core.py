@@ -1,7 +1,8 @@
 import uuid
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP
-from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, ForeignKeyConstraint, TIMESTAMP, Index, Computed, UniqueConstraint
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.sql import func, text
+from sqlalchemy.orm import relationship, deferred
 from app.database import Base
 
 class Usuario(Base):
@@ -13,6 +14,12 @@ class Usuario(Base):
     fecha_registro = Column(TIMESTAMP(timezone=True), server_default=func.now())
     image_url = Column(Text)
     contrasena_hash = Column(String(128), nullable=False)
+    # Documento de /users/search; lo calcula Postgres y no se carga salvo que se pida
+    busqueda = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', nombre || ' ' || apellido), 'A') || "
+        "setweight(to_tsvector('simple', email || ' ' || regexp_replace(email, '[^[:alnum:]]+', ' ', 'g')), 'B')",
+        persisted=True
+    )))
 
     # Solicitudes de amistad que este usuario ha enviado
     amistades_enviadas = relationship(
@@ -41,6 +48,10 @@ class Usuario(Base):
         foreign_keys='Mensaje.receptor_id'
     )
 
+    __table_args__ = (
+        Index('idx_usuario_busqueda', 'busqueda', postgresql_using='gin'),
+    )
+
 class Amistad(Base):
     __tablename__ = 'amistad'
     usuario_id = Column(Integer, ForeignKey('usuario.id', ondelete='CASCADE'), primary_key=True)
@@ -60,6 +71,12 @@ class Amistad(Base):
         back_populates='amistades_recibidas'
     )
 
+    __table_args__ = (
+        # Amigos por estado en ambos sentidos de la relación
+        Index('idx_amistad_usuario_estado', 'usuario_id', 'estado'),
+        Index('idx_amistad_amigo_estado', 'amigo_id', 'estado'),
+    )
+
 class Grupo(Base):
     __tablename__ = 'grupo'
     id = Column(Integer, primary_key=True, index=True)
@@ -83,46 +100,121 @@ class Pertenece(Base):
     usuario = relationship('Usuario', back_populates='grupos')
 
 class Mensaje(Base):
+    """
+    Particionada por mes de fecha_envio (crear_particiones / archivar_particiones
+    en init.sql, app/partitions.py). La PK de la tabla es (id, fecha_envio)
+    porque debe incluir la columna de partición, pero id sigue siendo único
+    (una sola secuencia): el mapper identifica por id y db.get(Mensaje, id) sirve.
+    """
     __tablename__ = 'mensaje'
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     emisor_id = Column(Integer, ForeignKey('usuario.id', ondelete='SET NULL'))
     receptor_id = Column(Integer, ForeignKey('usuario.id', ondelete='SET NULL'))
     grupo_id = Column(Integer, ForeignKey('grupo.id', ondelete='CASCADE'), nullable=True)
-    fecha_envio = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # timestamptz como en init.sql: se serializa con su zona, y al ser del mismo tipo que
+    # la columna (clave de partición y de la FK de contenido) se compara sin conversiones
+    fecha_envio = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, server_default=func.now())
     estado_envio = Column(String(20), default='enviado')
     estado_lectura = Column(String(20), default='no_leído')
-    reply_to_id    = Column(Integer, ForeignKey('mensaje.id', ondelete='SET NULL'), nullable=True)
+    # Sin FK: apuntar a mensaje exigiría también su fecha_envio, y el citado puede estar archivado
+    reply_to_id    = Column(Integer, nullable=True)
     
     # Relaciones
     emisor    = relationship('Usuario', foreign_keys=[emisor_id])
     receptor  = relationship('Usuario', foreign_keys=[receptor_id])
     grupo     = relationship('Grupo')
-    reply_to  = relationship('Mensaje', remote_side=[id])
-    reacciones = relationship('Reaccion', back_populates='mensaje', cascade='all, delete')
+    reply_to  = relationship('Mensaje', primaryjoin='foreign(Mensaje.reply_to_id) == remote(Mensaje.id)', viewonly=True)
+    reacciones = relationship('Reaccion', back_populates='mensaje', cascade='all, delete',
+                              primaryjoin='Mensaje.id == foreign(Reaccion.mensaje_id)')
     contenidos = relationship('Contenido', back_populates='mensaje', cascade='all, delete')
 
+    __mapper_args__ = {'primary_key': [id]}
+    __table_args__ = (
+        # Historial paginado por cursor (fecha_envio, id)
+        Index('idx_mensaje_grupo_fecha', 'grupo_id', 'fecha_envio', 'id'),
+        Index('idx_mensaje_chat_fecha', 'emisor_id', 'receptor_id', 'fecha_envio', 'id'),
+        # Mensajes recibidos por usuario (búsqueda en su historial)
+        Index('idx_mensaje_receptor_fecha', 'receptor_id', 'fecha_envio', 'id'),
+        # Mensajes directos aún no leídos (mark_read)
+        Index('idx_mensaje_directo_no_leido', 'receptor_id', 'emisor_id', 'fecha_envio',
+              postgresql_where=text("estado_lectura <> 'leído' AND receptor_id IS NOT NULL")),
+        {'postgresql_partition_by': 'RANGE (fecha_envio)'},
+    )
+
 class Reaccion(Base):
     __tablename__ = 'reaccion'
     id          = Column(Integer, primary_key=True, index=True)
-    mensaje_id  = Column(Integer, ForeignKey('mensaje.id', ondelete='CASCADE'))
+    # Sin FK hacia mensaje (particionada); archivar_particiones mueve las reacciones con su mensaje
+    mensaje_id  = Column(Integer)
     usuario_id  = Column(Integer, ForeignKey('usuario.id', ondelete='CASCADE'))
     tipo        = Column(String(50), nullable=False)
     fecha       = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
-    mensaje = relationship('Mensaje', back_populates='reacciones')
+    mensaje = relationship('Mensaje', back_populates='reacciones',
+                           primaryjoin='foreign(Reaccion.mensaje_id) == Mensaje.id')
     usuario = relationship('Usuario')
 
+    __table_args__ = (
+        # Una reacción de cada tipo por usuario y mensaje; también sirve las búsquedas por mensaje
+        UniqueConstraint('mensaje_id', 'usuario_id', 'tipo'),
+    )
+
+class ReaccionConteo(Base):
+    """Total de reacciones por (mensaje, tipo); lo mantiene trg_reaccion_conteo (init.sql)."""
+    __tablename__ = 'reaccion_conteo'
+    mensaje_id = Column(Integer, primary_key=True)
+    tipo = Column(String(50), primary_key=True)
+    total = Column(Integer, nullable=False)
+
 class Contenido(Base):
+    """Particionada como mensaje: fecha_envio es la del mensaje y la FK es (mensaje_id, fecha_envio)."""
     __tablename__ = 'contenido'
-    id = Column(Integer, primary_key=True, index=True)
-    mensaje_id = Column(Integer, ForeignKey('mensaje.id', ondelete='CASCADE'))
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    mensaje_id = Column(Integer)
+    fecha_envio = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False)
     tipo_contenido = Column(String(20), nullable=False)
-    tipo_archivo = Column(String(20))
+    tipo_archivo = Column(String(100))
     texto = Column(Text)
     archivo_url = Column(Text)
+    archivo_hash = Column(String(64))       # sha256: clave del archivo en app.storage
+    archivo_tamano = Column(BigInteger)
+    # Vista previa (app/thumbnails.py): pendiente -> procesando -> lista | error
+    miniatura_estado = Column(String(20))
+    miniatura_hash = Column(String(64))
+    miniatura_url = Column(Text)
+    miniatura_reclamada = Column(TIMESTAMP)  # cuándo pasó a 'procesando'
+    # Documento de /messages/search con lexemas de alcance; lo mantiene el trigger
+    # trg_contenido_busqueda (ver init.sql) y no se carga salvo que se pida
+    texto_busqueda = deferred(Column(TSVECTOR))
     
     mensaje = relationship('Mensaje', back_populates='contenidos')
 
+    __mapper_args__ = {'primary_key': [id]}
+    __table_args__ = (
+        ForeignKeyConstraint(['mensaje_id', 'fecha_envio'], ['mensaje.id', 'mensaje.fecha_envio'], ondelete='CASCADE'),
+        Index('idx_contenido_mensaje', 'mensaje_id'),
+        Index('idx_contenido_busqueda', 'texto_busqueda', postgresql_using='gin'),
+        Index('idx_contenido_miniatura_cola', 'id',
+              postgresql_where=text("miniatura_estado IN ('pendiente', 'procesando')")),
+        {'postgresql_partition_by': 'RANGE (fecha_envio)'},
+    )
+
+class ConversacionEstado(Base):
+    """Último mensaje y lectura de cada conversación por usuario; lo mantiene trg_conversacion_estado_envio."""
+    __tablename__ = 'conversacion_estado'
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey('usuario.id', ondelete='CASCADE'), nullable=False)
+    peer_id = Column(Integer, ForeignKey('usuario.id', ondelete='CASCADE'))     # chat directo
+    grupo_id = Column(Integer, ForeignKey('grupo.id', ondelete='CASCADE'))      # grupo
+    ultimo_mensaje_id = Column(Integer, nullable=False)
+    ultimo_leido_id = Column(Integer, nullable=False, default=0)
+    no_leidos = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('usuario_id', 'peer_id', 'grupo_id', postgresql_nulls_not_distinct=True),
+        Index('idx_conversacion_usuario_ultimo', 'usuario_id', ultimo_mensaje_id.desc()),
+    )
+
 class TipoContenido(Base):
     __tablename__ = 'tipocontenido'
     id = Column(String(10), primary_key=True)
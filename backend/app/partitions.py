@@ -0,0 +1,90 @@
+"""
+Mantenimiento de las particiones mensuales de mensaje y contenido.
+
+Al arrancar y luego cada PARTITION_CHECK_HOURS:
+
+- crear_particiones: deja creadas las particiones del mes en curso y de los
+  PARTITION_MONTHS_AHEAD siguientes. No hay partición DEFAULT, así que un
+  INSERT con fecha de un mes sin partición fallaría: el margen cubre semanas
+  sin que ningún proceso esté arriba.
+- archivar_particiones (solo con ARCHIVE_AFTER_MONTHS > 0): los meses más
+  viejos que ese número se separan de las tablas y pasan al esquema archivo
+  con sus reacciones. Desde ahí ya no aparecen en el historial, la bandeja ni
+  la búsqueda; se consultan a mano o se respaldan y se eliminan.
+
+Los meses son en UTC, como los límites de las particiones. Ambas funciones
+viven en init.sql y toman un advisory lock, así que varios workers pueden
+correr el ciclo a la vez; también sirven desde cron o pg_cron.
+"""
+import asyncio
+import os
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_CHECK_HOURS = float(os.getenv("PARTITION_CHECK_HOURS", "24"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "0"))
+
+CREATE_SQL = text("""
+    SELECT crear_particiones(CAST(now() AT TIME ZONE 'UTC' AS date),
+                             CAST((now() AT TIME ZONE 'UTC') + make_interval(months => :ahead) AS date))
+""")
+# Primer día del mes más antiguo que se conserva: se archiva lo anterior
+ARCHIVE_SQL = text("""
+    SELECT archivar_particiones(CAST(date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => :months) AS date))
+""")
+
+
+class PartitionMaintainer:
+    def __init__(self, months_ahead: int = PARTITION_MONTHS_AHEAD, archive_after: int = ARCHIVE_AFTER_MONTHS,
+                 interval_hours: float = PARTITION_CHECK_HOURS):
+        self.months_ahead = months_ahead
+        self.archive_after = archive_after
+        self.interval = interval_hours * 3600
+        self.task: asyncio.Task | None = None
+        # Métricas
+        self.created = 0
+        self.archived = 0
+        self.failures = 0
+
+    async def start(self):
+        # La primera pasada antes de aceptar peticiones: el mes en curso tiene que existir
+        await self.run_once()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run_once(self):
+        try:
+            async with AsyncSessionLocal() as db:
+                created = await db.scalar(CREATE_SQL, {"ahead": self.months_ahead})
+                archived = []
+                if self.archive_after > 0:
+                    archived = (await db.execute(ARCHIVE_SQL, {"months": self.archive_after})).scalars().all()
+                await db.commit()
+        except Exception:
+            self.failures += 1
+            logger.exception("No se pudieron mantener las particiones de mensaje")
+            return
+        self.created += created
+        self.archived += len(archived)
+        if created:
+            logger.info("Particiones creadas: {}", created)
+        if archived:
+            logger.info("Meses archivados en el esquema archivo: {}", ", ".join(archived))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+    def stats(self) -> dict:
+        return {"created": self.created, "archived": self.archived, "failures": self.failures}
+
+
+partition_maintainer = PartitionMaintainer()
@@ -0,0 +1,97 @@
+"""
+Reacciones a mensajes.
+
+reaccion tiene una fila por (mensaje, usuario, tipo) (UNIQUE), así que poner
+una reacción dos veces no hace nada. reaccion_conteo lleva el total por
+(mensaje, tipo) y lo mantiene trg_reaccion_conteo (init.sql) en la misma
+transacción que la reacción: los listados leen esos totales en lugar de
+agregar filas de reaccion, así un mensaje con miles de reacciones devuelve una
+fila por tipo. Cada cambio se difunde por WebSocket como un delta:
+
+  {"type": "reaction", "mensaje_id": n, "usuario_id": n, "tipo": "...",
+   "accion": "add" | "remove", "total": n}
+
+`total` es el conteo de ese tipo tras el cambio: el cliente lo puede asignar
+tal cual en lugar de sumar, y un delta repetido o perdido no lo desajusta.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import delete, false, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.connections import manager
+from app.membership import membership_cache
+
+
+async def participants(db: AsyncSession, user_id: int, mensaje_id: int) -> list[int]:
+    """Usuarios que ven el mensaje; 404 si no existe y 403 si user_id no es uno de ellos."""
+    msg = (await db.execute(
+        select(models.Mensaje.emisor_id, models.Mensaje.receptor_id, models.Mensaje.grupo_id)
+            .filter(models.Mensaje.id == mensaje_id)
+    )).first()
+    if msg is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
+    if msg.grupo_id is not None:
+        targets = list(await membership_cache.member_ids(db, msg.grupo_id))
+    else:
+        targets = [uid for uid in (msg.emisor_id, msg.receptor_id) if uid]
+    if user_id not in targets:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="El mensaje no es de tus conversaciones")
+    return targets
+
+
+async def reaction_counts(db: AsyncSession, mensaje_ids: list[int], user_id: int | None = None) -> dict[int, list[dict]]:
+    """
+    {mensaje_id: [{tipo, total, mia}]} de toda una página en una consulta sobre
+    reaccion_conteo; `mia` (si user_id reaccionó con ese tipo) sale del índice
+    único de reaccion. Sin user_id, mia es siempre False.
+    """
+    if not mensaje_ids:
+        return {}
+    rc, r = models.ReaccionConteo, models.Reaccion
+    if user_id is None:
+        stmt = select(rc.mensaje_id, rc.tipo, rc.total, false())
+    else:
+        stmt = select(rc.mensaje_id, rc.tipo, rc.total, r.id.isnot(None)).outerjoin(
+            r, (r.mensaje_id == rc.mensaje_id) & (r.tipo == rc.tipo) & (r.usuario_id == user_id)
+        )
+    rows = await db.execute(
+        stmt.filter(rc.mensaje_id.in_(mensaje_ids)).order_by(rc.mensaje_id, rc.total.desc(), rc.tipo)
+    )
+    counts: dict[int, list[dict]] = {}
+    for mensaje_id, tipo, total, mia in rows:
+        counts.setdefault(mensaje_id, []).append({"tipo": tipo, "total": total, "mia": mia})
+    return counts
+
+
+async def react(db: AsyncSession, user_id: int, mensaje_id: int, tipo: str, add: bool) -> tuple[dict, list[int]]:
+    """
+    Pone (add=True) o quita la reacción `tipo` de user_id. Devuelve el resumen
+    {mensaje_id, reacciones} y los usuarios a los que hay que avisar, vacío si
+    no cambió nada (ya estaba puesta / no existía). No hace commit.
+    """
+    targets = await participants(db, user_id, mensaje_id)
+    r = models.Reaccion
+    if add:
+        changed = await db.scalar(
+            insert(r).values(mensaje_id=mensaje_id, usuario_id=user_id, tipo=tipo)
+                .on_conflict_do_nothing(index_elements=[r.mensaje_id, r.usuario_id, r.tipo])
+                .returning(r.id)
+        )
+    else:
+        changed = await db.scalar(
+            delete(r).filter(r.mensaje_id == mensaje_id, r.usuario_id == user_id, r.tipo == tipo)
+                .returning(r.id)
+        )
+    counts = await reaction_counts(db, [mensaje_id], user_id)
+    summary = {"mensaje_id": mensaje_id, "reacciones": counts.get(mensaje_id, [])}
+    return summary, targets if changed is not None else []
+
+
+async def broadcast(targets: list[int], user_id: int, summary: dict, tipo: str, add: bool):
+    total = next((c["total"] for c in summary["reacciones"] if c["tipo"] == tipo), 0)
+    await manager.send(targets, {
+        "type": "reaction", "mensaje_id": summary["mensaje_id"], "usuario_id": user_id,
+        "tipo": tipo, "accion": "add" if add else "remove", "total": total,
+    })
@@ -0,0 +1,124 @@
+"""
+Caché de respuestas para GET muy consultados, con versión por recurso.
+
+Cada recurso ("group:{id}", "friends:{user_id}", "content:{mensaje_id}",
+"users") tiene una versión: un token aleatorio que las rutas de escritura
+reemplazan con bump() después del commit. La clave de una respuesta incluye
+esa versión, así que tras un bump las entradas viejas simplemente dejan de
+usarse y expiran por LRU/TTL; si la versión misma se pierde (expulsión, TTL)
+se genera otra y el efecto es el mismo: nunca se sirve algo anterior a un bump.
+
+El ETag sale de la versión y de la query, de modo que un If-None-Match
+vigente responde 304 con una sola lectura del store, sin cuerpo ni base de datos.
+
+Usa los mismos stores que la caché de membresía: RESPONSE_CACHE=memory|redis,
+con RESPONSE_CACHE_TTL en ambos. En memoria cada proceso tiene sus propias
+versiones: con varios workers un bump solo lo ve el worker que atendió la
+escritura y los demás sirven la respuesta vieja hasta que vence el TTL. Con más
+de un worker (WEB_CONCURRENCY) usar RESPONSE_CACHE=redis; en memoria se avisa
+al arrancar.
+"""
+import hashlib
+import os
+import uuid
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from loguru import logger
+from pydantic import TypeAdapter
+
+from app.membership import LRUStore, RedisStore
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# La misma variable con la que uvicorn/gunicorn toman el número de workers por defecto
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# El cliente puede guardar la respuesta pero debe revalidarla (If-None-Match) siempre
+CACHE_CONTROL = "private, no-cache"
+
+
+class ResponseCache:
+    def __init__(self, store=None):
+        self.store = store or LRUStore(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+        self.adapters: dict[object, TypeAdapter] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def _version_key(resource: str) -> str:
+        return f"respver:{resource}"
+
+    async def version(self, resource: str) -> str:
+        value = await self.store.get(self._version_key(resource))
+        if value is None:
+            value = [uuid.uuid4().hex]
+            await self.store.set(self._version_key(resource), value)
+        return value[0]
+
+    async def bump(self, *resources: str):
+        """Invalida todo lo cacheado de `resources`; llamar después del commit."""
+        for resource in resources:
+            await self.store.set(self._version_key(resource), [uuid.uuid4().hex])
+
+    def _adapter(self, model) -> TypeAdapter:
+        adapter = self.adapters.get(model)
+        if adapter is None:
+            adapter = self.adapters[model] = TypeAdapter(model)
+        return adapter
+
+    async def respond(self, request: Request, resource: str, load: Callable[[], Awaitable], model) -> Response:
+        """
+        Respuesta JSON de `load()` serializada como `model` (el response_model de
+        la ruta), servida desde la caché o con 304 cuando se puede.
+        """
+        key = f"{resource}:{await self.version(resource)}:{request.url.query}"
+        etag = '"' + hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag in [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]:
+            self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        entry = await self.store.get(f"resp:{key}")
+        if entry is not None:
+            self.hits += 1
+            return Response(content=entry[0], media_type="application/json", headers=headers)
+        self.misses += 1
+        adapter = self._adapter(model)
+        data = await load()
+        body = adapter.dump_json(adapter.validate_python(data, from_attributes=True)).decode()
+        if not data:
+            # Una lista vacía puede ser un recurso que todavía no existe (p. ej. los
+            # contenidos de un mensaje aún no enviado) y cuya creación no hace bump
+            return Response(content=body, media_type="application/json")
+        await self.store.set(f"resp:{key}", [body])
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.not_modified
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": (self.hits + self.not_modified) / total if total else 0.0,
+            "evictions": self.store.evictions,
+        }
+
+
+def create_response_cache(kind: str = RESPONSE_CACHE) -> ResponseCache:
+    if kind == "memory":
+        if WEB_CONCURRENCY > 1:
+            logger.warning(
+                "RESPONSE_CACHE=memory con {} workers: una escritura en un worker no invalida "
+                "la caché de los demás hasta RESPONSE_CACHE_TTL={}s; usar RESPONSE_CACHE=redis",
+                WEB_CONCURRENCY, RESPONSE_CACHE_TTL,
+            )
+        return ResponseCache(LRUStore(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL))
+    if kind == "redis":
+        return ResponseCache(RedisStore(ttl=RESPONSE_CACHE_TTL))
+    raise ValueError(f"RESPONSE_CACHE desconocido: {kind}")
+
+
+response_cache = create_response_cache()
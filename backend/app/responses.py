@@ -0,0 +1,18 @@
+"""
+Respuesta JSON serializada con orjson.
+
+Para listados grandes que se arman directamente con filas (tuplas/dicts) de
+la base: sin un modelo Pydantic por fila ni el paso por jsonable_encoder.
+orjson serializa datetime en ISO 8601, igual que los modelos del API. La ruta
+conserva su response_model para la documentación, pero al devolver esta
+respuesta FastAPI no vuelve a validarla: quien la usa garantiza la forma.
+"""
+import orjson
+from fastapi.responses import Response
+
+
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -1,44 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 
 from app.schemas import LoginIn, LoginOut
 from app import schemas, database, models
+from app.security import hasher, create_access_token
+from app.response_cache import response_cache
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 @router.post("/login", response_model=LoginOut)
-def login(data: LoginIn, db: Session = Depends(database.get_db)):
+async def login(data: LoginIn, db: AsyncSession = Depends(database.get_async_db)):
     # 1. Buscar usuario por email
-    user = db.query(models.Usuario).filter(models.Usuario.email == data.email).first()
+    user = await db.scalar(select(models.Usuario).filter(models.Usuario.email == data.email))
     if not user:
         # no existe cuenta
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales inválidas"
         )
-    # 2. Verificar contraseña con el hash guardado
-    if not pwd_context.verify(data.password, user.contrasena_hash):
+    # 2. Verificar contraseña con el hash guardado (bcrypt corre en el pool de procesos)
+    ok, new_hash = await hasher.verify_and_update(data.password, user.contrasena_hash)
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales inválidas"
         )
-    # 3. Retornar datos del usuario
-    return user
+    # Si cambió el costo de bcrypt, se guarda el hash rehecho con los parámetros actuales
+    if new_hash:
+        user.contrasena_hash = new_hash
+        await db.commit()
+    # 3. Retornar datos del usuario y su token de sesión
+    return LoginOut(
+        id=user.id,
+        nombre=user.nombre,
+        apellido=user.apellido,
+        email=user.email,
+        image_url=user.image_url,
+        access_token=create_access_token(user.id)
+    )
 
 
 @router.post("/register", response_model=schemas.UsuarioOut, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UsuarioCreate, db: Session = Depends(database.get_db)):
+async def create_user(user: schemas.UsuarioCreate, db: AsyncSession = Depends(database.get_async_db)):
     
-    if db.query(models.Usuario).filter(models.Usuario.email == user.email).first():
+    if await db.scalar(select(models.Usuario).filter(models.Usuario.email == user.email)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email ya registrado"
         )
     
-    hashed = pwd_context.hash(user.password)
+    hashed = await hasher.hash(user.password)
 
 
     new_user = models.Usuario(
@@ -50,6 +62,7 @@ def create_user(user: schemas.UsuarioCreate, db: Session = Depends(database.get_
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    await response_cache.bump("users")
     return new_user
\ No newline at end of file
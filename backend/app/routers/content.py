@@ -1,35 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app import schemas, models
-from app.database import get_db
+from app.database import get_async_db
+from app.reactions import participants
+from app.response_cache import response_cache
+from app.security import current_user_id, media_user_id
+from app.storage import storage, storage_key, receive_file
+from app.thumbnails import thumbnailer, wants_thumbnail
 
 router = APIRouter()
 
 @router.post("/", response_model=schemas.ContenidoOut, status_code=status.HTTP_201_CREATED)
-def upload_content(
+async def upload_content(
     mensaje_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    request: Request,
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    msg = db.query(models.Mensaje).get(mensaje_id)
-    if not msg:
+    """
+    Adjunta un archivo (campo `file` de un multipart/form-data) a un mensaje propio.
+    El cuerpo se lee por bloques hacia app.storage; un archivo ya guardado
+    (p. ej. reenviado) no se vuelve a almacenar.
+    """
+    # fecha_envio va también en el contenido: decide su partición (ver init.sql)
+    msg = (await db.execute(
+        select(models.Mensaje.emisor_id, models.Mensaje.fecha_envio).filter(models.Mensaje.id == mensaje_id)
+    )).first()
+    if msg is None or msg.emisor_id is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Mensaje no encontrado")
-    # Aquí podrías guardar el archivo en disco o en la nube.
-    file_url = f"/static/{file.filename}"
+    if msg.emisor_id != user_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Solo el emisor puede adjuntar archivos")
+    # La sesión no debe quedar con una transacción abierta mientras llega el archivo
+    await db.rollback()
+    stored = await receive_file(request)
     content = models.Contenido(
         mensaje_id=mensaje_id,
+        fecha_envio=msg.fecha_envio,
         tipo_contenido="archivo",
-        tipo_archivo=file.content_type,
-        archivo_url=file_url
+        tipo_archivo=(stored.content_type or "")[:100] or None,
+        archivo_hash=stored.sha256,
+        archivo_tamano=stored.size,
     )
+    # Imágenes y videos entran en la cola de miniaturas; el aviso llega por WebSocket
+    if wants_thumbnail(content.tipo_archivo):
+        content.miniatura_estado = "pendiente"
     db.add(content)
-    db.commit()
-    db.refresh(content)
+    await db.flush()
+    content.archivo_url = f"/content/file/{content.id}"
+    await db.commit()
+    await response_cache.bump(f"content:{mensaje_id}")
+    if content.miniatura_estado:
+        thumbnailer.notify()
     return content
 
+# El contenido de /content/file/{id} no cambia nunca: el navegador puede guardarlo sin
+# revalidar, pero solo él (private): la respuesta depende de quién la pide
+FILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _inline(media_type: str | None) -> bool:
+    """Solo imágenes y videos se muestran en el navegador; SVG puede llevar scripts."""
+    return bool(media_type) and media_type.startswith(("image/", "video/")) and media_type != "image/svg+xml"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def _serve(db: AsyncSession, request: Request, user_id: int, contenido_id: int, miniatura: bool) -> Response:
+    C = models.Contenido
+    columns = (C.miniatura_hash, C.tipo_archivo) if miniatura else (C.archivo_hash, C.tipo_archivo)
+    row = (await db.execute(select(*columns, C.mensaje_id).filter(C.id == contenido_id))).first()
+    if row is None or row[0] is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Archivo no encontrado")
+    # Los ids son secuenciales: solo quien ve el mensaje puede bajar sus adjuntos
+    await participants(db, user_id, row.mensaje_id)
+    # Lo que queda no necesita la conexión: se devuelve al pool antes de enviar el archivo
+    await db.close()
+    digest, media_type = row[0], "image/jpeg" if miniatura else row[1]
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": FILE_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if not _inline(media_type):
+        # El tipo lo declara quien sube el archivo: un HTML no se abre en nuestro origen
+        headers["Content-Disposition"] = "attachment"
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return storage.response(storage_key(digest), media_type, headers)
+
+
+@router.api_route("/file/{contenido_id}", methods=["GET", "HEAD"])
+async def download_file(
+    contenido_id: int,
+    request: Request,
+    user_id: int = Depends(media_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Descarga el adjunto de un contenido; solo para participantes del mensaje,
+    con Authorization o ?token= (ver media_user_id). El ETag es el sha256 del
+    archivo, así que un If-None-Match válido responde 304 sin tocar el
+    almacenamiento. Range e If-Range los resuelve la respuesta del
+    almacenamiento (ver app.storage). Lo que no es imagen ni video se sirve
+    como attachment.
+    """
+    return await _serve(db, request, user_id, contenido_id, miniatura=False)
+
+
+@router.api_route("/file/{contenido_id}/miniatura", methods=["GET", "HEAD"])
+async def download_thumbnail(
+    contenido_id: int,
+    request: Request,
+    user_id: int = Depends(media_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Miniatura JPEG de una imagen o video, cuando miniatura_estado es 'lista'."""
+    return await _serve(db, request, user_id, contenido_id, miniatura=True)
+
 @router.get("/{mensaje_id}", response_model=List[schemas.ContenidoOut])
-def get_contents(mensaje_id: int, db: Session = Depends(get_db)):
-    contents = db.query(models.Contenido).filter(models.Contenido.mensaje_id == mensaje_id).all()
-    return contents
+async def get_contents(
+    mensaje_id: int,
+    request: Request,
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Mismo control que las descargas: los contenidos incluyen el texto y las URLs de los adjuntos
+    await participants(db, user_id, mensaje_id)
+
+    async def load():
+        return (await db.scalars(
+            select(models.Contenido).filter(models.Contenido.mensaje_id == mensaje_id).order_by(models.Contenido.id)
+        )).all()
+    return await response_cache.respond(request, f"content:{mensaje_id}", load, List[schemas.ContenidoOut])
@@ -1,88 +1,114 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
 
 from app import schemas, models
-from app.database import get_db
+from app.database import get_async_db
+from app.connections import manager
+from app.friendships import friend_ids
+from app.response_cache import response_cache
+from app.security import current_user_id
 
 router = APIRouter()
 
 @router.get("/{user_id}/all", response_model=List[schemas.UsuarioOut])
-def get_user_friends(user_id: int, db: Session = Depends(get_db)):
+async def get_user_friends(
+    user_id: int,
+    request: Request,
+    after: Optional[int] = Query(None, description="ID del último amigo ya recibido"),
+    limit: int = Query(100, ge=1, le=500),
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Devuelve todos los usuarios con los que user_id tiene amistad aceptada.
-    Considera ambas direcciones de la relación para que sea simétrica.
+    Devuelve los usuarios con los que user_id tiene amistad aceptada, ordenados por id.
+    Considera ambas direcciones de la relación para que sea simétrica; una sola
+    consulta (UNION de ambos sentidos + JOIN a usuario) por página.
+    Cacheada por usuario (ver app.response_cache): aceptar una solicitud la invalida.
+    Solo la consulta el propio usuario (403 si el token es de otro).
     """
-    # Verificar que el usuario exista
-    me = db.query(models.Usuario).get(user_id)
-    if not me:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-
-    # Relaciones donde yo soy quien envió y fue aceptada
-    sent = (
-        db.query(models.Amistad)
-            .filter_by(usuario_id=user_id, estado="accepted")
-            .all()
-    )
-    # Relaciones donde yo soy quien recibió y fue aceptada
-    rec = (
-        db.query(models.Amistad)
-            .filter_by(amigo_id=user_id, estado="accepted")
-            .all()
-    )
-
-    # Consolidar IDs de amigos
-    friend_ids = [rel.amigo_id for rel in sent] + [rel.usuario_id for rel in rec]
-    if not friend_ids:
-        return []
-
-    # Obtener datos de los usuarios amigos
-    amigos = db.query(models.Usuario).filter(models.Usuario.id.in_(friend_ids)).all()
-    return amigos
+    if user_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No puedes ver los amigos de otro usuario")
+    async def load():
+        ids = friend_ids(user_id)
+        q = select(models.Usuario).join(ids, models.Usuario.id == ids.c.friend_id)
+        if after:
+            q = q.filter(models.Usuario.id > after)
+        amigos = (await db.scalars(q.order_by(models.Usuario.id).limit(limit))).all()
 
+        # Solo una lista vacía necesita distinguir "sin amigos" de "usuario inexistente"
+        if not amigos and not after and not await db.get(models.Usuario, user_id):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
+        return amigos
+    return await response_cache.respond(request, f"friends:{user_id}", load, List[schemas.UsuarioOut])
 
 
 @router.post("/", response_model=schemas.AmistadOut, status_code=status.HTTP_201_CREATED)
-def send_request(req: schemas.AmistadCreate, db: Session = Depends(get_db)):
+async def send_request(
+    req: schemas.AmistadCreate,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if req.usuario_id != caller_id:
+        raise HTTPException(403, "No puedes enviar solicitudes en nombre de otro usuario")
     if req.usuario_id == req.amigo_id:
         raise HTTPException(400, "No puedes invitarte a ti mismo")
-    exists = db.query(models.Amistad).filter_by(
-        usuario_id=req.usuario_id, amigo_id=req.amigo_id
-    ).first()
+    exists = await db.get(models.Amistad, (req.usuario_id, req.amigo_id))
     if exists:
         raise HTTPException(400, "Ya existe una solicitud")
+    # El par inverso también cuenta (salvo si fue rechazado): si no, la amistad quedaría duplicada
+    reverse = await db.get(models.Amistad, (req.amigo_id, req.usuario_id))
+    if reverse and reverse.estado != "rejected":
+        raise HTTPException(400, "Ya existe una solicitud de este usuario")
     # Verificar que ambos usuarios existen
-    if not db.query(models.Usuario).get(req.usuario_id) or not db.query(models.Usuario).get(req.amigo_id):
+    if not await db.get(models.Usuario, req.usuario_id) or not await db.get(models.Usuario, req.amigo_id):
         raise HTTPException(404, "Usuario no encontrado")
     fr = models.Amistad(**req.dict())
     db.add(fr)
-    db.commit()
-    db.refresh(fr)
-    # TODO: aquí puedes publicar en Redis o WebSocket para notificar al receptor
+    await db.commit()
+    await db.refresh(fr)
+    # Notificar al receptor por WebSocket (vía el broker, llega aunque esté en otro worker)
+    await manager.send([fr.amigo_id], {"type": "friend_request", **schemas.AmistadOut.from_orm(fr).dict()})
     return fr
 
 @router.get("/incoming/{user_id}", response_model=List[schemas.AmistadOut])
-def list_incoming(user_id: int, db: Session = Depends(get_db)):
+async def list_incoming(
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Solicitudes PENDING dirigidas al usuario"""
-    return db.query(models.Amistad).filter_by(
-        amigo_id=user_id, estado="pending"
-    ).all()
+    if user_id != caller_id:
+        raise HTTPException(403, "No puedes ver las solicitudes de otro usuario")
+    result = await db.scalars(
+        select(models.Amistad).filter_by(amigo_id=user_id, estado="pending")
+    )
+    return result.all()
 
 @router.get("/sent/{user_id}", response_model=List[schemas.AmistadOut])
-def list_sent(user_id: int, db: Session = Depends(get_db)):
+async def list_sent(
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Solicitudes enviadas por el usuario (cualquier estado)"""
-    return db.query(models.Amistad).filter_by(usuario_id=user_id).all()
+    if user_id != caller_id:
+        raise HTTPException(403, "No puedes ver las solicitudes de otro usuario")
+    result = await db.scalars(select(models.Amistad).filter_by(usuario_id=user_id))
+    return result.all()
 
 @router.patch("/{usuario_id}/{amigo_id}", response_model=schemas.AmistadOut)
-def respond_request(
+async def respond_request(
     usuario_id: int,
     amigo_id: int,
     upd: schemas.AmistadUpdate,
-    db: Session = Depends(get_db)
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    fr = db.query(models.Amistad).filter_by(
-        usuario_id=usuario_id, amigo_id=amigo_id
-    ).first()
+    if amigo_id != caller_id:
+        raise HTTPException(403, "Solo el destinatario puede responder la solicitud")
+    fr = await db.get(models.Amistad, (usuario_id, amigo_id))
     if not fr:
         raise HTTPException(404, "Solicitud no encontrada")
     if fr.estado != "pending":
@@ -94,52 +120,53 @@ def respond_request(
     y se actualiza la solicitud de amistad con el nuevo estado.
     """
     fr.estado = upd.estado
-    db.commit()
-    db.refresh(fr)
+    await db.commit()
+    await db.refresh(fr)
+    if fr.estado == "accepted":
+        await response_cache.bump(f"friends:{usuario_id}", f"friends:{amigo_id}")
     # Si fue aceptada, podrías enviar un mensaje de bienvenida automático:
     # if upd.estado == "accepted": crear_mensaje_bienvenida(...)
     return fr
 
 
 @router.post("/{usuario_id}/{amigo_id}/accept", response_model=schemas.AmistadOut, status_code=status.HTTP_200_OK)
-def accept_friend_request(
+async def accept_friend_request(
     usuario_id: int,
     amigo_id: int,
-    db: Session = Depends(get_db)
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    if amigo_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Solo el destinatario puede responder la solicitud")
     # 1. Recuperar la solicitud pendiente
-    fr = (
-        db.query(models.Amistad)
-            .filter_by(usuario_id=usuario_id, amigo_id=amigo_id)
-            .first()
-    )
+    fr = await db.get(models.Amistad, (usuario_id, amigo_id))
     if not fr:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Solicitud no encontrada")
     if fr.estado != "pending":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Solicitud ya procesada")
     # 2. Marcar como aceptada
     fr.estado = "accepted"
-    db.commit()
-    db.refresh(fr)
+    await db.commit()
+    await db.refresh(fr)
+    await response_cache.bump(f"friends:{usuario_id}", f"friends:{amigo_id}")
     return fr
 
 @router.post("/{usuario_id}/{amigo_id}/reject", response_model=schemas.AmistadOut, status_code=status.HTTP_200_OK)
-def reject_friend_request(
+async def reject_friend_request(
     usuario_id: int,
     amigo_id: int,
-    db: Session = Depends(get_db)
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    fr = (
-        db.query(models.Amistad)
-            .filter_by(usuario_id=usuario_id, amigo_id=amigo_id)
-            .first()
-    )
+    if amigo_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Solo el destinatario puede responder la solicitud")
+    fr = await db.get(models.Amistad, (usuario_id, amigo_id))
     if not fr:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Solicitud no encontrada")
     if fr.estado != "pending":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Solicitud ya procesada")
     # 1. Marcar como rechazada
     fr.estado = "rejected"
-    db.commit()
-    db.refresh(fr)
+    await db.commit()
+    await db.refresh(fr)
     return fr
\ No newline at end of file
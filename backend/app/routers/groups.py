@@ -1,17 +1,38 @@
 import secrets
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, select
 from typing import List
 
 from app import schemas, models
-from app.database import get_db
+from app.database import get_async_db
+from app.friendships import accepted_friend_ids
+from app.membership import membership_cache
+from app.response_cache import response_cache
+from app.security import current_user_id
 
 router = APIRouter()
 
+# Roles que pueden agregar o quitar a otros miembros
+GROUP_ADMIN_ROLES = ("owner", "admin")
+
+
+async def _require_admin(db: AsyncSession, group_id: int, user_id: int):
+    m = await db.get(models.Pertenece, (group_id, user_id))
+    if not m or m.role not in GROUP_ADMIN_ROLES:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Solo un administrador del grupo puede hacerlo")
+
+
 @router.post("/", response_model=schemas.GrupoDetail, status_code=status.HTTP_201_CREATED)
-def create_group(gr: schemas.GrupoCreate, db: Session = Depends(get_db)):
+async def create_group(
+    gr: schemas.GrupoCreate,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if gr.creador_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No puedes crear grupos en nombre de otro usuario")
     # 1. Verificar que el creador existe
-    creador = db.query(models.Usuario).get(gr.creador_id)
+    creador = await db.get(models.Usuario, gr.creador_id)
     if not creador:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Usuario creador no existe")
 
@@ -26,28 +47,25 @@ def create_group(gr: schemas.GrupoCreate, db: Session = Depends(get_db)):
         invite_token=token
     )
     db.add(group)
-    db.commit()
-    db.refresh(group)
+    await db.commit()
+    await db.refresh(group)
 
     # 4. Agregar creador como admin
     db.add(models.Pertenece(grupo_id=group.id, usuario_id=gr.creador_id, role="admin"))
 
-    # 5. Agregar miembros iniciales solo si la amistad está aceptada
-    for user_id in gr.miembros:
-        from sqlalchemy import and_, or_
-        fr = db.query(models.Amistad).filter(
-            or_(
-                and_(models.Amistad.usuario_id == gr.creador_id, models.Amistad.amigo_id == user_id),
-                and_(models.Amistad.usuario_id == user_id, models.Amistad.amigo_id == gr.creador_id)
-            ),
-            models.Amistad.estado == "accepted"
-        ).first()
-        if fr:
+    # 5. Agregar miembros iniciales solo si la amistad está aceptada (una consulta para todos)
+    amigos = await accepted_friend_ids(db, gr.creador_id, gr.miembros)
+    added = [gr.creador_id]
+    for user_id in dict.fromkeys(gr.miembros):
+        if user_id in amigos:
             db.add(models.Pertenece(grupo_id=group.id, usuario_id=user_id, role="member"))
-    db.commit()
+            added.append(user_id)
+    await db.commit()
+    await membership_cache.invalidate(group.id, added)
+    await response_cache.bump(f"group:{group.id}")
 
     # 6. Preparar detalle de grupo con miembros
-    members = db.query(models.Pertenece).filter_by(grupo_id=group.id).all()
+    members = (await db.scalars(select(models.Pertenece).filter_by(grupo_id=group.id))).all()
     return schemas.GrupoDetail(
         id=group.id,
         nombre=group.nombre,
@@ -59,51 +77,85 @@ def create_group(gr: schemas.GrupoCreate, db: Session = Depends(get_db)):
     )
 
 @router.get("/", response_model=List[schemas.GrupoOut])
-def list_user_groups(user_id: int, db: Session = Depends(get_db)):
-    return (
-        db.query(models.Grupo)
-            .join(models.Pertenece)
-            .filter(models.Pertenece.usuario_id == user_id)
-            .all()
-    )
+async def list_user_groups(
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if user_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No puedes ver los grupos de otro usuario")
+    return await membership_cache.user_groups(db, user_id)
 
 @router.post("/{group_id}/members/{user_id}", status_code=status.HTTP_201_CREATED)
-def add_member(group_id: int, user_id: int, db: Session = Depends(get_db)):
-    group = db.query(models.Grupo).get(group_id)
-    user = db.query(models.Usuario).get(user_id)
+async def add_member(
+    group_id: int,
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Agregar a otro lo hace un administrador; para unirse uno mismo está /join/{token}
+    await _require_admin(db, group_id, caller_id)
+    group = await db.get(models.Grupo, group_id)
+    user = await db.get(models.Usuario, user_id)
     if not group or not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Grupo o usuario no encontrado")
-    exists = db.query(models.Pertenece).get((group_id, user_id))
+    exists = await db.get(models.Pertenece, (group_id, user_id))
     if exists:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Ya es miembro del grupo")
     m = models.Pertenece(grupo_id=group_id, usuario_id=user_id)
     db.add(m)
-    db.commit()
+    await db.commit()
+    await membership_cache.invalidate(group_id, [user_id])
+    await response_cache.bump(f"group:{group_id}")
     return {"message": "Usuario agregado al grupo"}
 
 @router.post("/join/{token}", response_model=schemas.MiembroOut, status_code=status.HTTP_201_CREATED)
-def join_by_token(token: str, user_id: int, db: Session = Depends(get_db)):
-    group = db.query(models.Grupo).filter_by(invite_token=token).first()
+async def join_by_token(
+    token: str,
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if user_id != caller_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No puedes unir a otro usuario")
+    group = (await db.scalars(select(models.Grupo).filter_by(invite_token=token))).first()
     if not group:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Token inválido")
-    exists = db.query(models.Pertenece).get((group.id, user_id))
+    exists = await db.get(models.Pertenece, (group.id, user_id))
     if exists:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Ya eres miembro")
     membership = models.Pertenece(grupo_id=group.id, usuario_id=user_id, role="member")
     db.add(membership)
-    db.commit()
-    db.refresh(membership)
+    await db.commit()
+    await db.refresh(membership)
+    await membership_cache.invalidate(group.id, [user_id])
+    await response_cache.bump(f"group:{group.id}")
     return membership
 
-#TODO filtrar que quien elimina sea admin
 @router.delete("/{group_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_member(group_id: int, user_id: int, db: Session = Depends(get_db)):
-    m = db.query(models.Pertenece).get((group_id, user_id))
+async def remove_member(
+    group_id: int,
+    user_id: int,
+    caller_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Cualquiera puede salir del grupo; quitar a otro lo hace un administrador
+    if user_id != caller_id:
+        await _require_admin(db, group_id, caller_id)
+    m = await db.get(models.Pertenece, (group_id, user_id))
     if not m:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Miembro no encontrado")
-    db.delete(m)
-    db.commit()
+    await db.delete(m)
+    # Sin membresía el grupo deja de aparecer en su bandeja de entrada
+    await db.execute(delete(models.ConversacionEstado).filter(
+        models.ConversacionEstado.usuario_id == user_id, models.ConversacionEstado.grupo_id == group_id
+    ))
+    await db.commit()
+    await membership_cache.invalidate(group_id, [user_id])
+    await response_cache.bump(f"group:{group_id}")
 
 @router.get("/{group_id}/members", response_model=List[schemas.MiembroOut])
-def list_group_members(group_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Pertenece).filter_by(grupo_id=group_id).all()
\ No newline at end of file
+async def list_group_members(group_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await response_cache.respond(
+        request, f"group:{group_id}", lambda: membership_cache.group_members(db, group_id), List[schemas.MiembroOut]
+    )
\ No newline at end of file
@@ -1,76 +1,322 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, tuple_, literal, union_all, cast
+from sqlalchemy.dialects.postgresql import TSQUERY
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 
 from app import schemas, models
-from app.database import get_db
-from app.routers.ws import manager
+from app.database import get_async_db
+from app.connections import manager
+from app.dispatcher import dispatcher
+from app.inbox import mark_read
+from app.reactions import broadcast, react, reaction_counts
+from app.membership import membership_cache
+from app.responses import ORJSONResponse
+from app.security import current_user_id
+from app.writer import MESSAGE_WRITE_BEHIND, writer, check_destination, new_message, integrity_detail
 
 router = APIRouter()
 
 @router.post("/", response_model=schemas.MensajeOut, status_code=status.HTTP_201_CREATED)
-def create_message(msg: schemas.MensajeCreate, db: Session = Depends(get_db)):
-    # Validar emisores/receptores
-    if not db.query(models.Usuario).get(msg.emisor_id):
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Emisor no existe")
-    if msg.receptor_id and not db.query(models.Usuario).get(msg.receptor_id):
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Receptor no existe")
-    if msg.grupo_id and not db.query(models.Grupo).get(msg.grupo_id):
-        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Grupo no existe")
-    new = models.Mensaje(
-        emisor_id=msg.emisor_id,
-        receptor_id=msg.receptor_id,
-        grupo_id=msg.grupo_id,
-        estado_envio="enviado",
-        estado_lectura="no_leído"
-    )
+async def create_message(
+    msg: schemas.MensajeCreate,
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if msg.emisor_id != user_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No puedes enviar mensajes en nombre de otro usuario")
+    await check_destination(db, msg)
+    if MESSAGE_WRITE_BEHIND:
+        # Se agrupa con otros envíos concurrentes; responde cuando el lote hace commit
+        return await writer.write(msg)
+    new = new_message(msg)
     db.add(new)
-    db.commit()
-    db.refresh(new)
-    # Si viene texto, creamos contenido asociado
-    if msg.texto:
-        c = models.Contenido(
-            mensaje_id=new.id,
-            tipo_contenido="texto",
-            texto=msg.texto
-        )
-        db.add(c)
-        db.commit()
-
-    # 2. Determinar destinatarios WS
-    targets = []
-    if new.receptor_id:
-        targets = [new.receptor_id]
-    elif new.grupo_id:
-        # todos los miembros del grupo
-        targets = [p.usuario_id for p in db.query(models.Pertenece)
-                                    .filter_by(grupo_id=new.grupo_id)]
-    # 3. Enviar WS
-    import asyncio
+    try:
+        # Un solo commit: INSERT mensaje ... RETURNING id, fecha_envio + INSERT contenido
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise integrity_detail(e)
+
+    # La difusión por WebSocket corre en el despachador, fuera de la petición
     message_data = schemas.MensajeOut.from_orm(new).dict()
-    asyncio.create_task(manager.send(targets, message_data))
-    return new
+    dispatcher.submit(message_data)
+    return message_data
+
+
+def _keyset(stmt, before: Optional[int], after: Optional[int], limit: int):
+    """
+    Aplica el cursor sobre la tupla (fecha_envio, id) del mensaje `before`/`after`
+    y el orden/límite de la página, para que Postgres recorra solo `limit` filas
+    de idx_mensaje_grupo_fecha / idx_mensaje_chat_fecha.
+
+    La cota suelta sobre fecha_envio repite lo que ya dice la tupla, pero es la
+    forma que entiende el particionado: las particiones del otro lado del cursor
+    se descartan al ejecutar (la fecha del ancla sale de una subconsulta). Sin
+    cursor, el Append ordenado por mes se detiene al completar `limit` filas.
+    """
+    key = tuple_(models.Mensaje.fecha_envio, models.Mensaje.id)
+    cursor = before or after
+    if cursor:
+        anchor_fecha = select(models.Mensaje.fecha_envio).filter(models.Mensaje.id == cursor).scalar_subquery()
+        anchor = tuple_(anchor_fecha, literal(cursor))
+        if after:
+            stmt = stmt.filter(models.Mensaje.fecha_envio >= anchor_fecha, key > anchor)
+        else:
+            stmt = stmt.filter(models.Mensaje.fecha_envio <= anchor_fecha, key < anchor)
+    if after:
+        stmt = stmt.order_by(models.Mensaje.fecha_envio, models.Mensaje.id)
+    else:
+        stmt = stmt.order_by(models.Mensaje.fecha_envio.desc(), models.Mensaje.id.desc())
+    return stmt.limit(limit)
+
+
+# Columnas de MensajeDetail / ContenidoOut: el listado se arma con filas, sin instancias ORM
+MENSAJE_COLUMNS = (
+    models.Mensaje.id, models.Mensaje.emisor_id, models.Mensaje.receptor_id, models.Mensaje.grupo_id,
+    models.Mensaje.reply_to_id, models.Mensaje.fecha_envio, models.Mensaje.estado_envio,
+    models.Mensaje.estado_lectura,
+)
+CONTENIDO_COLUMNS = (
+    models.Contenido.id, models.Contenido.mensaje_id, models.Contenido.tipo_contenido,
+    models.Contenido.tipo_archivo, models.Contenido.texto, models.Contenido.archivo_url,
+    models.Contenido.archivo_hash, models.Contenido.archivo_tamano, models.Contenido.miniatura_estado,
+    models.Contenido.miniatura_url,
+)
+MENSAJE_KEYS = tuple(c.key for c in MENSAJE_COLUMNS)
+CONTENIDO_KEYS = tuple(c.key for c in CONTENIDO_COLUMNS)
+
 
+def as_dicts(result) -> list[dict]:
+    """Filas de un Result -> dicts; zip con las claves leídas una vez es bastante más barato que Row._asdict()."""
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
 
-@router.get("/", response_model=List[schemas.MensajeOut])
-def list_messages(
+
+def message_page(rows, contenidos, counts: dict[int, list[dict]]) -> list[dict]:
+    """Filas de MENSAJE_COLUMNS y CONTENIDO_COLUMNS -> dicts con la forma de MensajeDetail."""
+    by_message: dict[int, list[dict]] = {}
+    for c in contenidos:
+        by_message.setdefault(c.mensaje_id, []).append(dict(zip(CONTENIDO_KEYS, c)))
+    page = []
+    for row in rows:
+        item = dict(zip(MENSAJE_KEYS, row))
+        item["contenidos"] = by_message.get(row.id, [])
+        item["reacciones"] = counts.get(row.id, [])
+        page.append(item)
+    return page
+
+
+@router.get("/", response_model=List[schemas.MensajeDetail], response_class=ORJSONResponse)
+async def list_messages(
     user1_id: Optional[int] = None,
     user2_id: Optional[int] = None,
     group_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    before: Optional[int] = Query(None, description="ID de mensaje: devuelve los anteriores a él"),
+    after: Optional[int] = Query(None, description="ID de mensaje: devuelve los posteriores a él"),
+    limit: int = Query(50, ge=1, le=200),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(models.Mensaje)
+    """
+    Página del historial ordenada por (fecha_envio, id) ascendente.
+    Sin cursor devuelve los `limit` mensajes más recientes; `before`/`after`
+    son el id del primer/último mensaje que ya tiene el cliente.
+
+    Solo para participantes: el usuario del token debe ser user1_id/user2_id o
+    miembro de group_id (403 si no).
+
+    Cada mensaje trae sus contenidos y el conteo de reacciones por tipo (con
+    `mia` si el usuario del token reaccionó así), así el cliente no llama a
+    GET /content/{mensaje_id} por mensaje. Siempre son tres consultas (página,
+    contenidos, conteos de reaccion_conteo; más la membresía si no está en
+    caché) sin importar el tamaño de la página, y se leen como tuplas que van directo a orjson: ni instancias
+    ORM ni un modelo Pydantic por fila (ver benchmarks/serialization.py).
+    """
+    if before and after:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST,
+                            detail="Usa solo uno de before / after")
+    q = select(*MENSAJE_COLUMNS)
     if group_id:
-        msgs = q.filter(models.Mensaje.grupo_id == group_id)
+        if user_id not in await membership_cache.member_ids(db, group_id):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No eres miembro del grupo")
+        stmt = _keyset(q.filter(models.Mensaje.grupo_id == group_id), before, after, limit)
     elif user1_id and user2_id:
-        msgs = q.filter(
-            or_(
-                and_(models.Mensaje.emisor_id == user1_id, models.Mensaje.receptor_id == user2_id),
-                and_(models.Mensaje.emisor_id == user2_id, models.Mensaje.receptor_id == user1_id)
-            )
-        )
+        if user_id not in (user1_id, user2_id):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No participas en esta conversación")
+        # Una página por cada sentido de la conversación (cada una sale del índice
+        # ya ordenada) y luego se mezclan; un OR obligaría a ordenar todo el historial.
+        # Las ramas traen las filas completas: volver a buscarlas por id tocaría
+        # todas las particiones
+        sides = union_all(
+            _keyset(q.filter(
+                models.Mensaje.emisor_id == user1_id, models.Mensaje.receptor_id == user2_id
+            ), before, after, limit),
+            _keyset(q.filter(
+                models.Mensaje.emisor_id == user2_id, models.Mensaje.receptor_id == user1_id
+            ), before, after, limit),
+        ).subquery()
+        order = (sides.c.fecha_envio, sides.c.id) if after else (sides.c.fecha_envio.desc(), sides.c.id.desc())
+        stmt = select(sides).order_by(*order).limit(limit)
     else:
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
                             detail="Debes proporcionar group_id o ambos user IDs")
-    return msgs.order_by(models.Mensaje.fecha_envio).all()
+    result = (await db.execute(stmt)).all()
+    page = result if after else result[::-1]
+    ids = [row.id for row in page]
+    # El rango de fechas de la página limita los contenidos a sus particiones
+    contenidos = (await db.execute(
+        select(*CONTENIDO_COLUMNS).filter(
+            models.Contenido.mensaje_id.in_(ids),
+            models.Contenido.fecha_envio.between(page[0].fecha_envio, page[-1].fecha_envio),
+        ).order_by(models.Contenido.id)
+    )).all() if ids else []
+    counts = await reaction_counts(db, ids, user_id)
+    return ORJSONResponse(message_page(page, contenidos, counts))
+
+
+@router.get("/inbox", response_model=List[schemas.ConversacionOut], response_class=ORJSONResponse)
+async def inbox(
+    before: Optional[int] = Query(None, description="ultimo_mensaje_id de la última conversación ya recibida"),
+    limit: int = Query(50, ge=1, le=200),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Conversaciones del usuario autenticado, de la más reciente a la más antigua,
+    con su último mensaje y cuántos quedan sin leer. Una sola consulta sobre
+    conversacion_estado (idx_conversacion_usuario_ultimo); no se cuenta nada aquí.
+    """
+    ce = models.ConversacionEstado
+    texto = (
+        select(models.Contenido.texto)
+            .filter(
+                models.Contenido.mensaje_id == ce.ultimo_mensaje_id,
+                # Correlada con el mensaje ya unido: se lee solo su partición
+                models.Contenido.fecha_envio == models.Mensaje.fecha_envio,
+                models.Contenido.tipo_contenido == "texto",
+            )
+            .order_by(models.Contenido.id)
+            .limit(1)
+            .scalar_subquery()
+    )
+    stmt = (
+        select(
+            ce.peer_id, ce.grupo_id, ce.no_leidos, ce.ultimo_leido_id, ce.ultimo_mensaje_id,
+            models.Mensaje.emisor_id, models.Mensaje.fecha_envio, texto.label("texto"),
+        )
+            .outerjoin(models.Mensaje, models.Mensaje.id == ce.ultimo_mensaje_id)
+            .filter(ce.usuario_id == user_id)
+    )
+    if before:
+        stmt = stmt.filter(ce.ultimo_mensaje_id < before)
+    rows = await db.execute(stmt.order_by(ce.ultimo_mensaje_id.desc()).limit(limit))
+    return ORJSONResponse(as_dicts(rows))
+
+
+@router.post("/read", response_model=schemas.LecturaOut)
+async def read_messages(
+    lectura: schemas.LecturaIn,
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Marca la conversación de `mensaje_id` como leída hasta ese mensaje (inclusive)."""
+    state = await mark_read(db, user_id, lectura.mensaje_id)
+    await db.commit()
+    if state["peer_id"]:
+        await manager.send([state["peer_id"]], {
+            "type": "read", "mensaje_id": lectura.mensaje_id, "usuario_id": user_id
+        })
+    return state
+
+
+@router.put("/{mensaje_id}/reactions/{tipo}", response_model=schemas.ReaccionesOut)
+async def add_reaction(
+    mensaje_id: int,
+    tipo: str = Path(..., min_length=1, max_length=50),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Reacciona con `tipo` (p. ej. un emoji); repetirla no cambia nada. Devuelve los conteos del mensaje."""
+    summary, targets = await react(db, user_id, mensaje_id, tipo, add=True)
+    await db.commit()
+    if targets:
+        await broadcast(targets, user_id, summary, tipo, add=True)
+    return summary
+
+
+@router.delete("/{mensaje_id}/reactions/{tipo}", response_model=schemas.ReaccionesOut)
+async def remove_reaction(
+    mensaje_id: int,
+    tipo: str = Path(..., min_length=1, max_length=50),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Quita la reacción `tipo` del usuario si la tenía. Devuelve los conteos del mensaje."""
+    summary, targets = await react(db, user_id, mensaje_id, tipo, add=False)
+    await db.commit()
+    if targets:
+        await broadcast(targets, user_id, summary, tipo, add=False)
+    return summary
+
+
+# Fragmentos de ts_headline: hasta dos trozos de ~20 palabras alrededor de las coincidencias
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+
+@router.get("/search", response_model=List[schemas.MensajeSearchHit], response_class=ORJSONResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, description="Palabras, \"frase exacta\", or, -excluir"),
+    with_user: Optional[int] = Query(None, description="Solo la conversación con este usuario"),
+    group_id: Optional[int] = Query(None, description="Solo este grupo"),
+    before: Optional[int] = Query(None, description="mensaje_id del último resultado ya recibido"),
+    limit: int = Query(20, ge=1, le=100),
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Busca en los mensajes directos y grupos del usuario autenticado, del más
+    reciente al más antiguo. Texto y alcance se resuelven en un solo recorrido
+    de idx_contenido_busqueda; los fragmentos solo se calculan para la página.
+    """
+    # Alcance como lexemas del propio índice: ver trg_contenido_busqueda en init.sql
+    grupos = [g["id"] for g in await membership_cache.user_groups(db, user_id)]
+    if group_id is not None:
+        if group_id not in grupos:
+            raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No perteneces a este grupo")
+        scope = f"'g:{group_id}'"
+    elif with_user is not None:
+        scope = f"'u:{user_id}' & 'u:{with_user}'"
+    else:
+        scope = " | ".join([f"'u:{user_id}'"] + [f"'g:{gid}'" for gid in grupos])
+    words = func.websearch_to_tsquery("spanish", q)
+    tsquery = words.op("&&")(cast(scope, TSQUERY))
+    # Página resuelta solo con contenido: mensaje_id (serial) sigue el orden de envío,
+    # así mensaje se lee únicamente para las filas devueltas
+    page = select(models.Contenido.id, models.Contenido.mensaje_id, models.Contenido.fecha_envio).filter(
+        # Sin palabras útiles (solo stopwords) la consulta quedaría en el puro alcance
+        func.numnode(words) > 0,
+        models.Contenido.texto_busqueda.op("@@")(tsquery),
+    )
+    if before:
+        page = page.filter(models.Contenido.mensaje_id < before)
+    page = page.order_by(models.Contenido.mensaje_id.desc(), models.Contenido.id.desc()).limit(limit).subquery()
+    rows = await db.execute(
+        select(
+            models.Mensaje.id.label("mensaje_id"),
+            page.c.id.label("contenido_id"),
+            models.Mensaje.emisor_id,
+            models.Mensaje.receptor_id,
+            models.Mensaje.grupo_id,
+            models.Mensaje.fecha_envio,
+            func.ts_headline("spanish", models.Contenido.texto, words, HEADLINE_OPTIONS).label("snippet"),
+        )
+            # fecha_envio en los joins: cada fila se busca solo en su partición
+            .join(models.Contenido, (models.Contenido.id == page.c.id)
+                  & (models.Contenido.fecha_envio == page.c.fecha_envio))
+            .join(models.Mensaje, (models.Mensaje.id == page.c.mensaje_id)
+                  & (models.Mensaje.fecha_envio == page.c.fecha_envio))
+            .order_by(page.c.mensaje_id.desc(), page.c.id.desc())
+    )
+    return ORJSONResponse(as_dicts(rows))
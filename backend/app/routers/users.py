@@ -1,39 +1,82 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from app import models, schemas, database
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from app import models, schemas, database, search
+from app.response_cache import response_cache
 from passlib.context import CryptContext
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.UsuarioOut])
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    return db.query(models.Usuario).offset(skip).limit(limit).all()
+async def list_users(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_async_db)):
+    async def load():
+        result = await db.execute(select(models.Usuario).order_by(models.Usuario.id).offset(skip).limit(limit))
+        return result.scalars().all()
+    # El registro de un usuario invalida todas las páginas (ver auth.register)
+    return await response_cache.respond(request, "users", load, List[schemas.UsuarioOut])
+
+
+user_search_cache = search.SearchCache()
 
 
 @router.get("/search", response_model=List[schemas.UsuarioOut])
-def search_users(
+async def search_users(
+    response: Response,
     q: str = Query(..., min_length=1, description="Término de búsqueda"),
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cabecera X-Next-Cursor de la página anterior"),
     limit: int = Query(10, ge=1, le=100),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """
-    Busca usuarios cuyo nombre, apellido o email coincidan parcialmente con el término `q`.
+    Busca usuarios cuyo nombre, apellido o email empiecen por las palabras de `q`,
+    ordenados por relevancia. Si hay más resultados, X-Next-Cursor trae el cursor
+    para la página siguiente. Solo se rankean las primeras SEARCH_MAX_CANDIDATES
+    coincidencias (ver app.search); si la consulta las supera, la respuesta
+    lleva X-Search-Truncated: 1.
     """
-    pattern = f"%{q}%"
-    resultados = (
-        db.query(models.Usuario)
-            .filter(
-                or_(
-                    models.Usuario.nombre.ilike(pattern),
-                    models.Usuario.apellido.ilike(pattern),
-                    models.Usuario.email.ilike(pattern),
-                )
-            )
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-    return resultados
\ No newline at end of file
+    tsquery_text = search.prefix_query(q)
+    if tsquery_text is None:
+        return []
+    key = (tsquery_text, cursor, limit)
+    cached = user_search_cache.get(key)
+    if cached is None:
+        tsquery = func.to_tsquery("simple", tsquery_text)
+        matches = search.candidates(
+            select(
+                models.Usuario.id,
+                models.Usuario.nombre,
+                models.Usuario.apellido,
+                models.Usuario.email,
+                models.Usuario.fecha_registro,
+                models.Usuario.image_url,
+                models.Usuario.busqueda,
+            ).filter(models.Usuario.busqueda.op("@@")(tsquery)),
+            models.Usuario.id
+        )
+        rank = search.score(matches.c.busqueda, tsquery)
+        stmt = select(
+            matches.c.id,
+            matches.c.nombre,
+            matches.c.apellido,
+            matches.c.email,
+            matches.c.fecha_registro,
+            matches.c.image_url,
+            rank.label("score"),
+            search.candidate_count(matches).label("candidatos"),
+        )
+        rows = (await db.execute(
+            search.apply_cursor(stmt, rank, matches.c.id, search.parse_cursor(cursor), limit)
+        )).all()
+        cached = (
+            [schemas.UsuarioOut.from_orm(row) for row in rows],
+            search.next_cursor(rows, limit),
+            search.truncated(rows),
+        )
+        user_search_cache.set(key, cached)
+    usuarios, next_cursor, truncated = cached
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if truncated:
+        response.headers["X-Search-Truncated"] = "1"
+    return usuarios
@@ -1,32 +1,174 @@
-from fastapi import WebSocket, WebSocketDisconnect, APIRouter
+"""
+Protocolo del WebSocket /ws/ws/{user_id}?token=<access_token>. El token de
+/auth/login debe pertenecer a user_id; si no, se cierra con 1008 antes de aceptar.
+Cada trama es un objeto JSON con "type".
 
-class ConnectionManager:
-    def __init__(self):
-        self.active: dict[int, list[WebSocket]] = {}
+Cliente -> servidor:
+  {"type": "send", "client_id": "...", "receptor_id" | "grupo_id": n, "texto": "...", "reply_to_id": n?}
+  {"type": "typing", "receptor_id" | "grupo_id": n}
+  {"type": "read", "mensaje_id": n}     (leído hasta n, inclusive)
+  {"type": "react", "mensaje_id": n, "tipo": "...", "remove": bool?}
 
-    async def connect(self, ws: WebSocket, user_id: int):
-        await ws.accept()
-        self.active.setdefault(user_id, []).append(ws)
+Servidor -> cliente:
+  {"type": "ack", "client_id": "...", "mensaje": {...MensajeOut}}
+  {"type": "error", "client_id": "...", "detail": "..."}
+  {"type": "message", ...MensajeOut}
+  {"type": "typing", "usuario_id": n, "receptor_id" | "grupo_id": n}
+  {"type": "read", "mensaje_id": n, "usuario_id": n}   (usuario_id leyó hasta n)
+  {"type": "friend_request", ...AmistadOut}
+  {"type": "preview", "contenido_id": n, "mensaje_id": n, "miniatura_url": "..."}
+  {"type": "reaction", "mensaje_id": n, "usuario_id": n, "tipo": "...", "accion": "add" | "remove", "total": n}
 
-    def disconnect(self, ws: WebSocket, user_id: int):
-        self.active[user_id].remove(ws)
-        if not self.active[user_id]:
-            del self.active[user_id]
+Los envíos pasan por el MessageWriter, que agrupa en una sola transacción lo que
+llega de todos los sockets en unos milisegundos; no hace falta un POST por mensaje.
 
-    async def send(self, user_ids: list[int], message: dict):
-        for uid in user_ids:
-            for ws in self.active.get(uid, []):
-                await ws.send_json(message)
+Una trama inválida o que falla responde {"type": "error"} y el socket sigue abierto.
+"""
+import json
+from fastapi import WebSocket, WebSocketDisconnect, APIRouter, HTTPException, status
+from loguru import logger
+from pydantic import ValidationError
+
+from app import schemas
+from app.connections import Connection, manager
+from app.database import AsyncSessionLocal
+from app.inbox import mark_read
+from app.membership import membership_cache
+from app.reactions import broadcast, react
+from app.security import decode_access_token
+from app.writer import check_destination, writer
 
-manager = ConnectionManager()
 router = APIRouter()
 
+
+def _id(frame: dict, key: str, required: bool = False) -> int | None:
+    """Id entero positivo de la trama (acepta "5"); ValueError si no lo es o si falta y es obligatorio."""
+    value = frame.get(key)
+    if value is None and not required:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    if isinstance(value, str) and value.isdecimal() and int(value) > 0:
+        return int(value)
+    raise ValueError(f"{key} inválido")
+
+
+async def handle_send(conn: Connection, frame: dict):
+    client_id = frame.get("client_id")
+    try:
+        msg = schemas.MensajeCreate(
+            emisor_id=conn.user_id,  # el emisor es siempre el dueño del socket
+            receptor_id=frame.get("receptor_id"),
+            grupo_id=frame.get("grupo_id"),
+            reply_to_id=frame.get("reply_to_id"),
+            estado_envio=None,
+            estado_lectura=None,
+            texto=frame.get("texto"),
+        )
+        async with AsyncSessionLocal() as db:
+            await check_destination(db, msg)
+        mensaje = await writer.write(msg)
+    except ValidationError as e:
+        manager.send_to(conn, {"type": "error", "client_id": client_id, "detail": e.errors()})
+    except HTTPException as e:
+        manager.send_to(conn, {"type": "error", "client_id": client_id, "detail": e.detail})
+    else:
+        manager.send_to(conn, {"type": "ack", "client_id": client_id, "mensaje": mensaje})
+
+
+async def handle_typing(conn: Connection, frame: dict):
+    try:
+        receptor_id = _id(frame, "receptor_id")
+        grupo_id = _id(frame, "grupo_id")
+    except ValueError as e:
+        manager.send_to(conn, {"type": "error", "detail": str(e)})
+        return
+    if receptor_id:
+        await manager.send([receptor_id], {
+            "type": "typing", "usuario_id": conn.user_id, "receptor_id": receptor_id
+        })
+    elif grupo_id:
+        async with AsyncSessionLocal() as db:
+            members = await membership_cache.member_ids(db, grupo_id)
+        if conn.user_id in members:
+            await manager.send([uid for uid in members if uid != conn.user_id], {
+                "type": "typing", "usuario_id": conn.user_id, "grupo_id": grupo_id
+            })
+
+
+async def handle_read(conn: Connection, frame: dict):
+    # Marca la conversación leída hasta mensaje_id; en chats directos se avisa al otro
+    try:
+        async with AsyncSessionLocal() as db:
+            state = await mark_read(db, conn.user_id, _id(frame, "mensaje_id", required=True))
+            await db.commit()
+    except (HTTPException, ValueError) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        manager.send_to(conn, {"type": "error", "detail": detail})
+        return
+    if state["peer_id"]:
+        await manager.send([state["peer_id"]], {
+            "type": "read", "mensaje_id": state["ultimo_leido_id"], "usuario_id": conn.user_id
+        })
+
+
+async def handle_react(conn: Connection, frame: dict):
+    # Igual que PUT/DELETE /messages/{mensaje_id}/reactions/{tipo}; el delta llega a todos, también a este socket
+    tipo = frame.get("tipo")
+    add = not frame.get("remove")
+    try:
+        if not isinstance(tipo, str) or not 1 <= len(tipo) <= 50:
+            raise HTTPException(400, "tipo inválido")
+        async with AsyncSessionLocal() as db:
+            summary, targets = await react(db, conn.user_id, _id(frame, "mensaje_id", required=True), tipo, add)
+            await db.commit()
+    except (HTTPException, ValueError) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        manager.send_to(conn, {"type": "error", "detail": detail})
+        return
+    if targets:
+        await broadcast(targets, conn.user_id, summary, tipo, add)
+
+
+HANDLERS = {
+    "send": handle_send,
+    "typing": handle_typing,
+    "read": handle_read,
+    "react": handle_react,
+}
+
+
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(ws: WebSocket, user_id: int):
-    await manager.connect(ws, user_id)
+async def websocket_endpoint(ws: WebSocket, user_id: int, token: str = ""):
+    # Los navegadores no permiten cabeceras en el handshake: el token va en la query
+    try:
+        if decode_access_token(token) != user_id:
+            raise HTTPException(status.HTTP_403_FORBIDDEN)
+    except HTTPException:
+        await ws.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    conn = await manager.connect(ws, user_id)
     try:
         while True:
-            data = await ws.receive_json()
-            # Aquí podrías procesar mensajes entrantes si quisieras
+            try:
+                frame = json.loads(await ws.receive_text())
+            except ValueError:
+                manager.send_to(conn, {"type": "error", "detail": "JSON inválido"})
+                continue
+            handler = HANDLERS.get(frame.get("type")) if isinstance(frame, dict) else None
+            if handler is None:
+                manager.send_to(conn, {"type": "error", "detail": "Tipo de trama desconocido"})
+                continue
+            try:
+                await handler(conn, frame)
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                # Un fallo inesperado (base de datos, broker...) no cierra el socket
+                logger.exception("Fallo al procesar la trama {!r} de {}", frame.get("type"), user_id)
+                manager.send_to(conn, {"type": "error", "client_id": frame.get("client_id"),
+                                       "detail": "Error interno"})
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(ws, user_id)
@@ -22,6 +22,7 @@ class UsuarioOut(UsuarioBase):
     fecha_registro: datetime
     class Config:
         orm_mode = True
+        from_attributes = True
 
 # Amistad
 typing_import = "List[int]"  # helper placeholder
@@ -43,6 +44,7 @@ class AmistadOut(AmistadBase):
     fecha_actualizacion: datetime
     class Config:
         orm_mode = True
+        from_attributes = True
 
 # Grupo
 
@@ -51,6 +53,7 @@ class MiembroOut(BaseModel):
     role: str
     class Config:
         orm_mode = True
+        from_attributes = True
 class GrupoBase(BaseModel):
     nombre: str
     imagen_url: Optional[str]
@@ -70,6 +73,7 @@ class GrupoOut(BaseModel):
     invite_token: str
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class GrupoDetail(GrupoOut):
     miembros: List[MiembroOut]
@@ -77,12 +81,17 @@ class GrupoDetail(GrupoOut):
 
 # Mensaje
 
-class ReaccionOut(BaseModel):
-    usuario_id: int
+# Reacciones agregadas por tipo (reaccion_conteo); mia indica si el usuario
+# autenticado reaccionó con ese tipo
+class ReaccionCount(BaseModel):
     tipo: str
-    fecha: datetime
-    class Config:
-        orm_mode = True
+    total: int
+    mia: bool = False
+
+# PUT / DELETE /messages/{mensaje_id}/reactions/{tipo}
+class ReaccionesOut(BaseModel):
+    mensaje_id: int
+    reacciones: List[ReaccionCount] = []
 
 class MensajeBase(BaseModel):
     emisor_id: int
@@ -101,9 +110,10 @@ class MensajeOut(MensajeBase):
     fecha_envio: datetime
     estado_envio: str
     estado_lectura: str
-    reacciones: List[ReaccionOut] = []
+    reacciones: List[ReaccionCount] = []
     class Config:
         orm_mode = True
+        from_attributes = True
 
 # Contenido
 class ContenidoBase(BaseModel):
@@ -118,8 +128,53 @@ class ContenidoCreate(ContenidoBase):
 
 class ContenidoOut(ContenidoBase):
     id: int
+    archivo_hash: Optional[str] = None
+    archivo_tamano: Optional[int] = None
+    miniatura_estado: Optional[str] = None
+    miniatura_url: Optional[str] = None
     class Config:
         orm_mode = True
+        from_attributes = True
+
+# Listado de mensajes: contenidos embebidos y reacciones agregadas por tipo
+class MensajeDetail(MensajeBase):
+    id: int
+    fecha_envio: datetime
+    estado_envio: str
+    estado_lectura: str
+    contenidos: List[ContenidoOut] = []
+    reacciones: List[ReaccionCount] = []
+
+# Resultado de búsqueda: el mensaje y un fragmento del texto con <mark> en las coincidencias
+class MensajeSearchHit(BaseModel):
+    mensaje_id: int
+    contenido_id: int
+    emisor_id: Optional[int]
+    receptor_id: Optional[int]
+    grupo_id: Optional[int]
+    fecha_envio: datetime
+    snippet: str
+
+
+# Bandeja de entrada: una fila por conversación (chat directo con peer_id o grupo_id)
+class ConversacionOut(BaseModel):
+    peer_id: Optional[int]
+    grupo_id: Optional[int]
+    no_leidos: int
+    ultimo_leido_id: int
+    ultimo_mensaje_id: int
+    emisor_id: Optional[int]
+    fecha_envio: Optional[datetime]
+    texto: Optional[str]
+
+class LecturaIn(BaseModel):
+    mensaje_id: int  # se marca leído todo hasta este mensaje, inclusive
+
+class LecturaOut(BaseModel):
+    peer_id: Optional[int]
+    grupo_id: Optional[int]
+    ultimo_leido_id: int
+    no_leidos: int
 
 
 # Login / Auth
@@ -133,6 +188,9 @@ class LoginOut(BaseModel):
     apellido: str
     email: str
     image_url: str | None
+    access_token: str
+    token_type: str = "bearer"
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+        from_attributes = True
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Búsqueda por texto sobre columnas tsvector con índice GIN.
+
+- prefix_query convierte lo que escribe el usuario en un tsquery de prefijos
+  ("ali gar" -> 'ali':* & 'gar':*), así cada tecla del buscador es una búsqueda
+  por índice en lugar de un ILIKE '%q%' que recorre la tabla entera.
+- Solo se rankean las primeras SEARCH_MAX_CANDIDATES coincidencias por id: con
+  prefijos de una o dos letras hay cientos de miles y calcular ts_rank de todas
+  para quedarse con 10 cuesta cientos de ms. Consultas más específicas tienen
+  menos coincidencias que el tope y se rankean completas. Un índice GIN no
+  entrega las filas por relevancia, así que el tope no se puede mover dentro
+  del recorrido del índice; cuando se alcanza, la respuesta lo indica con
+  X-Search-Truncated: 1 (los resultados son los mejores de esos candidatos, no
+  de todas las coincidencias) y el cliente puede pedir que se afine la búsqueda.
+- Los resultados se ordenan por (score DESC, id ASC); el cursor "score:id" de la
+  última fila permite pedir la página siguiente sin OFFSET.
+- SearchCache guarda unos segundos las páginas ya calculadas: con el debounce
+  del frontend la misma consulta llega varias veces seguidas.
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, status
+from sqlalchemy import Integer, cast, func, select, tuple_
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "15"))
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Letras y dígitos (Unicode); el resto separa palabras y nunca llega a to_tsquery
+_WORD = re.compile(r"[^\W_]+")
+
+
+def prefix_query(q: str) -> str | None:
+    """tsquery de prefijos con todas las palabras de `q`, o None si no tiene ninguna."""
+    words = _WORD.findall(q.lower())
+    if not words:
+        return None
+    return " & ".join(f"{w}:*" for w in words)
+
+
+def candidates(stmt, id_column, limit: int = SEARCH_MAX_CANDIDATES):
+    """CTE con las primeras `limit` coincidencias por id (conjunto estable entre páginas)."""
+    return stmt.order_by(id_column).limit(limit).cte("candidatos")
+
+
+def candidate_count(matches):
+    """
+    Columna escalar con el número de candidatos. Al leer el CTE dos veces
+    Postgres lo materializa: la búsqueda en el índice se hace una sola vez.
+    """
+    return select(func.count()).select_from(matches).scalar_subquery()
+
+
+def truncated(rows: list, limit: int = SEARCH_MAX_CANDIDATES) -> bool:
+    """True si las filas (…, candidatos) vienen de un conjunto de candidatos que llegó al tope."""
+    return bool(rows) and rows[0].candidatos >= limit
+
+
+def score(document, tsquery):
+    """ts_rank escalado a entero: el cursor se compara sin problemas de redondeo de float4."""
+    return cast(func.round(func.ts_rank(document, tsquery) * 1_000_000), Integer)
+
+
+def parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    if cursor is None:
+        return None
+    try:
+        score_value, row_id = cursor.split(":")
+        return int(score_value), int(row_id)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+
+
+def apply_cursor(stmt, rank, id_column, cursor: tuple[int, int] | None, limit: int):
+    """Orden (score DESC, id ASC) y filtro de keyset desde el cursor."""
+    if cursor:
+        score_value, row_id = cursor
+        stmt = stmt.filter(tuple_(-rank, id_column) > tuple_(-score_value, row_id))
+    return stmt.order_by(rank.desc(), id_column).limit(limit)
+
+
+def next_cursor(rows: list, limit: int) -> str | None:
+    """Cursor de la página siguiente a partir de las filas (…, score, id) devueltas."""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return f"{last.score}:{last.id}"
+
+
+class SearchCache:
+    """Páginas de resultados por clave, con TTL corto y expulsión LRU."""
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        entry = self.data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self.data.pop(key, None)
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: tuple, value):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,181 @@
+"""
+Contraseñas y tokens de sesión.
+
+- bcrypt cuesta ~100-250 ms de CPU por llamada; se ejecuta en un pool de procesos
+  dedicado para que un pico de logins no bloquee al resto de endpoints. Si ya hay
+  HASH_MAX_PENDING operaciones en curso se responde 429 en lugar de encolar sin fin.
+- /auth/login emite un JWT firmado; current_user_id lo verifica sin tocar la base
+  de datos, con la clave construida una sola vez y un caché LRU de tokens ya
+  decodificados.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwk, jwt
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+# Con RS256/ES256 JWT_SECRET_KEY es la clave privada (PEM) y JWT_PUBLIC_KEY la pública
+JWT_PUBLIC_KEY = os.getenv("JWT_PUBLIC_KEY")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Al cambiar BCRYPT_ROUNDS los hashes viejos quedan "deprecated" y se rehacen en el siguiente login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+# Funciones de módulo para que el pool de procesos pueda serializarlas
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.pool: ProcessPoolExecutor | None = None
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def stop(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Servidor ocupado, intenta de nuevo",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """(ok, nuevo_hash); nuevo_hash no es None si el hash usa parámetros viejos."""
+        return await self._run(_verify_and_update, password, hashed)
+
+
+hasher = PasswordHasher()
+
+
+# Claves construidas una vez: jose no vuelve a parsear el secreto/PEM en cada petición
+_signing_key = jwk.construct(JWT_SECRET_KEY, JWT_ALGORITHM) if JWT_SECRET_KEY else None
+_verify_key = jwk.construct(JWT_PUBLIC_KEY, JWT_ALGORITHM) if JWT_PUBLIC_KEY else _signing_key
+
+
+def check_keys():
+    """Se llama al arrancar (lifespan): sin clave el servidor no levanta, en vez de fallar en el primer login."""
+    if _signing_key is None:
+        raise RuntimeError("JWT_SECRET_KEY no está definido")
+
+
+def create_access_token(user_id: int) -> str:
+    now = int(time.time())
+    claims = {"sub": str(user_id), "iat": now, "exp": now + JWT_EXPIRE_MINUTES * 60}
+    return jwt.encode(claims, _signing_key, algorithm=JWT_ALGORITHM)
+
+
+class TokenCache:
+    """token -> (user_id, exp) de tokens ya verificados, con expulsión LRU."""
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> int | None:
+        entry = self.data.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user_id, exp = entry
+        if exp <= time.time():
+            del self.data[token]
+            self.misses += 1
+            return None
+        self.data.move_to_end(token)
+        self.hits += 1
+        return user_id
+
+    def set(self, token: str, user_id: int, exp: int):
+        self.data[token] = (user_id, exp)
+        self.data.move_to_end(token)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+def decode_access_token(token: str) -> int:
+    """user_id del token; HTTPException 401 si la firma o la expiración no son válidas."""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        claims = jwt.decode(token, _verify_key, algorithms=[JWT_ALGORITHM])
+        user_id = int(claims["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    token_cache.set(token, user_id, claims["exp"])
+    return user_id
+
+
+bearer = HTTPBearer(auto_error=False)
+
+
+def current_user_id(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> int:
+    """Dependencia: id del usuario autenticado con `Authorization: Bearer <token>`."""
+    if credentials is None:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return decode_access_token(credentials.credentials)
+
+
+def media_user_id(token: str = "", credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> int:
+    """
+    Como current_user_id, pero también acepta ?token=<access_token>: un <img> o
+    <video> no puede mandar Authorization (igual que el handshake del WebSocket).
+    """
+    if credentials is not None:
+        return decode_access_token(credentials.credentials)
+    if not token:
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return decode_access_token(token)
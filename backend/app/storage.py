@@ -0,0 +1,360 @@
+"""
+Almacenamiento de adjuntos por contenido (sha256).
+
+El archivo se recibe por bloques directamente del cuerpo multipart (sin el
+SpooledTemporaryFile de UploadFile), se hashea mientras se escribe y, al
+terminar, queda bajo la clave ab/cd/<sha256>. Si la clave ya existe (un
+adjunto reenviado) se descarta la copia: cada archivo se guarda una sola vez.
+
+- LocalStorage (por defecto): directorio STORAGE_DIR.
+- S3Storage: bucket S3 compatible (MinIO en local) con subida multiparte.
+
+Se elige con STORAGE_BACKEND=local|s3. UPLOAD_MAX_BYTES se comprueba a medida
+que llegan los bytes: un archivo demasiado grande se corta con 413 sin
+terminar de recibirlo.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")
+# Detrás de nginx: prefijo de un location `internal` con alias a STORAGE_DIR. La
+# respuesta lleva X-Accel-Redirect y nginx envía el archivo con sendfile:
+#   location /_uploads/ { internal; alias /app/uploads/; }
+STORAGE_ACCEL_REDIRECT = os.getenv("STORAGE_ACCEL_REDIRECT", "")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Bloque que se escribe (y hashea) de una vez en un hilo, fuera del event loop
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://minio:9000")
+S3_BUCKET = os.getenv("S3_BUCKET", "chatat")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "minioadmin")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Vigencia de las URLs firmadas a las que redirige GET /content/file/{id}
+S3_URL_EXPIRES = int(os.getenv("S3_URL_EXPIRES", "3600"))
+
+
+def storage_key(digest: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class LocalStorage:
+    """Archivos en disco; la copia temporal se publica con os.link, que falla si la clave ya existe."""
+    chunk_size = UPLOAD_CHUNK_SIZE
+
+    def __init__(self, root: str = STORAGE_DIR):
+        self.root = os.path.abspath(root)
+
+    async def start(self):
+        # Al arrancar y no al importar: importar la app (tests, benchmarks) no crea directorios
+        await asyncio.to_thread(os.makedirs, os.path.join(self.root, "tmp"), exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @contextmanager
+    def local_file(self, key: str):
+        yield self.path(key)
+
+    def response(self, key: str, media_type: str | None, headers: dict) -> Response:
+        """
+        Respuesta para descargar `key`. Sin STORAGE_ACCEL_REDIRECT la sirve
+        FileResponse (Range/If-Range incluidos; con servidores ASGI que soportan
+        http.response.pathsend el envío completo tampoco pasa por Python).
+        """
+        if STORAGE_ACCEL_REDIRECT:
+            return Response(media_type=media_type or "application/octet-stream",
+                            headers={**headers, "X-Accel-Redirect": f"{STORAGE_ACCEL_REDIRECT}/{key}"})
+        return FileResponse(self.path(key), media_type=media_type, headers=headers,
+                            content_disposition_type="inline")
+
+    def begin(self):
+        tmp = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        return tmp, open(tmp, "wb")
+
+    def put(self, handle, chunk: bytes):
+        handle[1].write(chunk)
+
+    def finish(self, handle, last: bytes, key: str) -> bool:
+        tmp, f = handle
+        try:
+            f.write(last)
+            f.close()
+            final = self.path(key)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            try:
+                os.link(tmp, final)
+            except FileExistsError:
+                return False
+            return True
+        finally:
+            os.unlink(tmp)
+
+    def abort(self, handle):
+        tmp, f = handle
+        f.close()
+        os.unlink(tmp)
+
+
+class S3Storage:
+    """
+    Bucket S3 compatible. Como el hash se conoce al final, los bloques se suben
+    como multiparte a tmp/<uuid> y al terminar se copian (en el servidor) a la
+    clave definitiva si no existía. Un archivo de un solo bloque va directo.
+    """
+    # S3 exige partes de al menos 5 MiB salvo la última
+    chunk_size = max(UPLOAD_CHUNK_SIZE, 8 * 1024 * 1024)
+
+    def __init__(self, bucket: str = S3_BUCKET, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client(
+                "s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION,
+                aws_access_key_id=S3_ACCESS_KEY, aws_secret_access_key=S3_SECRET_KEY,
+            )
+        self.s3 = client
+        self.bucket = bucket
+
+    async def start(self):
+        await asyncio.to_thread(self._ensure_bucket)
+
+    def _ensure_bucket(self):
+        # MinIO arranca vacío: el bucket se crea la primera vez
+        from botocore.exceptions import ClientError
+        try:
+            self.s3.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.s3.create_bucket(Bucket=self.bucket)
+
+    def response(self, key: str, media_type: str | None, headers: dict) -> Response:
+        """Redirección a una URL firmada: el bucket atiende Range y los bytes no pasan por aquí."""
+        params = {"Bucket": self.bucket, "Key": key}
+        if media_type:
+            params["ResponseContentType"] = media_type
+        if "Content-Disposition" in headers:
+            params["ResponseContentDisposition"] = headers["Content-Disposition"]
+        url = self.s3.generate_presigned_url("get_object", Params=params, ExpiresIn=S3_URL_EXPIRES)
+        # La URL caduca: la redirección no puede guardarse como el archivo
+        headers = {**headers, "Cache-Control": f"private, max-age={S3_URL_EXPIRES // 2}"}
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers)
+
+    @contextmanager
+    def local_file(self, key: str):
+        """Copia temporal en disco, para herramientas que necesitan una ruta (Pillow, ffmpeg)."""
+        with tempfile.NamedTemporaryFile() as tmp:
+            self.s3.download_fileobj(self.bucket, key, tmp)
+            tmp.flush()
+            yield tmp.name
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def begin(self):
+        return {"key": f"tmp/{uuid.uuid4().hex}", "upload_id": None, "parts": []}
+
+    def put(self, handle, chunk: bytes):
+        if handle["upload_id"] is None:
+            handle["upload_id"] = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=handle["key"]
+            )["UploadId"]
+        number = len(handle["parts"]) + 1
+        etag = self.s3.upload_part(
+            Bucket=self.bucket, Key=handle["key"], UploadId=handle["upload_id"],
+            PartNumber=number, Body=chunk,
+        )["ETag"]
+        handle["parts"].append({"ETag": etag, "PartNumber": number})
+
+    def finish(self, handle, last: bytes, key: str) -> bool:
+        if handle["upload_id"] is None:
+            if self.exists(key):
+                return False
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=last)
+            return True
+        if last:
+            self.put(handle, last)
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=handle["key"], UploadId=handle["upload_id"],
+            MultipartUpload={"Parts": handle["parts"]},
+        )
+        try:
+            if self.exists(key):
+                return False
+            self.s3.copy_object(Bucket=self.bucket, Key=key,
+                                CopySource={"Bucket": self.bucket, "Key": handle["key"]})
+            return True
+        finally:
+            self.s3.delete_object(Bucket=self.bucket, Key=handle["key"])
+
+    def abort(self, handle):
+        if handle["upload_id"] is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=handle["key"], UploadId=handle["upload_id"])
+
+
+@dataclass
+class StoredFile:
+    key: str
+    sha256: str
+    size: int
+    filename: str
+    content_type: str | None
+    created: bool       # False si ya estaba guardado (deduplicado)
+
+
+class Upload:
+    """Un archivo en curso: acumula UPLOAD_CHUNK_SIZE bytes y los hashea y escribe en un hilo."""
+
+    def __init__(self, storage, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+        self.handle = None
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"El archivo supera {self.max_bytes} bytes")
+        self.buffer += data
+        if len(self.buffer) >= self.storage.chunk_size:
+            chunk = bytes(self.buffer)
+            self.buffer.clear()
+            await asyncio.to_thread(self._put, chunk)
+
+    def _put(self, chunk: bytes):
+        # hashlib libera el GIL con bloques grandes: hash y escritura corren en el mismo hilo
+        if self.handle is None:
+            self.handle = self.storage.begin()
+        self.sha.update(chunk)
+        self.storage.put(self.handle, chunk)
+
+    def _finish(self, last: bytes) -> tuple[str, bool]:
+        handle, self.handle = self.handle or self.storage.begin(), None
+        self.sha.update(last)
+        digest = self.sha.hexdigest()
+        # finish limpia la copia temporal también si falla: ya no hay nada que abortar
+        return digest, self.storage.finish(handle, last, storage_key(digest))
+
+    async def finish(self) -> tuple[str, bool]:
+        last = bytes(self.buffer)
+        self.buffer.clear()
+        return await asyncio.to_thread(self._finish, last)
+
+    async def abort(self):
+        if self.handle is not None:
+            await asyncio.to_thread(self.storage.abort, self.handle)
+
+
+async def save_bytes(data: bytes) -> str:
+    """Guarda un archivo generado en el servidor (p. ej. una miniatura) y devuelve su sha256."""
+    upload = Upload(storage, max_bytes=len(data))
+    await upload.write(data)
+    digest, _ = await upload.finish()
+    return digest
+
+
+async def receive_file(request: Request, field: str = "file", max_bytes: int = UPLOAD_MAX_BYTES) -> StoredFile:
+    """
+    Lee el cuerpo multipart/form-data de `request` y guarda la parte `field`
+    a medida que llega. El resto de partes se ignora.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Se espera multipart/form-data")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes + 64 * 1024:
+        # Margen para las cabeceras multipart; el límite exacto se aplica al recibir
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"El archivo supera {max_bytes} bytes")
+
+    part = {"headers": {}, "field": b"", "value": b""}
+    found: dict = {}
+    pending: list[bytes] = []
+
+    def on_part_begin():
+        part.update(headers={}, field=b"", value=b"", file=False)
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if disposition.get(b"name") == field.encode() and b"filename" in disposition and not found:
+            part["file"] = True
+            found["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+            found["content_type"] = part["headers"].get(b"content-type", b"").decode("latin-1") or None
+
+    def on_part_data(data, start, end):
+        if part.get("file"):
+            pending.append(data[start:end])
+
+    def on_part_end():
+        if part.get("file"):
+            found["complete"] = True
+            part["file"] = False
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    upload = Upload(storage, max_bytes)
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Cuerpo multipart inválido")
+            for data in pending:
+                await upload.write(data)
+            pending.clear()
+        parser.finalize()
+        if not found.get("complete"):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=f"Falta el archivo '{field}'")
+        digest, created = await upload.finish()
+    except BaseException:
+        await upload.abort()
+        raise
+    return StoredFile(
+        key=storage_key(digest), sha256=digest, size=upload.size,
+        filename=found["filename"], content_type=found["content_type"], created=created,
+    )
+
+
+def create_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+storage = create_storage()
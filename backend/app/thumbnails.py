@@ -0,0 +1,193 @@
+"""
+Miniaturas de imágenes y videos adjuntos, fuera de las peticiones.
+
+La cola es la propia tabla contenido: upload_content deja las imágenes y videos
+con miniatura_estado='pendiente' y avisa al Thumbnailer. Este reclama lotes con
+FOR UPDATE SKIP LOCKED (varios workers no se pisan), genera un JPEG de
+THUMB_SIZE px en su propio pool de procesos (Pillow; el primer fotograma de un
+video sale de ffmpeg), lo guarda en app.storage y avisa por WebSocket a los
+participantes del mensaje:
+
+  {"type": "preview", "contenido_id": n, "mensaje_id": n, "miniatura_url": "..."}
+
+Como el estado está en la base, lo pendiente sobrevive a un reinicio; además se
+revisa la cola cada THUMB_POLL_SECONDS por si el aviso llegó a otro proceso.
+Una fila que lleva más de THUMB_STUCK_SECONDS en 'procesando' (el proceso murió
+o no pudo guardar el resultado) se vuelve a reclamar; generar dos veces es inocuo.
+"""
+import asyncio
+import io
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from loguru import logger
+from sqlalchemy import and_, func, or_, select, update
+
+from app import models
+from app.connections import manager
+from app.database import AsyncSessionLocal
+from app.membership import membership_cache
+from app.response_cache import response_cache
+from app.storage import storage, storage_key, save_bytes
+
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+THUMB_SIZE = int(os.getenv("THUMB_SIZE", "320"))
+THUMB_BATCH = int(os.getenv("THUMB_BATCH", "8"))
+THUMB_POLL_SECONDS = float(os.getenv("THUMB_POLL_SECONDS", "30"))
+THUMB_STUCK_SECONDS = float(os.getenv("THUMB_STUCK_SECONDS", "600"))
+
+
+def wants_thumbnail(tipo_archivo: str | None) -> bool:
+    return bool(tipo_archivo) and tipo_archivo.startswith(("image/", "video/"))
+
+
+def _render(path: str, tipo_archivo: str, size: int) -> bytes:
+    # Corre en el pool de procesos: decodificar y escalar no compite con el event loop
+    from PIL import Image, ImageOps
+
+    source = path
+    if tipo_archivo.startswith("video/"):
+        frame = subprocess.run(
+            ["ffmpeg", "-v", "error", "-i", path, "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-"],
+            capture_output=True, check=True, timeout=60,
+        ).stdout
+        source = io.BytesIO(frame)
+    with Image.open(source) as image:
+        # JPEG: decodifica directamente a una escala cercana en lugar de a tamaño completo
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+
+class Thumbnailer:
+    def __init__(self, workers: int = THUMB_WORKERS, batch: int = THUMB_BATCH,
+                 stuck_seconds: float = THUMB_STUCK_SECONDS):
+        self.n_workers = workers
+        self.batch = batch
+        self.stuck_after = timedelta(seconds=stuck_seconds)
+        self.pool: ProcessPoolExecutor | None = None
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        # Métricas
+        self.done = 0
+        self.failed = 0
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.n_workers)
+        # Lo que quedó a medias en un reinicio vuelve a la cola; generar dos veces es inocuo
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.Contenido)
+                    .filter(models.Contenido.miniatura_estado == "procesando")
+                    .values(miniatura_estado="pendiente")
+            )
+            await db.commit()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def _claim(self) -> list:
+        C = models.Contenido
+        # Ambos casos salen del índice parcial idx_contenido_miniatura_cola
+        stuck = and_(C.miniatura_estado == "procesando",
+                     C.miniatura_reclamada < func.localtimestamp() - self.stuck_after)
+        pending = (
+            select(C.id)
+                .filter(or_(C.miniatura_estado == "pendiente", stuck))
+                .order_by(C.id)
+                .limit(self.batch)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                update(C)
+                    .filter(C.id.in_(pending))
+                    .values(miniatura_estado="procesando", miniatura_reclamada=func.localtimestamp())
+                    .returning(C.id, C.mensaje_id, C.fecha_envio, C.archivo_hash, C.tipo_archivo)
+                    .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return rows
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                rows = await self._claim()
+            except Exception:
+                logger.exception("No se pudo leer la cola de miniaturas")
+                rows = []
+            if rows:
+                await asyncio.gather(*(self._process(row) for row in rows))
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), THUMB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _render_stored(self, key: str, tipo_archivo: str) -> bytes:
+        # En un hilo: con S3 primero hay que bajar el original a un archivo temporal
+        with storage.local_file(key) as path:
+            return self.pool.submit(_render, path, tipo_archivo, THUMB_SIZE).result()
+
+    async def _process(self, row):
+        try:
+            data = await asyncio.to_thread(self._render_stored, storage_key(row.archivo_hash), row.tipo_archivo)
+            digest = await save_bytes(data)
+        except Exception:
+            self.failed += 1
+            logger.exception("No se pudo generar la miniatura del contenido {}", row.id)
+            values = {"miniatura_estado": "error"}
+        else:
+            self.done += 1
+            values = {"miniatura_estado": "lista", "miniatura_hash": digest,
+                      "miniatura_url": f"/content/file/{row.id}/miniatura"}
+        try:
+            await self._save(row, values)
+        except Exception:
+            # Si no llegó a guardarse, la fila sigue en 'procesando' y se reclama
+            # pasado THUMB_STUCK_SECONDS; el resto del lote y la tarea siguen
+            logger.exception("No se pudo guardar la miniatura del contenido {}", row.id)
+
+    async def _save(self, row, values: dict):
+        C = models.Contenido
+        async with AsyncSessionLocal() as db:
+            # Con fecha_envio la actualización va directa a la partición del contenido
+            await db.execute(update(C).filter(C.id == row.id, C.fecha_envio == row.fecha_envio).values(**values))
+            await db.commit()
+            await response_cache.bump(f"content:{row.mensaje_id}")
+            if values["miniatura_estado"] == "lista":
+                await self._notify_participants(db, row, values["miniatura_url"])
+
+    async def _notify_participants(self, db, row, url: str):
+        msg = (await db.execute(
+            select(models.Mensaje.emisor_id, models.Mensaje.receptor_id, models.Mensaje.grupo_id)
+                .filter(models.Mensaje.id == row.mensaje_id, models.Mensaje.fecha_envio == row.fecha_envio)
+        )).first()
+        if msg is None:
+            return
+        if msg.grupo_id is not None:
+            targets = await membership_cache.member_ids(db, msg.grupo_id)
+        else:
+            targets = [uid for uid in (msg.emisor_id, msg.receptor_id) if uid]
+        await manager.send(list(targets), {
+            "type": "preview", "contenido_id": row.id, "mensaje_id": row.mensaje_id, "miniatura_url": url
+        })
+
+
+thumbnailer = Thumbnailer()
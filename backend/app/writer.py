@@ -0,0 +1,262 @@
+"""
+Escritura de mensajes nuevos.
+
+check_destination / new_message / integrity_detail los comparten POST /messages/
+y el WebSocket.
+MessageWriter (write-behind) agrupa los envíos que llegan durante unos pocos
+milisegundos y los guarda con un INSERT multi-fila de mensaje y otro de
+contenido en una sola transacción; cada emisor recibe su mensaje (con id del
+servidor) cuando el lote hace commit. El WebSocket siempre lo usa; POST
+/messages/ solo con MESSAGE_WRITE_BEHIND=1.
+
+La cola admite WRITER_MAX_PENDING mensajes; con la base de datos atascada,
+los envíos siguientes reciben 503 en lugar de acumularse en memoria. Al apagar
+se guarda lo encolado (hasta drain_timeout segundos); lo que no alcanza recibe
+503 en lugar de quedar esperando.
+"""
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException, status
+from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import schemas, models
+from app.database import AsyncSessionLocal
+from app.dispatcher import dispatcher
+from app.membership import membership_cache
+
+WRITER_MAX_BATCH = int(os.getenv("WRITER_MAX_BATCH", "100"))
+WRITER_MAX_DELAY_MS = float(os.getenv("WRITER_MAX_DELAY_MS", "5"))
+WRITER_MAX_PENDING = int(os.getenv("WRITER_MAX_PENDING", "10000"))
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "0") == "1"
+
+# Violaciones de FK del INSERT -> mensaje de error; la BD valida en la misma
+# transacción en lugar de un SELECT previo por cada referencia
+FK_ERRORS = {
+    "mensaje_emisor_id_fkey": "Emisor no existe",
+    "mensaje_receptor_id_fkey": "Receptor no existe",
+    "mensaje_grupo_id_fkey": "Grupo no existe",
+}
+
+
+async def check_destination(db, msg: schemas.MensajeCreate):
+    """400 si el mensaje no tiene exactamente un destino; 403 si el emisor no es miembro del grupo."""
+    if bool(msg.receptor_id) == bool(msg.grupo_id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Debes proporcionar receptor_id o grupo_id, no ambos")
+    if msg.grupo_id and msg.emisor_id not in await membership_cache.member_ids(db, msg.grupo_id):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="No eres miembro del grupo")
+
+
+def new_message(msg: schemas.MensajeCreate) -> models.Mensaje:
+    new = models.Mensaje(
+        emisor_id=msg.emisor_id,
+        receptor_id=msg.receptor_id,
+        grupo_id=msg.grupo_id,
+        reply_to_id=msg.reply_to_id,
+        estado_envio="enviado",
+        estado_lectura="no_leído",
+        reacciones=[]  # mensaje nuevo: evita un lazy load al serializar
+    )
+    # Si viene texto, el contenido se inserta en la misma transacción
+    if msg.texto:
+        new.contenidos.append(models.Contenido(tipo_contenido="texto", texto=msg.texto))
+    return new
+
+
+def integrity_detail(e: IntegrityError) -> HTTPException:
+    """HTTPException 404 para una FK rota conocida; si no lo es, se relanza el error."""
+    detail = next((d for fk, d in FK_ERRORS.items() if fk in str(e.orig)), None)
+    if detail is None:
+        raise e
+    return HTTPException(status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class MessageWriter:
+    def __init__(self, max_batch: int = WRITER_MAX_BATCH, max_delay_ms: float = WRITER_MAX_DELAY_MS,
+                 max_pending: int = WRITER_MAX_PENDING, drain_timeout: float = 10.0):
+        self.max_batch = max_batch
+        self.drain_timeout = drain_timeout
+        self.closing = False
+        # Lote que se está guardando, para responder a sus emisores si el apagado lo corta
+        self.inflight: list[tuple[schemas.MensajeCreate, asyncio.Future]] = []
+        self.max_delay = max_delay_ms / 1000
+        self.queue: asyncio.Queue[tuple[schemas.MensajeCreate, asyncio.Future]] = asyncio.Queue(maxsize=max_pending)
+        self.worker: asyncio.Task | None = None
+        # Métricas
+        self.rejected = 0
+        self.batches = 0
+        self.messages = 0
+        self.max_batch_size = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    async def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.closing = True
+        if self.worker:
+            try:
+                await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Se cierra con {} mensajes sin guardar", self.queue.qsize() + len(self.inflight))
+            self.worker.cancel()
+        pending = list(self.inflight)
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, fut in pending:
+            if not fut.done():
+                fut.set_exception(self._busy())
+
+    @staticmethod
+    def _busy() -> HTTPException:
+        return HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo",
+            headers={"Retry-After": "1"},
+        )
+
+    async def write(self, msg: schemas.MensajeCreate) -> dict:
+        """Encola el mensaje y espera al commit de su lote; devuelve el MensajeOut."""
+        if self.closing:
+            raise self._busy()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((msg, fut))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise self._busy()
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.inflight = batch
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.exception("Fallo al guardar un lote de {} mensajes", len(batch))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            finally:
+                self.inflight = []
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            try:
+                rows = await self._insert(db, [msg for msg, _ in batch])
+                await db.commit()
+            except IntegrityError as e:
+                await db.rollback()
+                if len(batch) == 1:
+                    batch[0][1].set_exception(integrity_detail(e))
+                    return
+                # Una FK rota no debe tumbar al resto del lote: se reintenta uno a uno
+                for item in batch:
+                    await self._flush_one(item)
+                return
+        for (_, fut), message_data in zip(batch, rows):
+            self._done(message_data, fut)
+        self._record(len(batch), time.perf_counter() - start)
+
+    async def _flush_one(self, item):
+        msg, fut = item
+        async with AsyncSessionLocal() as db:
+            try:
+                [message_data] = await self._insert(db, [msg])
+                await db.commit()
+            except IntegrityError as e:
+                await db.rollback()
+                try:
+                    error = integrity_detail(e)
+                except IntegrityError:
+                    # Otra restricción: falla solo este mensaje, el resto del lote sigue
+                    logger.exception("Mensaje rechazado por la base de datos")
+                    error = e
+                if not fut.done():
+                    fut.set_exception(error)
+                return
+        self._done(message_data, fut)
+
+    async def _insert(self, db, msgs: list[schemas.MensajeCreate]) -> list[dict]:
+        """Dos sentencias por lote (mensaje y contenido) sin pasar por el unit of work del ORM."""
+        result = await db.execute(
+            insert(models.Mensaje).returning(
+                models.Mensaje.id, models.Mensaje.fecha_envio, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "emisor_id": m.emisor_id,
+                    "receptor_id": m.receptor_id,
+                    "grupo_id": m.grupo_id,
+                    "reply_to_id": m.reply_to_id,
+                    "estado_envio": "enviado",
+                    "estado_lectura": "no_leído",
+                }
+                for m in msgs
+            ]
+        )
+        inserted = result.all()
+        contenidos = [
+            {"mensaje_id": mensaje_id, "fecha_envio": fecha_envio, "tipo_contenido": "texto", "texto": m.texto}
+            for m, (mensaje_id, fecha_envio) in zip(msgs, inserted) if m.texto
+        ]
+        if contenidos:
+            await db.execute(insert(models.Contenido), contenidos)
+        return [
+            schemas.MensajeOut(
+                id=mensaje_id,
+                emisor_id=m.emisor_id,
+                receptor_id=m.receptor_id,
+                grupo_id=m.grupo_id,
+                reply_to_id=m.reply_to_id,
+                fecha_envio=fecha_envio,
+                estado_envio="enviado",
+                estado_lectura="no_leído",
+            ).dict()
+            for m, (mensaje_id, fecha_envio) in zip(msgs, inserted)
+        ]
+
+    def _done(self, message_data: dict, fut: asyncio.Future):
+        if not fut.done():
+            fut.set_result(message_data)
+        dispatcher.submit(message_data)
+
+    def _record(self, size: int, seconds: float):
+        self.batches += 1
+        self.messages += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.flush_seconds += seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "avg_batch_size": self.messages / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_ms": self.flush_seconds / self.batches * 1000 if self.batches else 0.0,
+            "max_flush_ms": self.max_flush_seconds * 1000,
+            "pending": self.queue.qsize(),
+            "rejected": self.rejected,
+        }
+
+
+writer = MessageWriter()
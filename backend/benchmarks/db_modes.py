@@ -0,0 +1,95 @@
+"""
+Benchmark de carga: acceso síncrono (psycopg2 + threadpool) vs asíncrono (asyncpg).
+
+Simula N peticiones concurrentes que ejecutan la misma consulta que
+GET /messages/ contra el Postgres local configurado en .env.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.db_modes --requests 5000 --concurrency 1000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.database import SessionLocal, AsyncSessionLocal, engine, async_engine
+
+
+def _query(group_id: int):
+    return (
+        select(models.Mensaje)
+            .options(selectinload(models.Mensaje.reacciones))
+            .filter(models.Mensaje.grupo_id == group_id)
+            .order_by(models.Mensaje.fecha_envio)
+    )
+
+
+def _sync_request(group_id: int):
+    db = SessionLocal()
+    try:
+        return db.scalars(_query(group_id)).all()
+    finally:
+        db.close()
+
+
+async def sync_mode(group_id: int):
+    # Igual que un handler `def`: se ejecuta en el threadpool de AnyIO (40 hilos)
+    await run_in_threadpool(_sync_request, group_id)
+
+
+async def async_mode(group_id: int):
+    async with AsyncSessionLocal() as db:
+        (await db.scalars(_query(group_id))).all()
+
+
+async def run(mode, total: int, concurrency: int, group_id: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await mode(group_id)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]):
+    lat = sorted(latencies)
+    q = statistics.quantiles(lat, n=100)
+    print(
+        f"{name:<6} {len(lat) / elapsed:>9.1f} req/s  "
+        f"p50={q[49] * 1000:.1f}ms  p95={q[94] * 1000:.1f}ms  p99={q[98] * 1000:.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--group-id", type=int, default=1)
+    args = parser.parse_args()
+
+    # Sin logging de SQL para no medir stdout
+    engine.echo = False
+    async_engine.echo = False
+
+    for name, mode in (("sync", sync_mode), ("async", async_mode)):
+        await run(mode, 50, 10, args.group_id)  # calentar el pool
+        elapsed, latencies = await run(mode, args.requests, args.concurrency, args.group_id)
+        report(name, elapsed, latencies)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
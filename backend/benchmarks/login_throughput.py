@@ -0,0 +1,70 @@
+"""
+Benchmark de POST /auth/login: logins/s totales y por núcleo del pool de bcrypt,
+y cuántas peticiones se rechazaron con 429 por saturación.
+
+Usa los usuarios de database/inserts.sql (contraseña "prueba123").
+HASH_WORKERS, HASH_MAX_PENDING y BCRYPT_ROUNDS se toman del entorno.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.login_throughput --requests 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.database import engine, async_engine
+from app.security import hasher
+
+EMAILS = [
+    "alice.garcia@example.com",
+    "bob.martinez@example.com",
+    "carolina.lopez@example.com",
+    "diego.fernandez@example.com",
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--password", default="prueba123")
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, codes = [], {}
+
+    async def one(client: httpx.AsyncClient, i: int):
+        async with sem:
+            start = time.perf_counter()
+            r = await client.post("/auth/login", json={"email": EMAILS[i % len(EMAILS)], "password": args.password})
+            codes[r.status_code] = codes.get(r.status_code, 0) + 1
+            if r.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await asyncio.gather(*(one(client, i) for i in range(hasher.workers)))  # arrancar procesos
+            latencies.clear(), codes.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(one(client, i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - start
+
+    ok = codes.get(200, 0)
+    q = statistics.quantiles(sorted(latencies), n=100) if len(latencies) > 1 else [0] * 99
+    print(f"workers={hasher.workers} max_pending={hasher.max_pending} códigos={codes}")
+    print(
+        f"{ok / elapsed:.1f} logins/s  {ok / elapsed / hasher.workers:.1f} logins/s por núcleo  "
+        f"p50={q[49] * 1000:.1f}ms  p99={q[98] * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
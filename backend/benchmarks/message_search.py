@@ -0,0 +1,135 @@
+"""
+Benchmark de GET /messages/search sobre un historial grande.
+
+--seed N crea 2000 usuarios y 100 grupos de 20 miembros sintéticos
+(email *@bench.example.com, grupos "bench …") y N mensajes con su contenido de
+texto: la mitad directos y la mitad de grupo. Los textos mezclan palabras
+frecuentes (cada una en ~1 de cada 5 mensajes) con un término raro por mensaje.
+Pensado para una base de pruebas: borrar millones de mensajes es más lento que
+recrearla desde database/init.sql, así que el seed no se limpia.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.message_search --seed 3000000
+python -m benchmarks.message_search            # repetir sobre los mismos datos
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.main import app
+from app.database import engine, async_engine
+from app.security import create_access_token
+
+USERS = 2000
+GROUPS = 100
+GROUP_SIZE = 20
+
+PALABRAS = [
+    "hola", "mañana", "reunión", "proyecto", "playa", "perro", "gato", "comida", "cena", "fiesta",
+    "trabajo", "oficina", "correo", "llamada", "viaje", "avión", "tren", "hotel", "película", "serie",
+    "partido", "fútbol", "música", "concierto", "libro", "examen", "clase", "profesor", "tarea", "código",
+    "servidor", "error", "despliegue", "cliente", "factura", "pago", "banco", "cumpleaños", "regalo", "foto",
+]
+
+SEED_SQL = [
+    text("""
+        INSERT INTO usuario (nombre, apellido, email)
+        SELECT 'Bench', 'Usuario' || i, 'bench' || i || '@bench.example.com'
+        FROM generate_series(1, :users) AS i
+    """),
+    text("""
+        INSERT INTO grupo (nombre, creador_id)
+        SELECT 'bench ' || i, (SELECT min(id) FROM usuario WHERE email LIKE '%@bench.example.com')
+        FROM generate_series(1, :groups) AS i
+    """),
+    text("""
+        INSERT INTO pertenece (grupo_id, usuario_id, role)
+        SELECT g.id, u.id, 'member'
+        FROM (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM grupo WHERE nombre LIKE 'bench %') g
+        JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM usuario WHERE email LIKE '%@bench.example.com') u
+          ON u.n / :group_size = g.n
+    """),
+    text("""
+        INSERT INTO mensaje (emisor_id, receptor_id, grupo_id, fecha_envio, estado_envio, estado_lectura)
+        SELECT
+            CASE WHEN i % 2 = 0 THEN u0 + (i * 7919) % :users
+                 ELSE u0 + (i / 2 % :groups) * :group_size + i % :group_size END,
+            CASE WHEN i % 2 = 0 THEN u0 + (i / 2 * 104729) % :users END,
+            CASE WHEN i % 2 = 1 THEN g0 + i / 2 % :groups END,
+            now() - make_interval(secs => :total - i),
+            'enviado', 'leído'
+        FROM generate_series(1, CAST(:total AS bigint)) AS i,
+             (SELECT min(id) AS u0 FROM usuario WHERE email LIKE '%@bench.example.com') u,
+             (SELECT min(id) AS g0 FROM grupo WHERE nombre LIKE 'bench %') g
+    """),
+    text("""
+        INSERT INTO contenido (mensaje_id, tipo_contenido, texto)
+        SELECT m.id, 'texto', (
+            SELECT string_agg(w[1 + abs(hashint8(m.id * 16 + k)) % cardinality(w)], ' ')
+            FROM generate_series(1, 6 + m.id % 6) AS k
+        ) || ' clave' || m.id
+        FROM mensaje m, (SELECT CAST(:palabras AS text[]) AS w) p
+        WHERE m.emisor_id >= (SELECT min(id) FROM usuario WHERE email LIKE '%@bench.example.com')
+    """),
+]
+
+def report(name: str, latencies: list[float]):
+    q = statistics.quantiles(sorted(latencies), n=100)
+    print(f"{name:<14} p50={q[49] * 1000:8.2f}ms  p95={q[94] * 1000:8.2f}ms  p99={q[98] * 1000:8.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="mensajes sintéticos a insertar")
+    parser.add_argument("--requests", type=int, default=200, help="búsquedas por escenario")
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+
+    params = {"users": USERS, "groups": GROUPS, "group_size": GROUP_SIZE,
+              "total": args.seed, "palabras": PALABRAS}
+    async with async_engine.begin() as conn:
+        if args.seed:
+            start = time.perf_counter()
+            for stmt in SEED_SQL:
+                await conn.execute(stmt, params)
+            await conn.execute(text("ANALYZE usuario, grupo, pertenece, mensaje, contenido"))
+            print(f"seed: {args.seed} mensajes en {time.perf_counter() - start:.1f}s")
+        user_ids = (await conn.scalars(
+            text("SELECT id FROM usuario WHERE email LIKE '%@bench.example.com' ORDER BY id")
+        )).all()
+        total = await conn.scalar(text("SELECT count(*) FROM contenido"))
+    print(f"contenido: {total} filas")
+    if not user_ids:
+        print("No hay datos sintéticos: ejecutar con --seed N")
+        return
+
+    rng = random.Random(42)
+    scenarios = {
+        "frecuente": lambda: {"q": rng.choice(PALABRAS)},
+        "dos palabras": lambda: {"q": " ".join(rng.sample(PALABRAS, 2))},
+        "rara": lambda: {"q": f"clave{rng.randrange(1, args.seed or total)}"},
+        "conversación": lambda: {"q": rng.choice(PALABRAS), "with_user": rng.choice(user_ids)},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, make_params in scenarios.items():
+                latencies = []
+                for _ in range(args.requests):
+                    token = create_access_token(rng.choice(user_ids))
+                    start = time.perf_counter()
+                    r = await client.get("/messages/search", params=make_params(),
+                                         headers={"Authorization": f"Bearer {token}"})
+                    latencies.append(time.perf_counter() - start)
+                    r.raise_for_status()
+                report(name, latencies)
+
+if __name__ == "__main__":
+    asyncio.run(main())
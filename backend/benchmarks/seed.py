@@ -0,0 +1,176 @@
+"""
+Datos sintéticos a escala para benchmarks.suite, generados en Postgres con
+INSERT ... SELECT generate_series (nada pasa por Python fila a fila):
+
+- usuarios: email bench.<i>@bench.example.com y contraseña BENCH_PASSWORD.
+- grupos: nombre 'bench grupo <i>' con --members miembros cada uno.
+- mensajes: --group-pct % a grupos y el resto repartido entre --conversations
+  chats directos, alternando quién escribe; fechas crecientes a lo largo de
+  --days días y un contenido de texto por mensaje. Antes se crean las
+  particiones mensuales que falten para ese rango.
+
+Los mensajes se insertan en lotes de --batch filas, cada lote en su propia
+transacción, así que los triggers (conversacion_estado, texto_busqueda) y los
+índices trabajan igual que en producción. Todo lo sintético se reconoce por
+el dominio del email y el prefijo del grupo; --reset lo borra antes de sembrar.
+
+Ejecutar ubicado en backend/ (la escala completa tarda bastante):
+python -m benchmarks.seed --users 100000 --groups 10000 --messages 10000000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.database import async_engine
+from app.security import pwd_context
+from benchmarks.user_search import APELLIDOS, NOMBRES
+
+BENCH_DOMAIN = "@bench.example.com"
+BENCH_GROUP_PREFIX = "bench grupo "
+BENCH_PASSWORD = "bench-password"
+
+PALABRAS = ["hola", "reunión", "mañana", "proyecto", "informe", "llamada", "café", "viaje", "cumpleaños",
+            "partido", "película", "cena", "oficina", "entrega", "revisión", "presupuesto", "cliente",
+            "diseño", "servidor", "fotos", "playa", "lunes", "viernes", "tarde", "noche", "gracias",
+            "perfecto", "luego", "urgente", "documento"]
+
+USERS_SQL = text("""
+    INSERT INTO usuario (nombre, apellido, email, contrasena_hash)
+    SELECT (CAST(:nombres AS text[]))[1 + i % cardinality(CAST(:nombres AS text[]))],
+           (CAST(:apellidos AS text[]))[1 + (i / cardinality(CAST(:nombres AS text[]))) % cardinality(CAST(:apellidos AS text[]))],
+           'bench.' || i || :domain,
+           :hash
+    FROM generate_series(0, :users - 1) AS i
+""")
+
+GROUPS_SQL = text("""
+    INSERT INTO grupo (nombre, creador_id)
+    SELECT :prefix || g, :u0 + (g * :members) % :users
+    FROM generate_series(0, :groups - 1) AS g
+""")
+
+# El miembro k = 0 es el creador
+MEMBERS_SQL = text("""
+    INSERT INTO pertenece (grupo_id, usuario_id, role)
+    SELECT :g0 + g, :u0 + (g * :members + k) % :users, CASE WHEN k = 0 THEN 'admin' ELSE 'member' END
+    FROM generate_series(0, :groups - 1) AS g, generate_series(0, :members - 1) AS k
+""")
+
+# Mensaje i: a un grupo si i % 100 < group_pct (escribe uno de sus miembros);
+# si no, al chat directo c = i % conversations entre a y b (b != a), alternando
+# el sentido en cada vuelta. Devuelve el rango de ids para los contenidos.
+MESSAGES_SQL = text("""
+    WITH s AS (
+        SELECT i, (i % 100) < :group_pct AS grupal, i % :groups AS g, i % :conversations AS c,
+               (i / :conversations) % 2 = 1 AS invertido
+        FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint) - 1) AS i
+    ), p AS (
+        SELECT s.*, c % :users AS a, (c % :users + 1 + (c * 7919) % (:users - 1)) % :users AS b
+        FROM s
+    ), ins AS (
+        INSERT INTO mensaje (emisor_id, receptor_id, grupo_id, fecha_envio, estado_envio, estado_lectura)
+        SELECT CASE
+                   WHEN grupal THEN :u0 + (g * :members + (i / :groups) % :members) % :users
+                   WHEN invertido THEN :u0 + b
+                   ELSE :u0 + a
+               END,
+               CASE WHEN grupal THEN NULL WHEN invertido THEN :u0 + a ELSE :u0 + b END,
+               CASE WHEN grupal THEN :g0 + g END,
+               now() - make_interval(days => :days) + i * :step * interval '1 millisecond',
+               'enviado', 'leído'
+        FROM p
+        ORDER BY i
+        RETURNING id
+    )
+    SELECT min(id), max(id) FROM ins
+""")
+
+CONTENTS_SQL = text("""
+    INSERT INTO contenido (mensaje_id, fecha_envio, tipo_contenido, texto)
+    SELECT id, fecha_envio, 'texto',
+           (CAST(:palabras AS text[]))[1 + id % cardinality(CAST(:palabras AS text[]))] || ' ' ||
+           (CAST(:palabras AS text[]))[1 + (id / 7) % cardinality(CAST(:palabras AS text[]))] || ' ' ||
+           (CAST(:palabras AS text[]))[1 + (id / 53) % cardinality(CAST(:palabras AS text[]))] || ' ' || id
+    FROM mensaje
+    WHERE id BETWEEN :first AND :last
+""")
+
+# Particiones mensuales que cubren las fechas sembradas (ver crear_particiones en init.sql)
+PARTITIONS_SQL = text("""
+    SELECT crear_particiones(CAST(now() - make_interval(days => :days) AS date), CAST(now() AS date))
+""")
+
+RESET_SQL = [
+    f"DELETE FROM mensaje WHERE grupo_id IN (SELECT id FROM grupo WHERE nombre LIKE '{BENCH_GROUP_PREFIX}%')",
+    f"DELETE FROM mensaje WHERE emisor_id IN (SELECT id FROM usuario WHERE email LIKE '%{BENCH_DOMAIN}')",
+    f"DELETE FROM grupo WHERE nombre LIKE '{BENCH_GROUP_PREFIX}%'",
+    f"DELETE FROM usuario WHERE email LIKE '%{BENCH_DOMAIN}'",
+]
+
+
+async def execute(sql, params: dict | None = None):
+    async with async_engine.begin() as conn:
+        # La siembra no está sujeta al DB_STATEMENT_TIMEOUT_MS de la API
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        return await conn.execute(sql, params or {})
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--groups", type=int, default=10_000)
+    parser.add_argument("--members", type=int, default=20, help="miembros por grupo")
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--conversations", type=int, default=200_000, help="chats directos distintos")
+    parser.add_argument("--group-pct", type=int, default=50, help="%% de mensajes a grupos")
+    parser.add_argument("--days", type=int, default=365, help="antigüedad del mensaje más viejo")
+    parser.add_argument("--batch", type=int, default=250_000)
+    parser.add_argument("--reset", action="store_true", help="borra los datos sintéticos anteriores")
+    args = parser.parse_args()
+    if args.members > args.users or args.users < 2:
+        parser.error("--members no puede superar a --users y hacen falta al menos 2 usuarios")
+
+    if args.reset:
+        start = time.perf_counter()
+        for sql in RESET_SQL:
+            await execute(text(sql))
+        print(f"reset en {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    await execute(USERS_SQL, {"nombres": NOMBRES, "apellidos": APELLIDOS, "domain": BENCH_DOMAIN,
+                              "hash": pwd_context.hash(BENCH_PASSWORD), "users": args.users})
+    u0 = (await execute(text("SELECT id FROM usuario WHERE email = :email"),
+                        {"email": f"bench.0{BENCH_DOMAIN}"})).scalar_one()
+    print(f"usuarios: {args.users} en {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    params = {"prefix": BENCH_GROUP_PREFIX, "u0": u0, "users": args.users,
+              "groups": args.groups, "members": args.members}
+    await execute(GROUPS_SQL, params)
+    params["g0"] = (await execute(text("SELECT id FROM grupo WHERE nombre = :nombre"),
+                                  {"nombre": f"{BENCH_GROUP_PREFIX}0"})).scalar_one()
+    await execute(MEMBERS_SQL, params)
+    print(f"grupos: {args.groups} x {args.members} miembros en {time.perf_counter() - start:.1f}s")
+
+    params.update(conversations=args.conversations, group_pct=args.group_pct, days=args.days,
+                  step=args.days * 86_400_000 / args.messages)
+    start = time.perf_counter()
+    created = (await execute(PARTITIONS_SQL, {"days": args.days})).scalar_one()
+    print(f"particiones nuevas: {created}")
+    for first in range(0, args.messages, args.batch):
+        stop = min(first + args.batch, args.messages)
+        ids = (await execute(MESSAGES_SQL, {**params, "start": first, "stop": stop})).one()
+        await execute(CONTENTS_SQL, {"palabras": PALABRAS, "first": ids[0], "last": ids[1]})
+        elapsed = time.perf_counter() - start
+        print(f"mensajes: {stop}/{args.messages}  {stop / elapsed:,.0f} filas/s", flush=True)
+
+    start = time.perf_counter()
+    for table in ("usuario", "grupo", "pertenece", "mensaje", "contenido", "conversacion_estado"):
+        await execute(text(f"ANALYZE {table}"))
+    print(f"analyze en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark de latencia de envío: POST /messages/ (DM y grupo) con N clientes
+concurrentes contra el Postgres local configurado en .env. Reporta msg/s y
+p50/p99 con el INSERT por petición ("directo") y con el write-behind por lotes.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.send_latency --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.main import app
+from app.database import engine, async_engine
+from app.routers import messages
+from app.security import create_access_token
+from app.writer import writer
+
+
+async def run(client: httpx.AsyncClient, body: dict, total: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with sem:
+            start = time.perf_counter()
+            r = await client.post("/messages/", json={**body, "texto": f"bench {i}"})
+            latencies.append(time.perf_counter() - start)
+            r.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]):
+    q = statistics.quantiles(sorted(latencies), n=100)
+    print(
+        f"{name:<6} {len(latencies) / elapsed:>9.1f} msg/s  "
+        f"p50={q[49] * 1000:.1f}ms  p99={q[98] * 1000:.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sender", type=int, default=1)
+    parser.add_argument("--receiver", type=int, default=2)
+    parser.add_argument("--group-id", type=int, default=1)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+
+    base = {"emisor_id": args.sender, "receptor_id": None, "grupo_id": None,
+            "reply_to_id": None, "estado_envio": None, "estado_lectura": None}
+    scenarios = (
+        ("dm", {**base, "receptor_id": args.receiver}),
+        ("grupo", {**base, "grupo_id": args.group_id}),
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        headers = {"Authorization": f"Bearer {create_access_token(args.sender)}"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            for write_behind in (False, True):
+                messages.MESSAGE_WRITE_BEHIND = write_behind
+                print("write-behind" if write_behind else "directo")
+                for name, body in scenarios:
+                    await run(client, body, 50, 10)  # calentar el pool
+                    report(name, *await run(client, body, args.requests, args.concurrency))
+            print("lotes:", writer.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
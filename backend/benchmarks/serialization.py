@@ -0,0 +1,120 @@
+"""
+Microbenchmark del costo por fila al serializar una página de mensajes, sin
+base de datos (solo CPU):
+
+- orm+pydantic: lo que hacía list_messages: instancias ORM -> MensajeDetail y
+  ContenidoOut.from_orm por fila, y luego FastAPI valida contra el
+  response_model y serializa.
+- orm+json: las mismas instancias por jsonable_encoder + json estándar.
+- filas+orjson: el camino actual, filas (Row) de MENSAJE_COLUMNS /
+  CONTENIDO_COLUMNS -> message_page -> ORJSONResponse.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.serialization --sizes 1000 10000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.engine.result import result_tuple
+
+from app import models, schemas
+from app.responses import ORJSONResponse
+from app.routers.messages import CONTENIDO_COLUMNS, MENSAJE_COLUMNS, message_page
+
+MENSAJE_FIELDS = [c.key for c in MENSAJE_COLUMNS]
+CONTENIDO_FIELDS = [c.key for c in CONTENIDO_COLUMNS]
+
+
+def make_data(n: int):
+    """n mensajes con un contenido de texto cada uno y reacciones en uno de cada cuatro."""
+    start = datetime(2025, 7, 10, 10, 0, 0)
+    mensajes = [
+        dict(id=i, emisor_id=1 + i % 2, receptor_id=2 - i % 2, grupo_id=None, reply_to_id=None,
+             fecha_envio=start + timedelta(seconds=i, microseconds=i), estado_envio="enviado",
+             estado_lectura="leído")
+        for i in range(1, n + 1)
+    ]
+    contenidos = [
+        dict(id=i, mensaje_id=i, tipo_contenido="texto", tipo_archivo=None,
+             texto=f"Mensaje número {i}: ¿nos vemos mañana en la reunión?", archivo_url=None,
+             archivo_hash=None, archivo_tamano=None, miniatura_estado=None, miniatura_url=None)
+        for i in range(1, n + 1)
+    ]
+    counts = {i: [{"tipo": "like", "total": 3, "mia": i % 8 == 1}] for i in range(1, n + 1, 4)}
+    return mensajes, contenidos, counts
+
+
+def orm_objects(mensajes, contenidos):
+    objs = []
+    for m, c in zip(mensajes, contenidos):
+        msg = models.Mensaje(**m)
+        msg.contenidos = [models.Contenido(**c)]
+        objs.append(msg)
+    return objs
+
+
+def old_models(objs, counts):
+    return [
+        schemas.MensajeDetail(
+            id=m.id, emisor_id=m.emisor_id, receptor_id=m.receptor_id, grupo_id=m.grupo_id,
+            reply_to_id=m.reply_to_id, fecha_envio=m.fecha_envio, estado_envio=m.estado_envio,
+            estado_lectura=m.estado_lectura,
+            contenidos=[schemas.ContenidoOut.from_orm(c) for c in m.contenidos],
+            reacciones=[schemas.ReaccionCount(**r) for r in counts.get(m.id, [])],
+        )
+        for m in objs
+    ]
+
+
+def timed(fn, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(List[schemas.MensajeDetail])
+    make_mensaje = result_tuple(MENSAJE_FIELDS)
+    make_contenido = result_tuple(CONTENIDO_FIELDS)
+
+    for n in args.sizes:
+        mensajes, contenidos, counts = make_data(n)
+        # Las instancias ORM y las filas salen del driver en ambos casos: no se cronometran
+        objs = orm_objects(mensajes, contenidos)
+        rows = [make_mensaje(tuple(m[f] for f in MENSAJE_FIELDS)) for m in mensajes]
+        content_rows = [make_contenido(tuple(c[f] for f in CONTENIDO_FIELDS)) for c in contenidos]
+
+        def pydantic_path():
+            page = old_models(objs, counts)
+            return adapter.dump_json(adapter.validate_python(page, from_attributes=True))
+
+        def json_path():
+            return json.dumps(jsonable_encoder(old_models(objs, counts))).encode()
+
+        def orjson_path():
+            return ORJSONResponse(message_page(rows, content_rows, counts)).body
+
+        assert json.loads(orjson_path()) == json.loads(pydantic_path())
+        print(f"{n} mensajes")
+        base = None
+        for name, fn in (("orm+pydantic", pydantic_path), ("orm+json", json_path), ("filas+orjson", orjson_path)):
+            elapsed = timed(fn, args.rounds)
+            base = base or elapsed
+            print(f"  {name:<13} {elapsed * 1000:8.2f}ms  {elapsed / n * 1e6:6.2f}µs/fila  x{base / elapsed:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
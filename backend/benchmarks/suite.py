@@ -0,0 +1,380 @@
+"""
+Suite de carga de la API sobre los datos de benchmarks.seed.
+
+Levanta uvicorn en un subproceso (--workers) o usa un servidor ya corriendo
+(--url; debe compartir JWT_SECRET_KEY con este .env) y ejecuta, cada uno con
+--concurrency clientes en lazo cerrado:
+
+- login: POST /auth/login (bcrypt; usa --login-requests y --login-concurrency;
+  por encima de HASH_MAX_PENDING la API responde 429 y cuenta como error)
+- open_chat_dm / open_chat_group: GET /messages/ de la página más reciente
+- send_dm / send_group: POST /messages/
+- user_search: GET /users/search con los prefijos de benchmarks.user_search
+- ws_fanout: --listeners sockets de los miembros de un grupo; se mide desde el
+  POST hasta que cada socket recibe el evento (con --workers > 1 hace falta
+  WS_BROKER=redis)
+
+Reporta req/s y p50/p95/p99 por escenario y agrega una línea a
+benchmarks/results.jsonl con el commit (y si el árbol tenía cambios), los
+parámetros y el tamaño de los datos. Al final compara con la última corrida de
+otro commit y marca REGRESIÓN si el p95 sube o el throughput baja más de
+--threshold %. Los usuarios, chats y grupos se eligen con setseed(--seed): la
+misma semilla sobre los mismos datos repite la misma carga.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.suite --requests 2000 --concurrency 50
+python -m benchmarks.suite --url http://localhost:8000 --scenarios open_chat_dm send_dm
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+from sqlalchemy import text
+
+from app.database import async_engine
+from app.security import create_access_token
+from benchmarks.seed import BENCH_DOMAIN, BENCH_GROUP_PREFIX, BENCH_PASSWORD
+from benchmarks.user_search import QUERIES
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(BACKEND_DIR, "benchmarks", "results.jsonl")
+SCENARIOS = ["login", "open_chat_dm", "open_chat_group", "send_dm", "send_group", "user_search", "ws_fanout"]
+
+
+# ---------------------------------------------------------------------------
+# Datos de la carga
+
+async def load_fixture(seed: float, sample: int, listeners: int) -> dict:
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+        bench_user = f"%{BENCH_DOMAIN}"
+        emails = (await conn.scalars(text(
+            "SELECT email FROM usuario WHERE email LIKE :p ORDER BY id LIMIT :n"
+        ), {"p": bench_user, "n": sample})).all()
+        if not emails:
+            raise SystemExit("No hay datos sintéticos: ejecuta antes python -m benchmarks.seed")
+        pairs = (await conn.execute(text(
+            "SELECT ce.usuario_id, ce.peer_id FROM conversacion_estado ce JOIN usuario u ON u.id = ce.usuario_id "
+            "WHERE ce.peer_id IS NOT NULL AND u.email LIKE :p ORDER BY random() LIMIT :n"
+        ), {"p": bench_user, "n": sample})).all()
+        memberships = (await conn.execute(text(
+            "SELECT p.usuario_id, p.grupo_id FROM pertenece p JOIN grupo g ON g.id = p.grupo_id "
+            "WHERE g.nombre LIKE :p ORDER BY random() LIMIT :n"
+        ), {"p": f"{BENCH_GROUP_PREFIX}%", "n": sample})).all()
+        fanout_group = memberships[0].grupo_id
+        fanout_members = (await conn.scalars(text(
+            "SELECT usuario_id FROM pertenece WHERE grupo_id = :g ORDER BY usuario_id"
+        ), {"g": fanout_group})).all()
+        dataset = dict((await conn.execute(text(
+            "SELECT relname, reltuples::bigint FROM pg_class "
+            "WHERE relname IN ('usuario', 'grupo', 'pertenece', 'mensaje', 'contenido')"
+        ))).all())
+
+    user_ids = {uid for pair in pairs for uid in pair} | {m.usuario_id for m in memberships} | set(fanout_members)
+    return {
+        "emails": emails,
+        "pairs": [tuple(p) for p in pairs],
+        "memberships": [tuple(m) for m in memberships],
+        "fanout_group": fanout_group,
+        # Varios sockets por usuario si hay más listeners que miembros
+        "listeners": [fanout_members[i % len(fanout_members)] for i in range(listeners)],
+        "tokens": {uid: create_access_token(uid) for uid in user_ids},
+        "dataset": dataset,
+    }
+
+
+def message_body(emisor_id: int, receptor_id: int | None, grupo_id: int | None, i: int) -> dict:
+    return {"emisor_id": emisor_id, "receptor_id": receptor_id, "grupo_id": grupo_id, "reply_to_id": None,
+            "estado_envio": None, "estado_lectura": None, "texto": f"bench suite {i}"}
+
+
+def auth(fx: dict, user_id: int) -> dict:
+    return {"Authorization": f"Bearer {fx['tokens'][user_id]}"}
+
+
+# ---------------------------------------------------------------------------
+# Escenarios HTTP: cada uno arma la petición i-ésima y falla si no es 2xx
+
+def request_factory(name: str, client: httpx.AsyncClient, fx: dict):
+    emails, pairs, memberships = fx["emails"], fx["pairs"], fx["memberships"]
+
+    async def login(i: int):
+        r = await client.post("/auth/login", json={"email": emails[i % len(emails)], "password": BENCH_PASSWORD})
+        r.raise_for_status()
+
+    async def open_chat_dm(i: int):
+        a, b = pairs[i % len(pairs)]
+        r = await client.get("/messages/", params={"user1_id": a, "user2_id": b, "limit": 50}, headers=auth(fx, a))
+        r.raise_for_status()
+
+    async def open_chat_group(i: int):
+        usuario_id, grupo_id = memberships[i % len(memberships)]
+        r = await client.get("/messages/", params={"group_id": grupo_id, "limit": 50}, headers=auth(fx, usuario_id))
+        r.raise_for_status()
+
+    async def send_dm(i: int):
+        a, b = pairs[i % len(pairs)]
+        r = await client.post("/messages/", json=message_body(a, b, None, i), headers=auth(fx, a))
+        r.raise_for_status()
+
+    async def send_group(i: int):
+        usuario_id, grupo_id = memberships[i % len(memberships)]
+        r = await client.post("/messages/", json=message_body(usuario_id, None, grupo_id, i), headers=auth(fx, usuario_id))
+        r.raise_for_status()
+
+    async def user_search(i: int):
+        r = await client.get("/users/search", params={"q": QUERIES[i % len(QUERIES)], "limit": 10})
+        r.raise_for_status()
+
+    return {
+        "login": login, "open_chat_dm": open_chat_dm, "open_chat_group": open_chat_group,
+        "send_dm": send_dm, "send_group": send_group, "user_search": user_search,
+    }[name]
+
+
+def summarize(latencies: list[float], errors: dict[str, int], elapsed: float) -> dict:
+    if len(latencies) > 1:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        q = [latencies[0] if latencies else 0.0] * 99
+    return {
+        "requests": len(latencies) + sum(errors.values()),
+        "errors": sum(errors.values()),
+        # Por código HTTP o tipo de fallo (p. ej. 429 del pool de bcrypt en login)
+        "error_codes": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": q[49] * 1000,
+        "p95_ms": q[94] * 1000,
+        "p99_ms": q[98] * 1000,
+    }
+
+
+async def run(request, total: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    pending = iter(range(total))
+
+    async def worker():
+        for i in pending:
+            start = time.perf_counter()
+            try:
+                await request(i)
+            except httpx.HTTPStatusError as e:
+                key = str(e.response.status_code)
+                errors[key] = errors.get(key, 0) + 1
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Fan-out por WebSocket
+
+async def ws_fanout(client: httpx.AsyncClient, fx: dict, url: str, messages: int, timeout: float) -> dict:
+    grupo_id = fx["fanout_group"]
+    listeners = fx["listeners"]
+    sender = listeners[0]
+    received: dict[int, list[float]] = {}
+    ws_url = url.replace("http", "ws", 1)
+
+    async def listen(uid: int, ready: asyncio.Event):
+        async with websockets.connect(f"{ws_url}/ws/ws/{uid}?token={fx['tokens'][uid]}", max_queue=None) as ws:
+            ready.set()
+            async for raw in ws:
+                frame = json.loads(raw)
+                if frame.get("type") == "message" and frame.get("grupo_id") == grupo_id:
+                    received.setdefault(frame["id"], []).append(time.perf_counter())
+
+    ready = [asyncio.Event() for _ in listeners]
+    tasks = [asyncio.create_task(listen(uid, ev)) for uid, ev in zip(listeners, ready)]
+    try:
+        await asyncio.wait_for(asyncio.gather(*(ev.wait() for ev in ready)), timeout)
+        # El registro en el broker ocurre después del accept
+        await asyncio.sleep(0.5)
+
+        sent: dict[int, float] = {}
+        start = time.perf_counter()
+        for i in range(messages):
+            t0 = time.perf_counter()
+            r = await client.post("/messages/", json=message_body(sender, None, grupo_id, i), headers=auth(fx, sender))
+            r.raise_for_status()
+            sent[r.json()["id"]] = t0
+
+        expected = messages * len(listeners)
+        deadline = time.perf_counter() + timeout
+        while sum(len(received.get(mid, [])) for mid in sent) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = [t - sent[mid] for mid in sent for t in received.get(mid, [])]
+    missing = expected - len(latencies)
+    result = summarize(latencies, {"sin_entregar": missing} if missing else {}, elapsed)
+    result["listeners"] = len(listeners)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Servidor, resultados y comparación
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=url) as client:
+        for _ in range(300):
+            if proc.poll() is not None:
+                raise SystemExit(f"uvicorn terminó con código {proc.returncode}")
+            try:
+                if (await client.get("/metrics")).status_code == 200:
+                    return proc, url
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("uvicorn no respondió en 60s")
+
+
+def git_revision() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido", False
+    return commit, dirty
+
+
+def previous_run(path: str, commit: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    others = [r for r in runs if r["commit"] != commit]
+    return (others or runs or [None])[-1]
+
+
+def delta(new: float, old: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def report(results: dict, params: dict, baseline: dict | None, threshold: float) -> bool:
+    regression = False
+    if baseline:
+        print(f"\ncomparado con {baseline['commit']}{' (con cambios)' if baseline.get('dirty') else ''}"
+              f" del {baseline['fecha']}")
+        # Se compara escenario por escenario: elegir otros no afecta
+        changed = sorted(k for k, v in params.items() if k != "scenarios" and baseline["params"].get(k, v) != v)
+        if changed:
+            print(f"  ojo: cambiaron los parámetros {', '.join(changed)}; la comparación no es directa")
+    for name, r in results.items():
+        line = (f"{name:<16} {r['rps']:9.1f} req/s  p50={r['p50_ms']:8.2f}ms  p95={r['p95_ms']:8.2f}ms  "
+                f"p99={r['p99_ms']:8.2f}ms  errores={r['errors']}")
+        if r["error_codes"]:
+            line += " (" + ", ".join(f"{code}: {n}" for code, n in r["error_codes"].items()) + ")"
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        if old:
+            d_rps, d_p95 = delta(r["rps"], old["rps"]), delta(r["p95_ms"], old["p95_ms"])
+            line += f"  Δreq/s={d_rps:+.1f}%  Δp95={d_p95:+.1f}%"
+            if d_rps < -threshold or d_p95 > threshold:
+                line += "  REGRESIÓN"
+                regression = True
+        print(line)
+    return regression
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="servidor ya levantado; por defecto se lanza uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn si no se pasa --url")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=2000, help="peticiones medidas por escenario")
+    parser.add_argument("--login-requests", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50, help="peticiones sin medir antes de cada escenario")
+    parser.add_argument("--listeners", type=int, default=200, help="sockets de ws_fanout")
+    parser.add_argument("--fanout-messages", type=int, default=100)
+    parser.add_argument("--sample", type=int, default=1000, help="usuarios, chats y membresías de la carga")
+    parser.add_argument("--seed", type=float, default=0.42, help="semilla de setseed() en [-1, 1]")
+    parser.add_argument("--results", default=RESULTS)
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% de empeoramiento que cuenta como regresión")
+    parser.add_argument("--fail-on-regression", action="store_true", help="sale con código 1 si hay regresión")
+    args = parser.parse_args()
+
+    fx = await load_fixture(args.seed, args.sample, args.listeners)
+    await async_engine.dispose()
+    print("datos:", ", ".join(f"{k}={v:,}" for k, v in sorted(fx["dataset"].items())))
+
+    proc, url = (None, args.url) if args.url else await start_server(args.workers)
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+            for name in args.scenarios:
+                if name == "ws_fanout":
+                    results[name] = await ws_fanout(client, fx, url, args.fanout_messages, timeout=30)
+                else:
+                    total, concurrency = args.requests, args.concurrency
+                    if name == "login":
+                        total, concurrency = args.login_requests, args.login_concurrency
+                    request = request_factory(name, client, fx)
+                    await run(request, min(args.warmup, total), concurrency)
+                    results[name] = await run(request, total, concurrency)
+                r = results[name]
+                print(f"{name:<16} {r['rps']:9.1f} req/s  p95={r['p95_ms']:.2f}ms", flush=True)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    commit, dirty = git_revision()
+    baseline = previous_run(args.results, commit)
+    params = {k: v for k, v in vars(args).items() if k not in ("results", "fail_on_regression")}
+    regression = report(results, params, baseline, args.threshold)
+    record = {
+        "commit": commit,
+        "dirty": dirty,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": params,
+        "dataset": fx["dataset"],
+        "scenarios": results,
+    }
+    with open(args.results, "a") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"\nresultados en {args.results}")
+    if regression and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
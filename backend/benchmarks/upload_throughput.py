@@ -0,0 +1,124 @@
+"""
+Benchmark de POST /content/ con archivos grandes: MB/s y memoria pico
+(tracemalloc) de la subida por bloques a app.storage, de la misma subida
+repetida (deduplicada) y, como referencia, de la lectura con UploadFile +
+copia a disco que haría una implementación directa.
+
+Usa el usuario --sender y crea un mensaje suyo para adjuntar. Con el
+almacenamiento local los archivos quedan en STORAGE_DIR.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.upload_throughput --sizes 1 16 64 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+from sqlalchemy import text
+
+from app.main import app
+from app.database import engine, async_engine
+from app.security import create_access_token
+
+MB = 1024 * 1024
+
+
+def make_file(directory: str, size_mb: int) -> str:
+    path = os.path.join(directory, f"{size_mb}mb.bin")
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(MB))
+    return path
+
+
+def touch(path: str, n: int):
+    """Cambia los primeros bytes para que cada ronda sea un archivo nuevo (otro sha256)."""
+    with open(path, "r+b") as f:
+        f.write(n.to_bytes(8, "big"))
+
+
+def baseline_app(directory: str) -> FastAPI:
+    # Lo que haría upload_content con UploadFile: el cuerpo entero se vuelca a un
+    # SpooledTemporaryFile y después se copia al destino
+    baseline = FastAPI()
+
+    @baseline.post("/content/")
+    async def upload(mensaje_id: int, file: UploadFile = File(...)):
+        with open(os.path.join(directory, "baseline.bin"), "wb") as out:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, out, MB)
+        return {"ok": True}
+
+    return baseline
+
+
+async def upload(client: httpx.AsyncClient, path: str, params: dict, headers: dict) -> float:
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        r = await client.post("/content/", params=params, headers=headers,
+                              files={"file": (os.path.basename(path), f, "application/octet-stream")})
+    elapsed = time.perf_counter() - start
+    r.raise_for_status()
+    return elapsed
+
+
+def report(name: str, size_mb: int, times: list[float], peak: int):
+    p50 = statistics.median(times)
+    print(f"  {name:<10} {size_mb / p50:8.1f} MB/s  p50={p50 * 1000:8.1f}ms  "
+          f"max={max(times) * 1000:8.1f}ms  pico={peak / MB:6.1f} MiB")
+
+
+async def measure(client, path, params, headers, rounds, size_mb, name, new_file: bool):
+    times = []
+    tracemalloc.start()
+    for i in range(rounds):
+        if new_file:
+            touch(path, time.time_ns() + i)
+        times.append(await upload(client, path, params, headers))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report(name, size_mb, times, peak)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 64], help="tamaños en MiB")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--sender", type=int, default=1)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+
+    async with async_engine.begin() as conn:
+        mensaje_id = await conn.scalar(text(
+            "INSERT INTO mensaje (emisor_id, receptor_id) "
+            "SELECT :u, min(id) FROM usuario WHERE id <> :u RETURNING id"
+        ), {"u": args.sender})
+    params = {"mensaje_id": mensaje_id}
+    headers = {"Authorization": f"Bearer {create_access_token(args.sender)}"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        async with app.router.lifespan_context(app):
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                       timeout=None)
+            base = httpx.AsyncClient(transport=httpx.ASGITransport(app=baseline_app(tmp)),
+                                     base_url="http://bench", timeout=None)
+            async with client, base:
+                for size_mb in args.sizes:
+                    path = make_file(tmp, size_mb)
+                    print(f"{size_mb} MiB")
+                    await measure(client, path, params, headers, args.rounds, size_mb, "stream", True)
+                    await measure(client, path, params, headers, args.rounds, size_mb, "repetido", False)
+                    await measure(base, path, params, headers, args.rounds, size_mb, "UploadFile", True)
+                    os.unlink(path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
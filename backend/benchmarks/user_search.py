@@ -0,0 +1,128 @@
+"""
+Benchmark de /users/search: el ILIKE '%q%' anterior contra el tsquery de prefijos
+sobre idx_usuario_busqueda, directo a Postgres (sin caché) y por la API (con el
+caché de resultados, simulando las teclas repetidas del debounce).
+
+--seed N inserta N usuarios sintéticos (email *@bench.example.com) con un solo
+INSERT ... SELECT generate_series; --cleanup los borra al terminar.
+
+Ejecutar ubicado en backend/:
+python -m benchmarks.user_search --seed 1000000 --cleanup
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from sqlalchemy import func, or_, select, text
+
+from app import models, search
+from app.main import app
+from app.database import engine, async_engine, AsyncSessionLocal
+
+NOMBRES = ["Ana", "Alicia", "Bruno", "Carla", "Carlos", "Diana", "Diego", "Elena", "Felipe", "Gabriela",
+           "Hugo", "Irene", "Javier", "Laura", "Lucas", "Marta", "Mateo", "Nora", "Pablo", "Sofía"]
+APELLIDOS = ["García", "Martínez", "López", "Fernández", "Gómez", "Pérez", "Rodríguez", "Sánchez",
+             "Ramírez", "Torres", "Flores", "Rivera", "Vargas", "Castro", "Ortiz", "Morales"]
+QUERIES = ["a", "ca", "carl", "carlos g", "mart", "sofía ram", "diego.torres", "zz"]
+
+SEED_SQL = text("""
+    INSERT INTO usuario (nombre, apellido, email)
+    SELECT n, a, lower(n || '.' || a || '.' || i) || '@bench.example.com'
+    FROM (
+        SELECT i,
+               (CAST(:nombres AS text[]))[1 + i % cardinality(CAST(:nombres AS text[]))] AS n,
+               (CAST(:apellidos AS text[]))[1 + (i / cardinality(CAST(:nombres AS text[]))) % cardinality(CAST(:apellidos AS text[]))] AS a
+        FROM generate_series(1, :total) AS i
+    ) s
+""")
+
+
+def ilike_stmt(q: str, limit: int):
+    pattern = f"%{q}%"
+    return select(models.Usuario.id).filter(or_(
+        models.Usuario.nombre.ilike(pattern),
+        models.Usuario.apellido.ilike(pattern),
+        models.Usuario.email.ilike(pattern),
+    )).limit(limit)
+
+
+def tsquery_stmt(q: str, limit: int):
+    tsquery = func.to_tsquery("simple", search.prefix_query(q))
+    matches = search.candidates(
+        select(models.Usuario.id, models.Usuario.busqueda).filter(models.Usuario.busqueda.op("@@")(tsquery)),
+        models.Usuario.id
+    )
+    rank = search.score(matches.c.busqueda, tsquery)
+    stmt = select(matches.c.id, rank.label("score"), search.candidate_count(matches).label("candidatos"))
+    return search.apply_cursor(stmt, rank, matches.c.id, None, limit)
+
+
+def report(name: str, latencies: list[float]):
+    q = statistics.quantiles(sorted(latencies), n=100)
+    print(f"  {name:<8} p50={q[49] * 1000:8.2f}ms  p99={q[98] * 1000:8.2f}ms")
+
+
+async def time_sql(build, rounds: int, limit: int):
+    latencies = {}
+    async with AsyncSessionLocal() as db:
+        for q in QUERIES:
+            latencies[q] = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                await db.execute(build(q, limit))
+                latencies[q].append(time.perf_counter() - start)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="usuarios sintéticos a insertar")
+    parser.add_argument("--cleanup", action="store_true")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    engine.echo = False
+    async_engine.echo = False
+
+    async with async_engine.begin() as conn:
+        if args.seed:
+            start = time.perf_counter()
+            await conn.execute(SEED_SQL, {"nombres": NOMBRES, "apellidos": APELLIDOS, "total": args.seed})
+            await conn.execute(text("ANALYZE usuario"))
+            print(f"seed: {args.seed} usuarios en {time.perf_counter() - start:.1f}s")
+        total = await conn.scalar(text("SELECT count(*) FROM usuario"))
+    print(f"usuario: {total} filas")
+
+    try:
+        ilike = await time_sql(ilike_stmt, args.rounds, args.limit)
+        tsq = await time_sql(tsquery_stmt, args.rounds, args.limit)
+        for q in QUERIES:
+            print(f"q={q!r}")
+            report("ilike", ilike[q])
+            report("tsquery", tsq[q])
+
+        # Por la API: cada consulta se repite como lo haría el debounce del buscador
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            from app.routers.users import user_search_cache
+            latencies = []
+            for _ in range(args.rounds):
+                for q in QUERIES:
+                    start = time.perf_counter()
+                    r = await client.get("/users/search", params={"q": q, "limit": args.limit})
+                    latencies.append(time.perf_counter() - start)
+                    r.raise_for_status()
+            print("API /users/search")
+            report("total", latencies)
+            print("  caché:", user_search_cache.stats())
+    finally:
+        if args.cleanup:
+            async with async_engine.begin() as conn:
+                await conn.execute(text("DELETE FROM usuario WHERE email LIKE '%@bench.example.com'"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
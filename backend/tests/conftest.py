@@ -0,0 +1,104 @@
+"""
+Las pruebas corren contra el Postgres de .env (variables PG*) cargado con
+database/init.sql. Ejecutar ubicado en backend/:
+
+    pytest
+
+Cada prueba trabaja dentro de una transacción que se deshace al terminar: la
+sesión `db` y las rutas (get_async_db) comparten esa conexión, así que lo que
+crea una prueba no queda en la base. Las tareas de fondo del lifespan no se
+arrancan; las rutas que solo usan get_async_db no las necesitan.
+"""
+import uuid
+
+import httpx
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.database import async_engine, get_async_db
+from app.main import app
+from app.security import create_access_token
+
+
+@pytest.fixture
+async def db():
+    async with async_engine.connect() as conn:
+        await conn.begin()
+        # Los commit de la sesión quedan en savepoints de la transacción de la prueba
+        session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        try:
+            yield session
+        finally:
+            await session.close()
+            await conn.rollback()
+
+
+@pytest.fixture
+async def client(db):
+    async def override():
+        yield db
+    app.dependency_overrides[get_async_db] = override
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            yield c
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+
+
+@pytest.fixture
+def auth():
+    """auth(user_id) -> cabecera Authorization con un token de ese usuario."""
+    def make(user_id: int) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(user_id)}"}
+    return make
+
+
+@pytest.fixture
+def make_users(db):
+    """await make_users(n) -> ids de n usuarios nuevos."""
+    async def make(n: int) -> list[int]:
+        tag = uuid.uuid4().hex[:8]
+        return list((await db.scalars(
+            insert(models.Usuario).returning(models.Usuario.id),
+            [
+                {"nombre": f"Test{i}", "apellido": tag, "email": f"test{i}.{tag}@example.com", "contrasena_hash": "x"}
+                for i in range(n)
+            ],
+        )).all())
+    return make
+
+
+@pytest.fixture
+def make_group(db):
+    """await make_group(member_ids) -> id de un grupo nuevo; el primero es el owner."""
+    async def make(member_ids: list[int]) -> int:
+        grupo_id = await db.scalar(
+            insert(models.Grupo).values(nombre="Grupo de prueba", creador_id=member_ids[0]).returning(models.Grupo.id)
+        )
+        await db.execute(insert(models.Pertenece), [
+            {"grupo_id": grupo_id, "usuario_id": uid, "role": "owner" if i == 0 else "member"}
+            for i, uid in enumerate(member_ids)
+        ])
+        return grupo_id
+    return make
+
+
+@pytest.fixture
+def send(db):
+    """
+    await send([{emisor_id, receptor_id | grupo_id}, ...]) -> ids. Inserta los
+    mensajes con un contenido de texto cada uno en un solo INSERT, como el MessageWriter.
+    """
+    async def make(messages: list[dict]) -> list[int]:
+        rows = (await db.execute(
+            insert(models.Mensaje).returning(models.Mensaje.id, models.Mensaje.fecha_envio, sort_by_parameter_order=True),
+            [{"receptor_id": None, "grupo_id": None, **m} for m in messages],
+        )).all()
+        await db.execute(insert(models.Contenido), [
+            {"mensaje_id": mensaje_id, "fecha_envio": fecha_envio, "tipo_contenido": "texto", "texto": f"texto {mensaje_id}"}
+            for mensaje_id, fecha_envio in rows
+        ])
+        return [mensaje_id for mensaje_id, _ in rows]
+    return make
@@ -0,0 +1,92 @@
+"""Política de consumidor lento del ConnectionManager."""
+import asyncio
+
+from app.connections import ConnectionManager
+
+
+class FakeSocket:
+    """WebSocket cuyo send_text se queda esperando hasta `release`, como un cliente que no lee."""
+
+    def __init__(self, stalled: bool = False):
+        self.stalled = stalled
+        self.release = asyncio.Event()
+        self.sent: list[str] = []
+        self.closed_with: int | None = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await self.release.wait()
+        self.sent.append(text)
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+
+async def connect(manager: ConnectionManager, user_id: int, ws: FakeSocket):
+    conn = await manager.connect(ws, user_id)
+    # La tarea escritora toma el primer mensaje y se queda bloqueada en send_text
+    await asyncio.sleep(0)
+    return conn
+
+
+async def test_drop_policy_discards_overflow():
+    manager = ConnectionManager(queue_size=2, slow_consumer_policy="drop")
+    await manager.start()
+    slow = FakeSocket(stalled=True)
+    conn = await connect(manager, 1, slow)
+    for i in range(5):
+        manager.deliver(1, f"m{i}")
+    assert conn.queue.qsize() == 2
+    assert manager.dropped == 3
+    # El socket sigue conectado y recibe lo encolado cuando vuelve a leer
+    assert 1 in manager.active
+    slow.release.set()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert slow.sent == ["m0", "m1"]
+    conn.stop()
+
+
+async def test_disconnect_policy_closes_slow_socket():
+    manager = ConnectionManager(queue_size=2, slow_consumer_policy="disconnect")
+    await manager.start()
+    slow = FakeSocket(stalled=True)
+    await connect(manager, 1, slow)
+    for i in range(3):
+        manager.deliver(1, f"m{i}")
+    assert manager.dropped == 1
+    assert 1 not in manager.active
+    await asyncio.sleep(0)
+    assert slow.closed_with == 1013
+
+
+async def test_slow_consumer_does_not_block_others():
+    manager = ConnectionManager(queue_size=1, slow_consumer_policy="drop")
+    await manager.start()
+    slow, fast = FakeSocket(stalled=True), FakeSocket()
+    slow_conn = await connect(manager, 1, slow)
+    fast_conn = await connect(manager, 2, fast)
+    for i in range(3):
+        await manager.send([1, 2], {"n": i})
+        await asyncio.sleep(0)
+    assert len(fast.sent) == 3
+    assert manager.dropped >= 1
+    slow_conn.stop()
+    fast_conn.stop()
+
+
+async def test_stop_closes_sockets_and_writers():
+    manager = ConnectionManager(queue_size=4)
+    await manager.start()
+    slow, idle = FakeSocket(stalled=True), FakeSocket()
+    slow_conn = await connect(manager, 1, slow)
+    idle_conn = await connect(manager, 2, idle)
+    manager.deliver(1, "pendiente")
+    await manager.stop()
+    assert (slow.closed_with, idle.closed_with) == (1001, 1001)
+    assert manager.active == {}
+    await asyncio.sleep(0)
+    assert slow_conn.writer.done() and idle_conn.writer.done()
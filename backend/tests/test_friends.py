@@ -0,0 +1,21 @@
+"""Amistades: el par inverso no duplica la relación."""
+from sqlalchemy import insert
+
+from app import models
+
+
+async def test_friend_listed_once_with_both_directions_accepted(client, auth, db, make_users):
+    a, b = await make_users(2)
+    await db.execute(insert(models.Amistad), [
+        {"usuario_id": a, "amigo_id": b, "estado": "accepted"},
+        {"usuario_id": b, "amigo_id": a, "estado": "accepted"},
+    ])
+    r = await client.get(f"/friends/{a}/all", headers=auth(a))
+    assert [u["id"] for u in r.json()] == [b]
+
+
+async def test_reverse_request_is_rejected(client, auth, db, make_users):
+    a, b = await make_users(2)
+    await db.execute(insert(models.Amistad).values(usuario_id=a, amigo_id=b))
+    r = await client.post("/friends/", json={"usuario_id": b, "amigo_id": a}, headers=auth(b))
+    assert r.status_code == 400
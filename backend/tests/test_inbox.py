@@ -0,0 +1,89 @@
+"""Bandeja de entrada: trigger de conversacion_estado y mark_read."""
+from sqlalchemy import delete, select
+
+from app import models
+from app.inbox import mark_read
+from app.membership import membership_cache
+
+
+async def conversation_state(db, usuario_id: int, peer_id: int | None = None, grupo_id: int | None = None):
+    ce = models.ConversacionEstado
+    return (await db.execute(
+        select(ce.ultimo_mensaje_id, ce.ultimo_leido_id, ce.no_leidos)
+            .filter(ce.usuario_id == usuario_id, ce.peer_id.is_(peer_id) if peer_id is None else ce.peer_id == peer_id,
+                    ce.grupo_id.is_(grupo_id) if grupo_id is None else ce.grupo_id == grupo_id)
+    )).one()
+
+
+async def read_states(db, ids: list[int]) -> list[str]:
+    estados = dict((await db.execute(
+        select(models.Mensaje.id, models.Mensaje.estado_lectura).filter(models.Mensaje.id.in_(ids))
+    )).all())
+    return [estados[i] for i in ids]
+
+
+async def test_unread_count_direct(db, make_users, send):
+    a, b = await make_users(2)
+    # Un solo INSERT de tres filas: el trigger es por sentencia
+    ids = await send([{"emisor_id": a, "receptor_id": b}] * 3)
+    assert await conversation_state(db, b, peer_id=a) == (ids[-1], 0, 3)
+    assert await conversation_state(db, a, peer_id=b) == (ids[-1], ids[-1], 0)
+
+    [more] = await send([{"emisor_id": a, "receptor_id": b}])
+    assert await conversation_state(db, b, peer_id=a) == (more, 0, 4)
+
+    # Responder marca como leído lo anterior para quien responde
+    [reply] = await send([{"emisor_id": b, "receptor_id": a}])
+    assert await conversation_state(db, b, peer_id=a) == (reply, reply, 0)
+    assert await conversation_state(db, a, peer_id=b) == (reply, more, 1)
+
+
+async def test_unread_count_group(db, make_users, make_group, send):
+    a, b, c = await make_users(3)
+    grupo_id = await make_group([a, b, c])
+    ids = await send([{"emisor_id": a, "grupo_id": grupo_id}, {"emisor_id": b, "grupo_id": grupo_id}])
+    assert await conversation_state(db, a, grupo_id=grupo_id) == (ids[1], ids[0], 1)
+    assert await conversation_state(db, b, grupo_id=grupo_id) == (ids[1], ids[1], 0)
+    assert await conversation_state(db, c, grupo_id=grupo_id) == (ids[1], 0, 2)
+
+
+async def test_unread_count_after_mark_read(db, make_users, send):
+    a, b = await make_users(2)
+    ids = await send([{"emisor_id": a, "receptor_id": b}] * 5)
+    state = await mark_read(db, b, ids[1])
+    assert (state["ultimo_leido_id"], state["no_leidos"]) == (ids[1], 3)
+    assert await read_states(db, ids) == ["leído", "leído", "no_leído", "no_leído", "no_leído"]
+    # Leer algo anterior no retrocede el punto de lectura
+    assert (await mark_read(db, b, ids[0]))["no_leidos"] == 3
+    assert (await mark_read(db, b, ids[-1]))["no_leidos"] == 0
+
+
+async def test_mark_read_after_reply_marks_peer_messages(db, make_users, send):
+    a, b = await make_users(2)
+    ids = await send([{"emisor_id": a, "receptor_id": b}] * 3)
+    # La respuesta adelanta el punto de lectura de b más allá de ids[-1] en el trigger
+    [reply] = await send([{"emisor_id": b, "receptor_id": a}])
+    state = await mark_read(db, b, ids[-1])
+    assert (state["ultimo_leido_id"], state["no_leidos"]) == (reply, 0)
+    assert await read_states(db, ids) == ["leído"] * 3
+
+
+async def test_mark_read_creates_missing_state(db, make_users, make_group, send):
+    a, b, c = await make_users(3)
+    grupo_id = await make_group([a, b])
+    ids = await send([{"emisor_id": a, "grupo_id": grupo_id}] * 3)
+    # c entra después de los envíos: el trigger no le creó fila
+    db.add(models.Pertenece(grupo_id=grupo_id, usuario_id=c, role="member"))
+    await db.flush()
+    await membership_cache.invalidate(grupo_id, [c])
+    state = await mark_read(db, c, ids[0])
+    assert (state["ultimo_leido_id"], state["no_leidos"]) == (ids[0], 2)
+    assert await conversation_state(db, c, grupo_id=grupo_id) == (ids[-1], ids[0], 2)
+
+    # Igual en un chat directo cuya fila se borró
+    [direct] = await send([{"emisor_id": a, "receptor_id": c}])
+    ce = models.ConversacionEstado
+    await db.execute(delete(ce).filter(ce.usuario_id == c, ce.peer_id == a))
+    state = await mark_read(db, c, direct)
+    assert (state["ultimo_leido_id"], state["no_leidos"]) == (direct, 0)
+    assert await read_states(db, [direct]) == ["leído"]
@@ -0,0 +1,118 @@
+"""/messages/: número de consultas por página y permisos de lectura y envío."""
+import json
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert
+
+from app import models
+from app.database import async_engine
+from app.connections import Connection
+from app.membership import membership_cache
+from app.routers.ws import handle_send
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+async def history(db, make_users, make_group, send):
+    """Dos usuarios con 60 mensajes directos y un grupo con 60 más, con reacciones en algunos."""
+    a, b, c = await make_users(3)
+    grupo_id = await make_group([a, b])
+    dm = await send([
+        {"emisor_id": a, "receptor_id": b} if i % 2 else {"emisor_id": b, "receptor_id": a}
+        for i in range(60)
+    ])
+    group = await send([{"emisor_id": a if i % 2 else b, "grupo_id": grupo_id} for i in range(60)])
+    await db.execute(insert(models.Reaccion), [
+        {"mensaje_id": mensaje_id, "usuario_id": uid, "tipo": tipo}
+        for mensaje_id in dm[-10:] + group[-10:]
+        for uid, tipo in ((a, "👍"), (b, "👍"), (b, "❤️"))
+    ])
+    # La membresía se lee de la caché: se carga antes de contar
+    await membership_cache.member_ids(db, grupo_id)
+    return {"a": a, "b": b, "c": c, "grupo_id": grupo_id, "dm": dm, "group": group}
+
+
+@pytest.mark.parametrize("limit", [1, 5, 50])
+@pytest.mark.parametrize("conversation", ["dm", "group"])
+async def test_page_is_three_statements(client, auth, history, conversation, limit):
+    a = history["a"]
+    params = {"group_id": history["grupo_id"]} if conversation == "group" else {"user1_id": a, "user2_id": history["b"]}
+    with count_statements() as statements:
+        r = await client.get("/messages/", params={**params, "limit": limit}, headers=auth(a))
+    assert r.status_code == 200
+    assert len(statements) == 3, statements
+    page = r.json()
+    assert [m["id"] for m in page] == history[conversation][-limit:]
+    assert all(m["contenidos"][0]["texto"] == f"texto {m['id']}" for m in page)
+    assert page[-1]["reacciones"] == [
+        {"tipo": "👍", "total": 2, "mia": True},
+        {"tipo": "❤️", "total": 1, "mia": False},
+    ]
+
+
+async def test_page_cursor_is_three_statements(client, auth, history):
+    a, dm = history["a"], history["dm"]
+    with count_statements() as statements:
+        r = await client.get("/messages/", params={"user1_id": a, "user2_id": history["b"], "before": dm[30], "limit": 5},
+                             headers=auth(a))
+    assert len(statements) == 3, statements
+    assert [m["id"] for m in r.json()] == dm[25:30]
+
+
+
+async def test_history_requires_participant(client, auth, history):
+    dm = {"user1_id": history["a"], "user2_id": history["b"]}
+    group = {"group_id": history["grupo_id"]}
+    assert (await client.get("/messages/", params=dm)).status_code == 401
+    assert (await client.get("/messages/", params=dm, headers=auth(history["c"]))).status_code == 403
+    assert (await client.get("/messages/", params=group, headers=auth(history["c"]))).status_code == 403
+    assert (await client.get("/messages/", params=group, headers=auth(history["b"]))).status_code == 200
+
+
+def body(emisor_id: int, receptor_id: int | None = None, grupo_id: int | None = None) -> dict:
+    return {"emisor_id": emisor_id, "receptor_id": receptor_id, "grupo_id": grupo_id, "reply_to_id": None,
+            "estado_envio": None, "estado_lectura": None, "texto": "hola"}
+
+
+async def test_send_requires_group_membership(client, auth, history):
+    a, c, grupo_id = history["a"], history["c"], history["grupo_id"]
+    r = await client.post("/messages/", json=body(c, grupo_id=grupo_id), headers=auth(c))
+    assert r.status_code == 403
+    r = await client.post("/messages/", json=body(a, grupo_id=grupo_id), headers=auth(a))
+    assert r.status_code == 201
+    assert r.json()["grupo_id"] == grupo_id
+
+
+async def test_send_requires_one_destination(client, auth, history):
+    a, b = history["a"], history["b"]
+    for destination in ({}, {"receptor_id": b, "grupo_id": history["grupo_id"]}):
+        r = await client.post("/messages/", json=body(a, **destination), headers=auth(a))
+        assert r.status_code == 400
+
+
+async def test_ws_send_checks_destination(history):
+    # La membresía ya está en la caché (fixture history): el socket no necesita ver la transacción de la prueba
+    c, grupo_id = history["c"], history["grupo_id"]
+    conn = Connection(ws=None, user_id=c, maxsize=10)
+    await handle_send(conn, {"type": "send", "client_id": "x", "grupo_id": grupo_id, "texto": "hola"})
+    await handle_send(conn, {"type": "send", "client_id": "y", "grupo_id": grupo_id, "receptor_id": history["a"],
+                             "texto": "hola"})
+    frames = [json.loads(conn.queue.get_nowait()) for _ in range(2)]
+    assert frames == [
+        {"type": "error", "client_id": "x", "detail": "No eres miembro del grupo"},
+        {"type": "error", "client_id": "y", "detail": "Debes proporcionar receptor_id o grupo_id, no ambos"},
+    ]
@@ -0,0 +1,23 @@
+"""Etiquetas de ruta de las métricas HTTP."""
+from types import SimpleNamespace
+
+import pytest
+
+from app.metrics import route_label
+
+
+@pytest.mark.parametrize("path, path_format, label", [
+    # Parámetros con el mismo valor, o iguales a un tramo literal
+    ("/friends/3/3/accept", "/{usuario_id}/{amigo_id}/accept", "/friends/{usuario_id}/{amigo_id}/accept"),
+    ("/groups/members/members", "/{group_id}/members", "/groups/{group_id}/members"),
+    ("/messages/", "/", "/messages/"),
+    # Ruta registrada con el prefijo ya incluido
+    ("/metrics", "/metrics", "/metrics"),
+])
+def test_route_label_uses_path_format(path, path_format, label):
+    scope = {"path": path, "endpoint": object(), "route": SimpleNamespace(path_format=path_format)}
+    assert route_label(scope) == label
+
+
+def test_unmatched_route():
+    assert route_label({"path": "/nope"}) == "unmatched"
@@ -0,0 +1,55 @@
+"""/groups y /friends: cada ruta actúa solo en nombre del usuario del token."""
+import pytest
+from sqlalchemy import insert
+
+from app import models
+
+
+@pytest.fixture
+async def people(make_users, make_group):
+    """Grupo de `owner` con `member`; `other` no pertenece."""
+    owner, member, other = await make_users(3)
+    grupo_id = await make_group([owner, member])
+    return {"owner": owner, "member": member, "other": other, "grupo_id": grupo_id}
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("GET", "/groups/?user_id={owner}", None),
+    ("POST", "/groups/join/token?user_id={owner}", None),
+    ("POST", "/groups/", {"nombre": "x", "creador_id": "{owner}"}),
+    ("GET", "/friends/{owner}/all", None),
+    ("GET", "/friends/incoming/{owner}", None),
+    ("GET", "/friends/sent/{owner}", None),
+    ("POST", "/friends/", {"usuario_id": "{owner}", "amigo_id": "{member}"}),
+    ("POST", "/friends/{member}/{owner}/accept", None),
+    ("POST", "/friends/{member}/{owner}/reject", None),
+    ("PATCH", "/friends/{member}/{owner}", {"estado": "accepted"}),
+])
+async def test_other_users_token_is_403(client, auth, people, method, path, body):
+    if body is not None:
+        body = {k: int(v.format(**people)) if isinstance(v, str) and "{" in v else v for k, v in body.items()}
+    r = await client.request(method, path.format(**people), json=body, headers=auth(people["other"]))
+    assert r.status_code == 403
+    assert (await client.request(method, path.format(**people), json=body)).status_code == 401
+
+
+async def test_only_admins_manage_other_members(client, auth, people):
+    owner, member, other, grupo_id = people["owner"], people["member"], people["other"], people["grupo_id"]
+    assert (await client.post(f"/groups/{grupo_id}/members/{other}", headers=auth(member))).status_code == 403
+    assert (await client.post(f"/groups/{grupo_id}/members/{other}", headers=auth(other))).status_code == 403
+    assert (await client.post(f"/groups/{grupo_id}/members/{other}", headers=auth(owner))).status_code == 201
+    assert (await client.delete(f"/groups/{grupo_id}/members/{owner}", headers=auth(other))).status_code == 403
+    # Salir del grupo no necesita ser administrador
+    assert (await client.delete(f"/groups/{grupo_id}/members/{other}", headers=auth(other))).status_code == 204
+    assert (await client.delete(f"/groups/{grupo_id}/members/{member}", headers=auth(owner))).status_code == 204
+
+
+async def test_only_recipient_accepts(client, auth, db, people):
+    owner, member = people["owner"], people["member"]
+    await db.execute(insert(models.Amistad).values(usuario_id=member, amigo_id=owner))
+    assert (await client.post(f"/friends/{member}/{owner}/accept", headers=auth(member))).status_code == 403
+    r = await client.post(f"/friends/{member}/{owner}/accept", headers=auth(owner))
+    assert r.status_code == 200
+    assert r.json()["estado"] == "accepted"
+    r = await client.get(f"/friends/{owner}/all", headers=auth(owner))
+    assert [u["id"] for u in r.json()] == [member]
@@ -0,0 +1,46 @@
+"""Reacciones: trigger de reaccion_conteo y react()."""
+from sqlalchemy import delete, insert, select, update
+
+from app import models
+from app.reactions import react
+
+
+async def counts(db, mensaje_id: int) -> dict[str, int]:
+    rc = models.ReaccionConteo
+    return dict((await db.execute(select(rc.tipo, rc.total).filter(rc.mensaje_id == mensaje_id))).all())
+
+
+async def test_reaction_counts(db, make_users, send):
+    a, b, c = await make_users(3)
+    [mensaje_id] = await send([{"emisor_id": a, "receptor_id": b}])
+    r = models.Reaccion
+    await db.execute(insert(r), [
+        {"mensaje_id": mensaje_id, "usuario_id": uid, "tipo": tipo}
+        for uid, tipo in ((a, "👍"), (b, "👍"), (c, "👍"), (b, "❤️"))
+    ])
+    assert await counts(db, mensaje_id) == {"👍": 3, "❤️": 1}
+
+    await db.execute(delete(r).filter(r.mensaje_id == mensaje_id, r.usuario_id == a, r.tipo == "👍"))
+    assert await counts(db, mensaje_id) == {"👍": 2, "❤️": 1}
+
+    # Cambiar el tipo mueve el conteo; un tipo que llega a cero desaparece
+    await db.execute(update(r).filter(r.mensaje_id == mensaje_id, r.usuario_id == b, r.tipo == "❤️").values(tipo="😂"))
+    assert await counts(db, mensaje_id) == {"👍": 2, "😂": 1}
+
+
+async def test_react_is_idempotent(db, make_users, send):
+    a, b = await make_users(2)
+    [mensaje_id] = await send([{"emisor_id": a, "receptor_id": b}])
+    summary, targets = await react(db, b, mensaje_id, "👍", add=True)
+    assert sorted(targets) == sorted([a, b])
+    assert summary["reacciones"] == [{"tipo": "👍", "total": 1, "mia": True}]
+
+    summary, targets = await react(db, b, mensaje_id, "👍", add=True)
+    assert targets == []
+    assert await counts(db, mensaje_id) == {"👍": 1}
+
+    summary, targets = await react(db, b, mensaje_id, "👍", add=False)
+    assert summary["reacciones"] == [] and targets
+    summary, targets = await react(db, b, mensaje_id, "👍", add=False)
+    assert targets == []
+    assert await counts(db, mensaje_id) == {}
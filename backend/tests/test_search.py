@@ -0,0 +1,38 @@
+"""/users/search: paginación por cursor, tope de candidatos y cabeceras visibles desde el navegador."""
+import uuid
+
+from sqlalchemy import func, insert, select
+
+from app import models, search
+
+
+async def test_search_pages_and_exposes_headers(client, db):
+    tag = uuid.uuid4().hex[:8]
+    await db.execute(insert(models.Usuario), [
+        {"nombre": f"Busca{i}", "apellido": tag, "email": f"busca{i}.{tag}@example.com", "contrasena_hash": "x"}
+        for i in range(3)
+    ])
+    headers = {"Origin": "http://localhost:3000"}
+    r = await client.get("/users/search", params={"q": tag, "limit": 2}, headers=headers)
+    assert len(r.json()) == 2
+    assert "X-Search-Truncated" not in r.headers
+    assert "x-next-cursor" in r.headers["Access-Control-Expose-Headers"].lower()
+    r = await client.get("/users/search", params={"q": tag, "limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert len(r.json()) == 1
+    assert "X-Next-Cursor" not in r.headers
+
+
+async def test_candidate_cap_is_reported(db, make_users):
+    await make_users(5)
+    tsquery = func.to_tsquery("simple", search.prefix_query("test"))
+    matches = search.candidates(
+        select(models.Usuario.id, models.Usuario.busqueda).filter(models.Usuario.busqueda.op("@@")(tsquery)),
+        models.Usuario.id, limit=3,
+    )
+    rank = search.score(matches.c.busqueda, tsquery)
+    stmt = select(matches.c.id, rank.label("score"), search.candidate_count(matches).label("candidatos"))
+    rows = (await db.execute(search.apply_cursor(stmt, rank, matches.c.id, None, 2))).all()
+    assert len(rows) == 2
+    assert rows[0].candidatos == 3
+    assert search.truncated(rows, limit=3)
+    assert not search.truncated(rows, limit=4)
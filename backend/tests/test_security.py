@@ -0,0 +1,95 @@
+"""Tokens de sesión: firma, expiración, caché y dependencias de FastAPI."""
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app import security
+from app.security import (
+    JWT_ALGORITHM, TokenCache, check_keys, create_access_token, current_user_id,
+    decode_access_token, media_user_id,
+)
+
+
+def encode(claims: dict, key=None) -> str:
+    return jwt.encode(claims, key or security._signing_key, algorithm=JWT_ALGORITHM)
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_roundtrip():
+    assert decode_access_token(create_access_token(42)) == 42
+
+
+@pytest.mark.parametrize("claims", [
+    {"sub": "1", "exp": int(time.time()) - 10},   # expirado
+    {"exp": int(time.time()) + 60},               # sin sub
+    {"sub": "abc", "exp": int(time.time()) + 60},  # sub no numérico
+])
+def test_invalid_claims_are_401(claims):
+    with pytest.raises(HTTPException) as e:
+        decode_access_token(encode(claims))
+    assert e.value.status_code == 401
+
+
+def test_foreign_signature_is_401():
+    token = encode({"sub": "1", "exp": int(time.time()) + 60}, key="otro-secreto")
+    with pytest.raises(HTTPException) as e:
+        decode_access_token(token)
+    assert e.value.status_code == 401
+
+
+def test_tampered_token_is_401():
+    header, payload, signature = create_access_token(1).split(".")
+    forged = encode({"sub": "2", "exp": int(time.time()) + 60}).split(".")[1]
+    with pytest.raises(HTTPException):
+        decode_access_token(f"{header}.{forged}.{signature}")
+
+
+def test_cache_hits_and_expires(monkeypatch):
+    cache = TokenCache(maxsize=2)
+    monkeypatch.setattr(security, "token_cache", cache)
+    token = create_access_token(7)
+    assert decode_access_token(token) == 7
+    assert decode_access_token(token) == 7
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Una entrada vencida no se sirve aunque siga en la caché
+    cache.data[token] = (7, int(time.time()) - 1)
+    assert cache.get(token) is None
+    assert token not in cache.data
+
+
+def test_cache_evicts_lru():
+    cache = TokenCache(maxsize=2)
+    exp = int(time.time()) + 60
+    cache.set("a", 1, exp)
+    cache.set("b", 2, exp)
+    cache.get("a")
+    cache.set("c", 3, exp)
+    assert list(cache.data) == ["a", "c"]
+
+
+def test_current_user_id_requires_bearer():
+    with pytest.raises(HTTPException) as e:
+        current_user_id(None)
+    assert e.value.status_code == 401
+    assert current_user_id(bearer(create_access_token(5))) == 5
+
+
+def test_media_user_id_accepts_query_token():
+    assert media_user_id(token=create_access_token(3), credentials=None) == 3
+    assert media_user_id(token="", credentials=bearer(create_access_token(4))) == 4
+    with pytest.raises(HTTPException) as e:
+        media_user_id(token="", credentials=None)
+    assert e.value.status_code == 401
+
+
+def test_check_keys_fails_without_secret(monkeypatch):
+    check_keys()
+    monkeypatch.setattr(security, "_signing_key", None)
+    with pytest.raises(RuntimeError):
+        check_keys()
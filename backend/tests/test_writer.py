@@ -0,0 +1,49 @@
+"""Apagado del MessageWriter: lo encolado se guarda o responde 503, nunca queda esperando."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import schemas
+from app.writer import MessageWriter
+
+
+def message(texto: str) -> schemas.MensajeCreate:
+    return schemas.MensajeCreate(emisor_id=1, receptor_id=2, grupo_id=None, reply_to_id=None,
+                                 estado_envio=None, estado_lectura=None, texto=texto)
+
+
+class SlowFlushWriter(MessageWriter):
+    """Sin base de datos: cada lote tarda `delay` segundos y responde con el texto."""
+
+    def __init__(self, delay: float, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+
+    async def _flush(self, batch):
+        await asyncio.sleep(self.delay)
+        for msg, fut in batch:
+            fut.set_result({"texto": msg.texto})
+
+
+async def test_stop_flushes_queued_messages():
+    writer = SlowFlushWriter(delay=0.01, max_batch=2, max_delay_ms=0)
+    await writer.start()
+    sends = [asyncio.ensure_future(writer.write(message(f"m{i}"))) for i in range(5)]
+    await asyncio.sleep(0)
+    await writer.stop()
+    assert [(await s)["texto"] for s in sends] == [f"m{i}" for i in range(5)]
+
+
+async def test_stop_fails_what_it_cannot_flush():
+    writer = SlowFlushWriter(delay=10, max_batch=1, max_delay_ms=0, drain_timeout=0.05)
+    await writer.start()
+    sends = [asyncio.ensure_future(writer.write(message(f"m{i}"))) for i in range(3)]
+    await asyncio.sleep(0)
+    await writer.stop()
+    for s in sends:
+        with pytest.raises(HTTPException) as e:
+            await s
+        assert e.value.status_code == 503
+    with pytest.raises(HTTPException):
+        await writer.write(message("tarde"))
@@ -4,6 +4,9 @@
 -- =======================
 
 -- Eliminar tablas existentes (incluyendo autenticación)
+DROP TABLE IF EXISTS conversacion_estado CASCADE;
+DROP TABLE IF EXISTS reaccion_conteo CASCADE;
+DROP TABLE IF EXISTS reaccion CASCADE;
 DROP TABLE IF EXISTS contenido CASCADE;
 DROP TABLE IF EXISTS mensaje CASCADE;
 DROP TABLE IF EXISTS pertenece CASCADE;
@@ -28,6 +31,14 @@ CREATE INDEX idx_usuario_nombre ON usuario (nombre);
 CREATE INDEX idx_usuario_apellido ON usuario (apellido);
 CREATE INDEX idx_usuario_email ON usuario (email);
 
+-- Búsqueda de usuarios (/users/search): prefijos con to_tsquery sobre un GIN;
+-- nombre y apellido pesan más que el email, que también se indexa por partes
+ALTER TABLE usuario ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', nombre || ' ' || apellido), 'A') ||
+    setweight(to_tsvector('simple', email || ' ' || regexp_replace(email, '[^[:alnum:]]+', ' ', 'g')), 'B')
+) STORED;
+CREATE INDEX idx_usuario_busqueda ON usuario USING gin (busqueda);
+
 -- Tabla de amistades
 CREATE TABLE amistad (
     usuario_id INT REFERENCES usuario(id) ON DELETE CASCADE,
@@ -46,6 +57,10 @@ ADD COLUMN IF NOT EXISTS fecha_creacion TIMESTAMPTZ NOT NULL DEFAULT NOW();
 ALTER TABLE "amistad"
 ADD COLUMN IF NOT EXISTS fecha_actualizacion TIMESTAMPTZ NOT NULL DEFAULT NOW();
 
+-- Amigos por estado en ambos sentidos (lista de amigos, solicitudes, verificación al crear grupos)
+CREATE INDEX idx_amistad_usuario_estado ON amistad (usuario_id, estado);
+CREATE INDEX idx_amistad_amigo_estado ON amistad (amigo_id, estado);
+
 -- Tabla de grupos
 CREATE TABLE grupo (
     id             SERIAL PRIMARY KEY,
@@ -70,35 +85,262 @@ ADD COLUMN IF NOT EXISTS role VARCHAR(10) NOT NULL DEFAULT 'member';
 
 
 
--- Tabla de mensajes
+-- Tabla de mensajes, particionada por mes de fecha_envio (ver "Particiones
+-- mensuales" más abajo). La PK debe incluir la columna de partición; id sigue
+-- siendo único porque sale de una sola secuencia.
 CREATE TABLE mensaje (
-    id             SERIAL PRIMARY KEY,
+    id             SERIAL,
     emisor_id      INT REFERENCES usuario(id) ON DELETE SET NULL,
     receptor_id    INT REFERENCES usuario(id) ON DELETE SET NULL,
     grupo_id       INT REFERENCES grupo(id) ON DELETE CASCADE,
-    fecha_envio    TIMESTAMP DEFAULT NOW(),
+    fecha_envio    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     estado_envio   VARCHAR(20) DEFAULT 'enviado',
-    estado_lectura VARCHAR(20) DEFAULT 'no_leído'
-);
-ALTER TABLE mensaje
-ADD COLUMN IF NOT EXISTS reply_to_id INT REFERENCES mensaje(id) ON DELETE SET NULL;
+    estado_lectura VARCHAR(20) DEFAULT 'no_leído',
+    -- Sin FK: apuntar a mensaje exigiría también su fecha_envio, y el mensaje
+    -- citado puede estar ya archivado
+    reply_to_id    INT,
+    PRIMARY KEY (id, fecha_envio)
+) PARTITION BY RANGE (fecha_envio);
+-- Historial paginado por cursor (fecha_envio, id)
+CREATE INDEX idx_mensaje_grupo_fecha ON mensaje (grupo_id, fecha_envio, id);
+CREATE INDEX idx_mensaje_chat_fecha ON mensaje (emisor_id, receptor_id, fecha_envio, id);
+-- Mensajes recibidos por usuario (búsqueda en su historial)
+CREATE INDEX idx_mensaje_receptor_fecha ON mensaje (receptor_id, fecha_envio, id);
+-- Mensajes directos aún no leídos (mark_read): solo esas filas, no todo el historial
+CREATE INDEX idx_mensaje_directo_no_leido ON mensaje (receptor_id, emisor_id, fecha_envio)
+    WHERE estado_lectura <> 'leído' AND receptor_id IS NOT NULL;
 
 CREATE TABLE IF NOT EXISTS reaccion (
     id          SERIAL PRIMARY KEY,
-    mensaje_id  INT   REFERENCES mensaje(id) ON DELETE CASCADE,
+    mensaje_id  INT,  -- sin FK (mensaje está particionada); ver archivar_particiones
     usuario_id  INT   REFERENCES usuario(id) ON DELETE CASCADE,
     tipo        VARCHAR(50) NOT NULL,    -- e.g. '👍','❤️'
-    fecha       TIMESTAMPTZ DEFAULT NOW()
+    fecha       TIMESTAMPTZ DEFAULT NOW(),
+    -- Una reacción de cada tipo por usuario y mensaje; el índice también sirve
+    -- las búsquedas por mensaje
+    UNIQUE (mensaje_id, usuario_id, tipo)
+);
+
+-- Conteo de reacciones por (mensaje, tipo): los listados leen estas filas en
+-- lugar de agregar reaccion. El trigger lo actualiza en la misma transacción
+-- que la reacción; el upsert solo bloquea la fila de ese (mensaje, tipo).
+CREATE TABLE reaccion_conteo (
+    mensaje_id  INT         NOT NULL,
+    tipo        VARCHAR(50) NOT NULL,
+    total       INT         NOT NULL,
+    PRIMARY KEY (mensaje_id, tipo)
 );
--- Contenido del mensaje
+
+CREATE OR REPLACE FUNCTION reaccion_conteo_cambio() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE reaccion_conteo SET total = total - 1
+         WHERE mensaje_id = OLD.mensaje_id AND tipo = OLD.tipo;
+        DELETE FROM reaccion_conteo
+         WHERE mensaje_id = OLD.mensaje_id AND tipo = OLD.tipo AND total <= 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO reaccion_conteo AS rc (mensaje_id, tipo, total)
+        VALUES (NEW.mensaje_id, NEW.tipo, 1)
+        ON CONFLICT (mensaje_id, tipo) DO UPDATE SET total = rc.total + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_reaccion_conteo
+    AFTER INSERT OR DELETE OR UPDATE OF mensaje_id, tipo ON reaccion
+    FOR EACH ROW EXECUTE FUNCTION reaccion_conteo_cambio();
+-- Contenido del mensaje, particionado igual que mensaje: fecha_envio es la del
+-- mensaje, así cada contenido cae en la partición del mismo mes que su mensaje
 CREATE TABLE contenido (
-    id             SERIAL PRIMARY KEY,
-    mensaje_id     INT REFERENCES mensaje(id) ON DELETE CASCADE,
+    id             SERIAL,
+    mensaje_id     INT,
+    fecha_envio    TIMESTAMPTZ NOT NULL,
     tipo_contenido VARCHAR(20) NOT NULL, -- texto, imagen, archivo, etc.
-    tipo_archivo   VARCHAR(20),           -- opcional si es archivo
+    tipo_archivo   VARCHAR(100),          -- MIME, opcional si es archivo
     texto          TEXT,
-    archivo_url    TEXT
+    archivo_url    TEXT,
+    archivo_hash   CHAR(64),              -- sha256 del archivo: clave en el almacenamiento
+    archivo_tamano BIGINT,
+    -- Vista previa de imágenes/videos: pendiente -> procesando -> lista | error
+    miniatura_estado VARCHAR(20),
+    miniatura_hash   CHAR(64),
+    miniatura_url    TEXT,
+    miniatura_reclamada TIMESTAMP,        -- cuándo pasó a 'procesando' (se reclama si se atasca)
+    PRIMARY KEY (id, fecha_envio),
+    FOREIGN KEY (mensaje_id, fecha_envio) REFERENCES mensaje (id, fecha_envio) ON DELETE CASCADE
+) PARTITION BY RANGE (fecha_envio);
+CREATE INDEX idx_contenido_mensaje ON contenido (mensaje_id);
+-- Cola de miniaturas (app/thumbnails.py): solo las filas pendientes o en proceso
+CREATE INDEX idx_contenido_miniatura_cola ON contenido (id) WHERE miniatura_estado IN ('pendiente', 'procesando');
+
+-- Búsqueda en el historial (/messages/search). Además de las palabras del texto
+-- lleva lexemas de alcance ('u:<emisor>', 'u:<receptor>', 'g:<grupo>') tomados del
+-- mensaje, para que un solo recorrido del GIN filtre por texto y por las
+-- conversaciones del usuario. El texto nunca produce lexemas con ':'.
+ALTER TABLE contenido ADD COLUMN texto_busqueda tsvector;
+CREATE INDEX idx_contenido_busqueda ON contenido USING gin (texto_busqueda);
+
+CREATE OR REPLACE FUNCTION contenido_busqueda() RETURNS trigger AS $$
+BEGIN
+    SELECT to_tsvector('spanish', coalesce(NEW.texto, '')) || array_to_tsvector(array_remove(
+               ARRAY['u:' || m.emisor_id, 'u:' || m.receptor_id, 'g:' || m.grupo_id], NULL))
+      INTO NEW.texto_busqueda
+      FROM mensaje m
+     WHERE m.id = NEW.mensaje_id AND m.fecha_envio = NEW.fecha_envio;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_contenido_busqueda
+    BEFORE INSERT OR UPDATE OF texto, mensaje_id ON contenido
+    FOR EACH ROW EXECUTE FUNCTION contenido_busqueda();
+
+-- Estado de cada conversación por usuario (GET /messages/inbox): último mensaje,
+-- hasta dónde leyó y cuántos no ha leído. peer_id es el otro usuario de un chat
+-- directo y grupo_id el grupo; siempre uno de los dos.
+CREATE TABLE conversacion_estado (
+    id                  SERIAL PRIMARY KEY,
+    usuario_id          INT NOT NULL REFERENCES usuario(id) ON DELETE CASCADE,
+    peer_id             INT REFERENCES usuario(id) ON DELETE CASCADE,
+    grupo_id            INT REFERENCES grupo(id) ON DELETE CASCADE,
+    ultimo_mensaje_id   INT NOT NULL,
+    ultimo_leido_id     INT NOT NULL DEFAULT 0,
+    no_leidos           INT NOT NULL DEFAULT 0,
+    CHECK ((peer_id IS NULL) <> (grupo_id IS NULL)),
+    UNIQUE NULLS NOT DISTINCT (usuario_id, peer_id, grupo_id)
 );
+-- Bandeja ordenada por actividad reciente
+CREATE INDEX idx_conversacion_usuario_ultimo ON conversacion_estado (usuario_id, ultimo_mensaje_id DESC);
+
+-- Se mantiene por sentencia: un INSERT multi-fila del write-behind hace un solo
+-- upsert, y las filas se bloquean siempre en el mismo orden (sin deadlocks entre
+-- envíos cruzados). Enviar un mensaje marca la conversación como leída para el emisor.
+CREATE OR REPLACE FUNCTION conversacion_estado_envio() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO conversacion_estado AS ce
+           (usuario_id, peer_id, grupo_id, ultimo_mensaje_id, ultimo_leido_id, no_leidos)
+    SELECT usuario_id, peer_id, grupo_id, max(id), max(leido_id),
+           count(*) FILTER (WHERE leido_id = 0 AND id > leido_max)
+      FROM (
+        SELECT f.*, max(leido_id) OVER (PARTITION BY usuario_id, peer_id, grupo_id) AS leido_max
+          FROM (
+            SELECT emisor_id AS usuario_id, receptor_id AS peer_id, NULL::int AS grupo_id, id, id AS leido_id
+              FROM nuevos WHERE receptor_id IS NOT NULL
+            UNION ALL
+            SELECT receptor_id, emisor_id, NULL, id, 0
+              FROM nuevos WHERE receptor_id IS NOT NULL
+            UNION ALL
+            SELECT p.usuario_id, NULL, n.grupo_id, n.id,
+                   CASE WHEN p.usuario_id = n.emisor_id THEN n.id ELSE 0 END
+              FROM nuevos n JOIN pertenece p ON p.grupo_id = n.grupo_id
+          ) f
+         WHERE usuario_id IS NOT NULL AND (peer_id IS NOT NULL OR grupo_id IS NOT NULL)
+      ) filas
+     GROUP BY usuario_id, peer_id, grupo_id
+     ORDER BY usuario_id, peer_id, grupo_id
+    ON CONFLICT (usuario_id, peer_id, grupo_id) DO UPDATE SET
+        ultimo_mensaje_id = greatest(ce.ultimo_mensaje_id, excluded.ultimo_mensaje_id),
+        ultimo_leido_id   = greatest(ce.ultimo_leido_id, excluded.ultimo_leido_id),
+        no_leidos = CASE WHEN excluded.ultimo_leido_id > ce.ultimo_leido_id
+                         THEN excluded.no_leidos
+                         ELSE ce.no_leidos + excluded.no_leidos END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_conversacion_estado_envio
+    AFTER INSERT ON mensaje
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION conversacion_estado_envio();
+
+-- --------------------------------------------------
+-- Particiones mensuales de mensaje y contenido
+-- --------------------------------------------------
+-- mensaje_AAAA_MM y contenido_AAAA_MM cubren [día 1 del mes, día 1 del siguiente), en UTC.
+-- No hay partición DEFAULT: una fila de un mes sin partición falla en lugar de
+-- caer en una tabla que después impediría crear la de ese mes. La app
+-- (app/partitions.py) crea al arrancar, y luego a diario, las de los próximos meses.
+CREATE OR REPLACE FUNCTION crear_particiones(desde DATE, hasta DATE) RETURNS int AS $$
+DECLARE
+    mes     DATE := date_trunc('month', desde);
+    tabla   TEXT;
+    creadas INT := 0;
+BEGIN
+    -- Varios workers pueden llamarla a la vez
+    PERFORM pg_advisory_xact_lock(hashtext('particiones_mensaje'));
+    WHILE mes <= hasta LOOP
+        FOREACH tabla IN ARRAY ARRAY['mensaje', 'contenido'] LOOP
+            IF to_regclass(tabla || '_' || to_char(mes, 'YYYY_MM')) IS NULL THEN
+                -- Límites en UTC y con zona explícita: no dependen del TimeZone de la sesión
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               tabla || '_' || to_char(mes, 'YYYY_MM'), tabla,
+                               mes::timestamp AT TIME ZONE 'UTC', (mes + interval '1 month') AT TIME ZONE 'UTC');
+                creadas := creadas + 1;
+            END IF;
+        END LOOP;
+        mes := mes + interval '1 month';
+    END LOOP;
+    RETURN creadas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Historial frío: separa las particiones de los meses anteriores a `antes` y las
+-- pasa al esquema archivo (archivo.mensaje_AAAA_MM, archivo.contenido_AAAA_MM),
+-- donde siguen consultables pero la app ya no las recorre. Se compactan quitando
+-- los índices que solo sirven a la app (queda la PK) y sus reacciones pasan a
+-- archivo.reaccion. Devuelve los meses archivados ('AAAA_MM').
+-- DETACH toma un lock exclusivo breve sobre mensaje y contenido: mejor en horas valle.
+CREATE SCHEMA IF NOT EXISTS archivo;
+CREATE TABLE IF NOT EXISTS archivo.reaccion (LIKE reaccion);
+
+CREATE OR REPLACE FUNCTION archivar_particiones(antes DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    mes     TEXT;
+    tabla   TEXT;
+    objeto  TEXT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('particiones_mensaje'));
+    FOR mes IN
+        SELECT right(c.relname, 7)
+          FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = 'mensaje'::regclass
+           AND c.relname ~ '^mensaje_[0-9]{4}_[0-9]{2}$'
+           AND to_date(right(c.relname, 7), 'YYYY_MM') + interval '1 month' <= date_trunc('month', antes)
+         ORDER BY 1
+    LOOP
+        EXECUTE format('INSERT INTO archivo.reaccion SELECT r.* FROM reaccion r JOIN %I m ON m.id = r.mensaje_id',
+                       'mensaje_' || mes);
+        EXECUTE format('DELETE FROM reaccion r USING %I m WHERE m.id = r.mensaje_id', 'mensaje_' || mes);
+
+        -- contenido primero: su FK hacia mensaje impediría separar la partición de mensaje.
+        -- Separada, la tabla conserva una copia de esa FK que también hay que quitar.
+        EXECUTE format('ALTER TABLE contenido DETACH PARTITION %I', 'contenido_' || mes);
+        FOR objeto IN
+            SELECT conname FROM pg_constraint
+             WHERE conrelid = ('contenido_' || mes)::regclass AND contype = 'f'
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', 'contenido_' || mes, objeto);
+        END LOOP;
+        EXECUTE format('ALTER TABLE mensaje DETACH PARTITION %I', 'mensaje_' || mes);
+
+        FOREACH tabla IN ARRAY ARRAY['mensaje_' || mes, 'contenido_' || mes] LOOP
+            FOR objeto IN
+                SELECT indexrelid::regclass::text FROM pg_index
+                 WHERE indrelid = tabla::regclass AND NOT indisprimary
+            LOOP
+                EXECUTE 'DROP INDEX ' || objeto;
+            END LOOP;
+            EXECUTE format('ALTER TABLE %I SET SCHEMA archivo', tabla);
+        END LOOP;
+        RETURN NEXT mes;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Desde el primer mes de los datos de ejemplo hasta tres meses por delante
+SELECT crear_particiones(DATE '2025-07-01', CAST(NOW() + interval '3 months' AS DATE));
 
 -- Catálogo de tipos de contenido
 CREATE TABLE tipocontenido (
@@ -228,7 +470,10 @@ INSERT INTO mensaje (emisor_id, receptor_id, grupo_id, fecha_envio,           es
 -- --------------------------------------------------
 -- 10 inserts para la tabla contenido
 -- --------------------------------------------------
-INSERT INTO contenido (mensaje_id, tipo_contenido, tipo_archivo, texto,                       archivo_url) VALUES
+-- fecha_envio se toma del mensaje: decide la partición del contenido
+INSERT INTO contenido (mensaje_id, fecha_envio, tipo_contenido, tipo_archivo, texto, archivo_url)
+SELECT v.mensaje_id, m.fecha_envio, v.tipo_contenido, v.tipo_archivo, v.texto, v.archivo_url
+FROM (VALUES
 (1,  'texto',   NULL,    'Hola Bob, ¿cómo estás?',                  NULL),
 (2,  'texto',   NULL,    'Bien, Alice. ¿Y tú?',                     NULL),
 (3,  'archivo', 'pdf',   NULL,    'https://example.com/files/informe.pdf'),
@@ -238,4 +483,6 @@ INSERT INTO contenido (mensaje_id, tipo_contenido, tipo_archivo, texto,
 (7,  'texto',   NULL,    'Reunión de familia el sábado.',           NULL),
 (8,  'texto',   NULL,    'Plan de trabajo actualizado.',           NULL),
 (9,  'texto',   NULL,    'Evento de código este viernes.',         NULL),
-(10, 'texto',   NULL,    'Vamos al partido este domingo.',          NULL);
+(10, 'texto',   NULL,    'Vamos al partido este domingo.',          NULL)
+) AS v (mensaje_id, tipo_contenido, tipo_archivo, texto, archivo_url)
+JOIN mensaje m ON m.id = v.mensaje_id;
@@ -107,7 +107,10 @@ INSERT INTO mensaje (emisor_id, receptor_id, grupo_id, fecha_envio,           es
 -- --------------------------------------------------
 -- 10 inserts para la tabla contenido
 -- --------------------------------------------------
-INSERT INTO contenido (mensaje_id, tipo_contenido, tipo_archivo, texto,                       archivo_url) VALUES
+-- fecha_envio se toma del mensaje: decide la partición del contenido
+INSERT INTO contenido (mensaje_id, fecha_envio, tipo_contenido, tipo_archivo, texto, archivo_url)
+SELECT v.mensaje_id, m.fecha_envio, v.tipo_contenido, v.tipo_archivo, v.texto, v.archivo_url
+FROM (VALUES
 (1,  'texto',   NULL,    'Hola Bob, ¿cómo estás?',                  NULL),
 (2,  'texto',   NULL,    'Bien, Alice. ¿Y tú?',                     NULL),
 (3,  'archivo', 'pdf',   NULL,    'https://example.com/files/informe.pdf'),
@@ -117,4 +120,6 @@ INSERT INTO contenido (mensaje_id, tipo_contenido, tipo_archivo, texto,
 (7,  'texto',   NULL,    'Reunión de familia el sábado.',           NULL),
 (8,  'texto',   NULL,    'Plan de trabajo actualizado.',           NULL),
 (9,  'texto',   NULL,    'Evento de código este viernes.',         NULL),
-(10, 'texto',   NULL,    'Vamos al partido este domingo.',          NULL);
+(10, 'texto',   NULL,    'Vamos al partido este domingo.',          NULL)
+) AS v (mensaje_id, tipo_contenido, tipo_archivo, texto, archivo_url)
+JOIN mensaje m ON m.id = v.mensaje_id;
@@ -0,0 +1,227 @@
+-- =======================
+-- Migración: mensaje y contenido sin particionar -> particionadas por mes
+-- =======================
+-- Para una base creada antes de particionar (mensaje y contenido como tablas
+-- normales, con PK id). init.sql solo corre con un volumen nuevo; esto lleva
+-- una base existente al mismo esquema de init.sql para esas dos tablas, sin
+-- perder datos ni ids.
+--
+-- Uso, con la app detenida (nadie debe escribir mensajes mientras corre):
+--
+--   psql -v ON_ERROR_STOP=1 --single-transaction -f database/migrar_particiones.sql
+--
+-- En una sola transacción: si algo falla no queda nada a medias.
+--
+-- - fecha_envio pasa de TIMESTAMP a TIMESTAMPTZ. Las fechas guardadas sin zona
+--   se leen en el TimeZone de la sesión, que debe ser el mismo con que las
+--   escribió NOW() (el del servidor, salvo que la app lo cambiara); si no lo
+--   es, hacer SET TimeZone antes de correr el script.
+-- - Los ids se conservan y las secuencias mensaje_id_seq / contenido_id_seq
+--   siguen siendo las mismas.
+-- - Un contenido sin mensaje (mensaje_id NULL o inexistente) no tiene fecha
+--   con la que elegir partición y no se copia.
+-- - Las miniaturas que quedaron 'procesando' vuelven a 'pendiente'.
+-- - reaccion.mensaje_id y reply_to_id dejan de tener FK (ver init.sql).
+-- - El resto del esquema no se toca.
+
+-- --------------------------------------------------
+-- 1. Las tablas actuales quedan aparte
+-- --------------------------------------------------
+ALTER TABLE contenido RENAME TO contenido_sin_particion;
+ALTER TABLE mensaje RENAME TO mensaje_sin_particion;
+
+-- Los nombres de índices (y de las PK) son únicos en el esquema: se liberan para
+-- las tablas nuevas. Las tablas viejas solo se leen una vez, en orden físico.
+DO $$
+DECLARE
+    objeto TEXT;
+BEGIN
+    FOR objeto IN
+        SELECT indexrelid::regclass::text FROM pg_index
+         WHERE indrelid IN ('mensaje_sin_particion'::regclass, 'contenido_sin_particion'::regclass)
+           AND NOT indisprimary
+    LOOP
+        EXECUTE 'DROP INDEX ' || objeto;
+    END LOOP;
+END;
+$$;
+ALTER TABLE mensaje_sin_particion RENAME CONSTRAINT mensaje_pkey TO mensaje_sin_particion_pkey;
+ALTER TABLE contenido_sin_particion RENAME CONSTRAINT contenido_pkey TO contenido_sin_particion_pkey;
+
+-- --------------------------------------------------
+-- 2. Tablas particionadas (como en init.sql; índices, FK y triggers después de copiar)
+-- --------------------------------------------------
+CREATE TABLE mensaje (
+    id             INT NOT NULL DEFAULT nextval('mensaje_id_seq'),
+    emisor_id      INT REFERENCES usuario(id) ON DELETE SET NULL,
+    receptor_id    INT REFERENCES usuario(id) ON DELETE SET NULL,
+    grupo_id       INT REFERENCES grupo(id) ON DELETE CASCADE,
+    fecha_envio    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    estado_envio   VARCHAR(20) DEFAULT 'enviado',
+    estado_lectura VARCHAR(20) DEFAULT 'no_leído',
+    reply_to_id    INT,
+    PRIMARY KEY (id, fecha_envio)
+) PARTITION BY RANGE (fecha_envio);
+ALTER SEQUENCE mensaje_id_seq OWNED BY mensaje.id;
+
+CREATE TABLE contenido (
+    id             INT NOT NULL DEFAULT nextval('contenido_id_seq'),
+    mensaje_id     INT,
+    fecha_envio    TIMESTAMPTZ NOT NULL,
+    tipo_contenido VARCHAR(20) NOT NULL,
+    tipo_archivo   VARCHAR(100),
+    texto          TEXT,
+    archivo_url    TEXT,
+    archivo_hash   CHAR(64),
+    archivo_tamano BIGINT,
+    miniatura_estado VARCHAR(20),
+    miniatura_hash   CHAR(64),
+    miniatura_url    TEXT,
+    miniatura_reclamada TIMESTAMP,
+    texto_busqueda tsvector,
+    PRIMARY KEY (id, fecha_envio)
+) PARTITION BY RANGE (fecha_envio);
+ALTER SEQUENCE contenido_id_seq OWNED BY contenido.id;
+
+-- --------------------------------------------------
+-- 3. Funciones de particiones (iguales a init.sql)
+-- --------------------------------------------------
+CREATE OR REPLACE FUNCTION crear_particiones(desde DATE, hasta DATE) RETURNS int AS $$
+DECLARE
+    mes     DATE := date_trunc('month', desde);
+    tabla   TEXT;
+    creadas INT := 0;
+BEGIN
+    -- Varios workers pueden llamarla a la vez
+    PERFORM pg_advisory_xact_lock(hashtext('particiones_mensaje'));
+    WHILE mes <= hasta LOOP
+        FOREACH tabla IN ARRAY ARRAY['mensaje', 'contenido'] LOOP
+            IF to_regclass(tabla || '_' || to_char(mes, 'YYYY_MM')) IS NULL THEN
+                -- Límites en UTC y con zona explícita: no dependen del TimeZone de la sesión
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               tabla || '_' || to_char(mes, 'YYYY_MM'), tabla,
+                               mes::timestamp AT TIME ZONE 'UTC', (mes + interval '1 month') AT TIME ZONE 'UTC');
+                creadas := creadas + 1;
+            END IF;
+        END LOOP;
+        mes := mes + interval '1 month';
+    END LOOP;
+    RETURN creadas;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE SCHEMA IF NOT EXISTS archivo;
+CREATE TABLE IF NOT EXISTS archivo.reaccion (LIKE reaccion);
+
+CREATE OR REPLACE FUNCTION archivar_particiones(antes DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    mes     TEXT;
+    tabla   TEXT;
+    objeto  TEXT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('particiones_mensaje'));
+    FOR mes IN
+        SELECT right(c.relname, 7)
+          FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = 'mensaje'::regclass
+           AND c.relname ~ '^mensaje_[0-9]{4}_[0-9]{2}$'
+           AND to_date(right(c.relname, 7), 'YYYY_MM') + interval '1 month' <= date_trunc('month', antes)
+         ORDER BY 1
+    LOOP
+        EXECUTE format('INSERT INTO archivo.reaccion SELECT r.* FROM reaccion r JOIN %I m ON m.id = r.mensaje_id',
+                       'mensaje_' || mes);
+        EXECUTE format('DELETE FROM reaccion r USING %I m WHERE m.id = r.mensaje_id', 'mensaje_' || mes);
+
+        -- contenido primero: su FK hacia mensaje impediría separar la partición de mensaje.
+        -- Separada, la tabla conserva una copia de esa FK que también hay que quitar.
+        EXECUTE format('ALTER TABLE contenido DETACH PARTITION %I', 'contenido_' || mes);
+        FOR objeto IN
+            SELECT conname FROM pg_constraint
+             WHERE conrelid = ('contenido_' || mes)::regclass AND contype = 'f'
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', 'contenido_' || mes, objeto);
+        END LOOP;
+        EXECUTE format('ALTER TABLE mensaje DETACH PARTITION %I', 'mensaje_' || mes);
+
+        FOREACH tabla IN ARRAY ARRAY['mensaje_' || mes, 'contenido_' || mes] LOOP
+            FOR objeto IN
+                SELECT indexrelid::regclass::text FROM pg_index
+                 WHERE indrelid = tabla::regclass AND NOT indisprimary
+            LOOP
+                EXECUTE 'DROP INDEX ' || objeto;
+            END LOOP;
+            EXECUTE format('ALTER TABLE %I SET SCHEMA archivo', tabla);
+        END LOOP;
+        RETURN NEXT mes;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Desde el mes del mensaje más antiguo hasta tres meses por delante
+SELECT crear_particiones(
+    CAST(coalesce(min(fecha_envio::timestamptz), now()) AT TIME ZONE 'UTC' AS date),
+    CAST((now() AT TIME ZONE 'UTC') + interval '3 months' AS date)
+) FROM mensaje_sin_particion;
+
+-- --------------------------------------------------
+-- 4. Copia de los datos (sin triggers: conversacion_estado y texto_busqueda ya
+--    están calculados para estas filas)
+-- --------------------------------------------------
+INSERT INTO mensaje (id, emisor_id, receptor_id, grupo_id, fecha_envio, estado_envio, estado_lectura, reply_to_id)
+SELECT id, emisor_id, receptor_id, grupo_id, coalesce(fecha_envio::timestamptz, now()),
+       estado_envio, estado_lectura, reply_to_id
+  FROM mensaje_sin_particion;
+
+INSERT INTO contenido (id, mensaje_id, fecha_envio, tipo_contenido, tipo_archivo, texto, archivo_url,
+                       archivo_hash, archivo_tamano, miniatura_estado, miniatura_hash, miniatura_url,
+                       texto_busqueda)
+SELECT c.id, c.mensaje_id, m.fecha_envio, c.tipo_contenido, c.tipo_archivo, c.texto, c.archivo_url,
+       c.archivo_hash, c.archivo_tamano,
+       CASE WHEN c.miniatura_estado = 'procesando' THEN 'pendiente' ELSE c.miniatura_estado END,
+       c.miniatura_hash, c.miniatura_url, c.texto_busqueda
+  FROM contenido_sin_particion c
+  JOIN mensaje m ON m.id = c.mensaje_id;
+
+-- --------------------------------------------------
+-- 5. Índices, FK y triggers (como en init.sql)
+-- --------------------------------------------------
+CREATE INDEX idx_mensaje_grupo_fecha ON mensaje (grupo_id, fecha_envio, id);
+CREATE INDEX idx_mensaje_chat_fecha ON mensaje (emisor_id, receptor_id, fecha_envio, id);
+CREATE INDEX idx_mensaje_receptor_fecha ON mensaje (receptor_id, fecha_envio, id);
+CREATE INDEX idx_mensaje_directo_no_leido ON mensaje (receptor_id, emisor_id, fecha_envio)
+    WHERE estado_lectura <> 'leído' AND receptor_id IS NOT NULL;
+
+ALTER TABLE contenido ADD FOREIGN KEY (mensaje_id, fecha_envio)
+    REFERENCES mensaje (id, fecha_envio) ON DELETE CASCADE;
+CREATE INDEX idx_contenido_mensaje ON contenido (mensaje_id);
+CREATE INDEX idx_contenido_miniatura_cola ON contenido (id) WHERE miniatura_estado IN ('pendiente', 'procesando');
+CREATE INDEX idx_contenido_busqueda ON contenido USING gin (texto_busqueda);
+
+CREATE OR REPLACE FUNCTION contenido_busqueda() RETURNS trigger AS $$
+BEGIN
+    SELECT to_tsvector('spanish', coalesce(NEW.texto, '')) || array_to_tsvector(array_remove(
+               ARRAY['u:' || m.emisor_id, 'u:' || m.receptor_id, 'g:' || m.grupo_id], NULL))
+      INTO NEW.texto_busqueda
+      FROM mensaje m
+     WHERE m.id = NEW.mensaje_id AND m.fecha_envio = NEW.fecha_envio;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_contenido_busqueda
+    BEFORE INSERT OR UPDATE OF texto, mensaje_id ON contenido
+    FOR EACH ROW EXECUTE FUNCTION contenido_busqueda();
+
+CREATE TRIGGER trg_conversacion_estado_envio
+    AFTER INSERT ON mensaje
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION conversacion_estado_envio();
+
+-- --------------------------------------------------
+-- 6. Fuera las tablas viejas; CASCADE quita las FK que aún las referencian
+--    (reaccion.mensaje_id)
+-- --------------------------------------------------
+DROP TABLE contenido_sin_particion, mensaje_sin_particion CASCADE;
+
+ANALYZE mensaje;
+ANALYZE contenido;